@@ -0,0 +1,397 @@
+"""
+animation_funcs.py
+
+This module contains the animation of fractal canopies: generators of frames
+that interpolate the parameters of `fractal_canopy` between two canopy
+configurations, e.g. from the player's canopy to the target, or from nothing
+to a whole canopy growing one generation after another.
+
+Every parameter with a numeric value is interpolated, as are the root and leaf
+colors of the gradient the canopy is colored with and the number of iterations,
+which may be fractional: a canopy at 7.4 iterations has the branches of 7 and
+the generation after them grown to 40% of their length. The number of
+splits cannot be interpolated and must be the same at both ends.
+
+Frames are generated one at a time and all of them are computed into the same
+preallocated segment table, so memory use does not depend on the number of
+frames and a frame does not allocate arrays the size of the canopy. The table
+of a frame is overwritten by the next one; copy it to keep it. The random
+variation of a randomized canopy depends only on its seed and its shape, so it
+is computed once per animation and scaled by the jitter of every frame.
+
+Classes:
+    CanopyFrame
+        One frame of a canopy animation.
+
+Functions:
+    ease_in_out()
+        Eases an animation in and out.
+    interpolate_params()
+        Interpolates between two sets of canopy parameters.
+    canopy_variation()
+        Returns the path keys and random variation of the branches of a randomized canopy.
+    fill_canopy_segments()
+        Computes the segment table of a canopy into a preallocated array.
+    morph_frames()
+        Yields the frames of an animation between two canopy configurations.
+    growth_frames()
+        Yields the frames of a canopy growing from nothing.
+"""
+
+import math
+from typing import Callable, Iterator
+
+import numpy as np
+
+from fractal_funcs import (root_key, child_keys, branch_uniforms, SEGMENT_FIELDS,
+                           X0, Y0, X1, Y1, ANGLE, LENGTH, WIDTH, DEPTH, KEY)
+from color_funcs import interpolate_colors, gradient_palette, hex_to_rgb_array, rgb_to_hex_array
+
+# Parameters of fill_canopy_segments() taken from the interpolated parameters
+GEOMETRY_PARAMS = ("x", "y", "off_angle", "angle_delta", "start_angle", "n_iters", "length_ratio",
+                   "init_length", "width", "width_ratio")
+# Parameters of the random variation of a canopy, see fractal_funcs.grow_canopy
+VARIATION_PARAMS = ("angle_jitter", "length_jitter", "width_jitter", "branch_drop")
+# Parameters of fractal_canopy() that are interpolated, with their defaults
+MORPH_DEFAULTS = {
+    "off_angle": 0.0,
+    "angle_delta": 10.0,
+    "start_angle": -90.0,
+    "n_iters": 3,
+    "length_ratio": 0.75,
+    "init_length": 200.0,
+    "width": 1.0,
+    "width_ratio": 0.75,
+    "wave_amp": 0.0,
+    "angle_jitter": 0.0,
+    "length_jitter": 0.0,
+    "width_jitter": 0.0,
+    "branch_drop": 0.0,
+}
+
+
+class CanopyFrame:
+    """
+    One frame of a canopy animation.
+
+    Attributes:
+        index (int): The number of the frame, from 0.
+        t (float): The position of the frame in the animation, from 0 to 1, before easing.
+        params (dict): The interpolated parameters of the canopy, with a fractional n_iters.
+        segments (np.ndarray): The segment table of the frame. It is overwritten by the next frame.
+        n_iters (int): The number of iterations to color the branches with, see `fractal_funcs.depth_colors`.
+        color (list): The colors of the branches, one per iteration.
+        wave_amp (float): The amplitude of the sine wave segments.
+    """
+
+    __slots__ = ("index", "t", "params", "segments", "n_iters", "color", "wave_amp")
+
+    def __init__(self, index: int, t: float, params: dict, segments: np.ndarray, n_iters: int, color: list,
+                 wave_amp: float):
+        self.index = index
+        self.t = t
+        self.params = params
+        self.segments = segments
+        self.n_iters = n_iters
+        self.color = color
+        self.wave_amp = wave_amp
+
+
+def ease_in_out(t: float) -> float:
+    """Eases an animation in and out: slow at both ends and fastest halfway (smoothstep)."""
+    return t * t * (3 - 2 * t)
+
+
+def _gradient_ends(params: dict) -> tuple[str, str]:
+    """Returns the root and leaf colors of a parameter set with a "gradient" pair or a "color"."""
+    if "gradient" in params:
+        return tuple(params["gradient"])
+    color = params.get("color", "#000000")
+    if isinstance(color, str):
+        return color, color
+    return str(color[0]), str(color[-1])
+
+
+def interpolate_params(start: dict, end: dict, t: float) -> dict:
+    """
+    Interpolates between two sets of canopy parameters.
+
+    Args:
+        start (dict): The parameters at t = 0: keyword arguments of `fractal_canopy`, with the colors
+            given as a "gradient" [root, leaf] pair of hex colors, or as a "color" (one hex color or one per
+            iteration, of which the first and last are taken).
+        end (dict): The parameters at t = 1, in the same form. Parameters missing from one
+            side have their `fractal_canopy` default there, except the position of the canopy,
+            which is taken from the other side.
+        t (float): The position between them, from 0 to 1.
+
+    Returns:
+        dict: The parameters at t, with a possibly fractional "n_iters" and a "gradient" pair.
+
+    Raises:
+        ValueError: If the two sets have different numbers of splits.
+    """
+    if start.get("n_splits", 2) != end.get("n_splits", 2):
+        raise ValueError(f"Cannot interpolate between {start.get('n_splits', 2)} and "
+                         f"{end.get('n_splits', 2)} splits")
+    params = {**start, **end}
+    for name in ("x", "y"):
+        if name in params:
+            first, last = start.get(name, end.get(name)), end.get(name, start.get(name))
+            params[name] = first + (last - first) * t
+    for name, default in MORPH_DEFAULTS.items():
+        if name in params:
+            first, last = start.get(name, default), end.get(name, default)
+            params[name] = first + (last - first) * t
+    params.pop("color", None)
+    # Both ends of the gradient at once, truncated like helper_funcs.interpolate_color
+    colors = interpolate_colors(hex_to_rgb_array(_gradient_ends(start)), hex_to_rgb_array(_gradient_ends(end)), [t])
+    params["gradient"] = rgb_to_hex_array(np.trunc(colors)).tolist()
+    return params
+
+
+def _max_rows(n_splits: int, n_iters: float) -> int:
+    """Returns the number of rows of a canopy with up to `n_iters` iterations."""
+    n_generations = max(math.ceil(n_iters) - 1, 0)
+    if n_splits < 1:
+        n_generations = min(n_generations, 1)
+    return sum(n_splits ** depth for depth in range(n_generations))
+
+
+def canopy_variation(n_splits: int, n_iters: float, seed: int | np.random.Generator | None = 0) -> np.ndarray:
+    """
+    Returns the path keys and random variation of the branches of a randomized canopy.
+
+    They depend only on the seed and the shape of the tree, not on the jitter, so an animation
+    computes them once and `fill_canopy_segments` scales them by the jitter of every frame.
+
+    Args:
+        n_splits (int): The number of branches to split into at each iteration.
+        n_iters (float): The largest number of iterations, possibly fractional.
+        seed (int or np.random.Generator, optional): The seed of the canopy, see `canopy_segments`.
+            Defaults to 0.
+
+    Returns:
+        np.ndarray: One row per branch of the whole canopy, in the order of `canopy_segments`:
+            the path key, then the angle, length, width and drop variation, in [-1, 1).
+    """
+    n_rows = _max_rows(n_splits, n_iters)
+    variation = np.zeros((n_rows, 5))
+    if not n_rows:
+        return variation
+    variation[0, 0] = root_key(seed)
+    start, size = 0, 1
+    while start + size < n_rows:
+        keys = child_keys(variation[start:start + size, 0], n_splits)
+        children = variation[start + size:start + size + len(keys)]
+        children[:, 0] = keys
+        # The same numbers as grow_canopy draws for these branches
+        children[:, 1:] = branch_uniforms(keys) * 2 - 1
+        start, size = start + size, len(keys)
+    return variation
+
+
+def fill_canopy_segments(
+    out: np.ndarray,
+    scratch: np.ndarray,
+    x: float,
+    y: float,
+    off_angle: float = 0,
+    angle_delta: float = 10,
+    start_angle: float = -90,
+    n_splits: int = 2,
+    n_iters: float = 3,
+    length_ratio: float = 0.75,
+    init_length: float = 200,
+    width: float = 1,
+    width_ratio: float = 0.75,
+    angle_jitter: float = 0.0,
+    length_jitter: float = 0.0,
+    width_jitter: float = 0.0,
+    branch_drop: float = 0.0,
+    variation: np.ndarray | None = None,
+    work: np.ndarray | None = None,
+) -> int:
+    """
+    Computes the segment table of a canopy into a preallocated array.
+
+    The rows are the same as from `canopy_segments`, up to rounding, and every generation is
+    computed with array operations writing into `out` and `scratch`, so nothing the size of the
+    canopy is allocated, except a mask of the kept branches when branches are dropped. With a
+    fractional `n_iters`, the last generation is grown by its fractional part: at 7.4 iterations,
+    the branches of the 8th are 40% of their length.
+
+    A randomized canopy takes the variation of its branches from `variation`. With `branch_drop`,
+    the whole canopy is computed into `work` and the branches that are kept are copied into `out`.
+
+    Args:
+        out (np.ndarray): The array of shape (n, len(SEGMENT_FIELDS)) in which to compute the rows.
+            It must have room for the canopy.
+        scratch (np.ndarray): An array of shape (2, m), where m is at least the number of
+            branches of the largest generation.
+        x, y, off_angle, angle_delta, start_angle, n_splits, length_ratio, init_length, width,
+            width_ratio: As for `canopy_segments`.
+        n_iters (float, optional): The number of iterations, possibly fractional. Defaults to 3.
+        angle_jitter, length_jitter, width_jitter, branch_drop: The random variation of the
+            branches, see `canopy_segments`. Default to 0, which gives no variation.
+        variation (np.ndarray, optional): The variation of the branches of a randomized canopy,
+            from `canopy_variation` with at least `n_iters` iterations. Defaults to None.
+        work (np.ndarray, optional): An array like `out` into which a canopy with `branch_drop`
+            is computed before the dropped branches are left out. Defaults to None.
+
+    Returns:
+        int: The number of rows computed, from the start of `out`.
+
+    Raises:
+        ValueError: If the canopy is randomized without a `variation`, or drops branches without `work`.
+    """
+    randomized = bool(angle_jitter or length_jitter or width_jitter or branch_drop)
+    if randomized and variation is None:
+        raise ValueError("A randomized canopy needs the variation of its branches, see canopy_variation()")
+    if branch_drop and work is None:
+        raise ValueError("A canopy with dropped branches needs a work array")
+    n_generations = max(math.ceil(n_iters) - 1, 0)
+    if n_splits < 1:
+        n_generations = min(n_generations, 1)
+    if not n_generations:
+        return 0
+    table = work if branch_drop else out
+    split_angles = off_angle + np.linspace(-angle_delta / 2, angle_delta / 2, n_splits)
+    start_angle_rad = math.radians(start_angle)
+    table[0] = (x, y, x + math.cos(start_angle_rad) * init_length, y + math.sin(start_angle_rad) * init_length,
+                start_angle, init_length, width, 0, variation[0, 0] if randomized else 0)
+    if branch_drop:
+        kept = np.empty(_max_rows(n_splits, n_generations + 1), dtype=bool)
+        kept[0] = True
+    parents = table[0:1]
+    row, length, branch_width = 1, init_length, width
+    for depth in range(1, n_generations):
+        size = len(parents) * n_splits
+        children = table[row:row + size]
+        radians, offsets = scratch[0, :size], scratch[1, :size]
+        length *= length_ratio
+        branch_width *= width_ratio
+        # Every branch splits into n_splits children starting at its end point
+        children[:, X0].reshape(-1, n_splits)[:] = parents[:, X1, np.newaxis]
+        children[:, Y0].reshape(-1, n_splits)[:] = parents[:, Y1, np.newaxis]
+        np.add(parents[:, ANGLE, np.newaxis], split_angles, out=children[:, ANGLE].reshape(-1, n_splits))
+        children[:, DEPTH] = depth
+        if randomized:
+            jitter = variation[row:row + size]
+            children[:, KEY] = jitter[:, 0]
+            children[:, ANGLE] += np.multiply(jitter[:, 1], angle_jitter, out=radians)
+            # Lengths and widths vary from those of the parent, as in grow_canopy
+            for column, ratio, amount, stream in ((LENGTH, length_ratio, length_jitter, 2),
+                                                  (WIDTH, width_ratio, width_jitter, 3)):
+                children[:, column].reshape(-1, n_splits)[:] = parents[:, column, np.newaxis]
+                children[:, column] *= ratio
+                np.multiply(jitter[:, stream], amount, out=offsets)
+                children[:, column] *= np.add(offsets, 1, out=offsets)
+            if branch_drop:
+                # A branch is kept if its parent is and its own number is above the drop probability
+                np.add(jitter[:, 4], 1, out=offsets)
+                np.greater_equal(np.divide(offsets, 2, out=offsets), branch_drop, out=kept[row:row + size])
+                kept[row:row + size].reshape(-1, n_splits)[:] &= kept[row - len(parents):row, np.newaxis]
+        else:
+            children[:, LENGTH] = length
+            children[:, WIDTH] = branch_width
+            children[:, KEY] = 0
+        np.radians(children[:, ANGLE], out=radians)
+        np.multiply(np.cos(radians, out=offsets), children[:, LENGTH], out=offsets)
+        np.add(children[:, X0], offsets, out=children[:, X1])
+        np.multiply(np.sin(radians, out=offsets), children[:, LENGTH], out=offsets)
+        np.add(children[:, Y0], offsets, out=children[:, Y1])
+        parents = children
+        row += size
+    if branch_drop:
+        # Leave out the dropped branches, keeping the order of the rows
+        rows = row
+        row = int(np.count_nonzero(kept[:rows]))
+        np.compress(kept[:rows], table[:rows], axis=0, out=out[:row])
+    _grow_last_generation(out[:row], n_iters)
+    return row
+
+
+def _grow_last_generation(segments: np.ndarray, n_iters: float) -> None:
+    """Shortens the branches of the last generation of a table to the fractional part of `n_iters`, in place."""
+    grown = n_iters - math.floor(n_iters)
+    if not grown or not len(segments):
+        return
+    # Rows are ordered generation by generation, so the last one is at the end, unless it was
+    # left out entirely (all its branches were dropped, or a canopy without splits stops at the trunk)
+    last = segments[np.searchsorted(segments[:, DEPTH], math.ceil(n_iters) - 2):]
+    for start, end in ((X0, X1), (Y0, Y1)):
+        np.subtract(last[:, end], last[:, start], out=last[:, end])
+        last[:, end] *= grown
+        last[:, end] += last[:, start]
+    last[:, LENGTH] *= grown
+
+
+def morph_frames(
+    start: dict,
+    end: dict,
+    n_frames: int,
+    easing: Callable[[float], float] = ease_in_out,
+) -> Iterator[CanopyFrame]:
+    """
+    Yields the frames of an animation between two canopy configurations, one at a time.
+
+    All frames are computed into one segment table, allocated for the largest canopy of the
+    animation, so memory use is the same for any number of frames. A randomized canopy (with any
+    jitter or branch drop) has the same seed (0 unless given) at every frame, so that its branches
+    keep their random variation: it is computed once, see `canopy_variation`, and scaled by the
+    jitter of each frame.
+
+    Args:
+        start (dict): The parameters of the first frame, see `interpolate_params`.
+        end (dict): The parameters of the last frame.
+        n_frames (int): The number of frames, including the first and the last.
+        easing (Callable, optional): Maps the position in the animation, from 0 to 1, to the
+            interpolation position. Defaults to `ease_in_out`.
+
+    Yields:
+        CanopyFrame: The frames, whose segment table is overwritten by the next frame.
+
+    Raises:
+        ValueError: If the two configurations have different numbers of splits.
+    """
+    n_splits = end.get("n_splits", start.get("n_splits", 2))
+    n_iters = max(start.get("n_iters", MORPH_DEFAULTS["n_iters"]), end.get("n_iters", MORPH_DEFAULTS["n_iters"]))
+    table = np.zeros((_max_rows(n_splits, n_iters), len(SEGMENT_FIELDS)))
+    scratch = np.empty((2, n_splits ** max(math.ceil(n_iters) - 2, 0)))
+    variation, work = None, None
+    if any(start.get(name) or end.get(name) for name in VARIATION_PARAMS):
+        # The same seed at every frame, so that the branches keep their variation
+        variation = canopy_variation(n_splits, n_iters, {**start, **end}.get("seed", 0))
+    if start.get("branch_drop") or end.get("branch_drop"):
+        work = np.zeros_like(table)
+    for index in range(n_frames):
+        t = index / (n_frames - 1) if n_frames > 1 else 1.0
+        params = interpolate_params(start, end, easing(t))
+        geometry = {"x": 0.0, "y": 0.0, **{name: params[name] for name in GEOMETRY_PARAMS if name in params}}
+        jitter = {name: params[name] for name in VARIATION_PARAMS if params.get(name)}
+        rows = fill_canopy_segments(table, scratch, n_splits=n_splits, variation=variation, work=work,
+                                    **geometry, **jitter)
+        color_iters = max(math.ceil(params.get("n_iters", 3)), 1)
+        yield CanopyFrame(index, t, params, table[:rows], color_iters,
+                          gradient_palette(*params["gradient"], max(color_iters - 1, 2)).tolist(),
+                          params.get("wave_amp", 0))
+
+
+def growth_frames(
+    params: dict,
+    n_frames: int,
+    easing: Callable[[float], float] = ease_in_out,
+) -> Iterator[CanopyFrame]:
+    """
+    Yields the frames of a canopy growing from nothing, one generation after another.
+
+    Args:
+        params (dict): The parameters of the grown canopy, see `interpolate_params`.
+        n_frames (int): The number of frames, including the empty first one and the grown last one.
+        easing (Callable, optional): See `morph_frames`. Defaults to `ease_in_out`.
+
+    Yields:
+        CanopyFrame: The frames, whose segment table is overwritten by the next frame.
+    """
+    yield from morph_frames({**params, "n_iters": 1}, params, n_frames, easing)
@@ -0,0 +1,400 @@
+"""
+This script benchmarks canopy generation and drawing, sine wave segments,
+gradients, zooming, branch picking, animation frames, L-system curves and
+loading stored geometry, and reports the results as JSON.
+
+Every benchmark case is run a few times; the best wall time is reported,
+together with the number of branches per second, the peak memory allocated
+during one run, the peak resident set size of the process and the number of
+canvas items. With a baseline file from an earlier run, every case is
+compared with its baseline and the script exits with status 1 if any case
+got slower by more than the tolerance.
+
+The drawing cases need a canvas. On a machine with a display (or under a
+virtual framebuffer, e.g. `xvfb-run python benchmark.py --canvas tk`) a
+real Tkinter canvas is used; otherwise a `canvas_funcs.RecordingCanvas` is
+used, which measures the cost of everything but Tk itself. With `--record`
+it also records the drawn items, and every case reports a hash of them, so
+a change that alters the output is reported like a slowdown. With
+`--profile` every case is run once more with the instrumentation of
+`profile_funcs` on, and its phase times and counters are added to the
+results; `--trace` saves the trace of these runs.
+
+Usage examples:
+    python benchmark.py --quick
+    python benchmark.py -o baseline.json
+    python benchmark.py --baseline baseline.json --tolerance 0.2
+"""
+
+import argparse
+import atexit
+import functools
+import gc
+import itertools
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+import profile_funcs
+from animation_funcs import morph_frames
+from canvas_funcs import RecordingCanvas
+from fractal_funcs import canopy_segments, fractal_canopy, rasterize_canopy_segments
+from helper_funcs import draw_sine_wave_segment, generate_gradient
+from lsystem_funcs import lsystem_segments, PRESETS
+from color_funcs import gradient_palette
+from raster_funcs import encode_png
+from spatial_funcs import SegmentGrid
+from store_funcs import GeometryStore
+from gui import zoom
+from gui.canopy_view import draw_lod_canopy
+
+# Cases with more branches than this are skipped
+MAX_BRANCHES = 200_000
+
+
+def _tk_canvas_factory() -> Callable[[], object]:
+    """Returns a function creating Tkinter canvases whose `after` callbacks run on `flush`."""
+    import tkinter as tk
+
+    root = tk.Tk()
+    root.withdraw()
+
+    class FlushingCanvas(tk.Canvas):
+        def __init__(self):
+            super().__init__(root, width=800, height=600)
+            self._callbacks = {}
+            self.items_scaled = 0
+
+        def after(self, ms, func=None, *args):
+            callback_id = f"after#{len(self._callbacks)}#{id(func)}"
+            self._callbacks[callback_id] = (func, args)
+            return callback_id
+
+        def after_cancel(self, callback_id):
+            self._callbacks.pop(callback_id, None)
+
+        def scale(self, tag, *args):
+            self.items_scaled += len(self.find_withtag(tag))
+            super().scale(tag, *args)
+
+        def flush(self):
+            while self._callbacks:
+                callbacks, self._callbacks = self._callbacks, {}
+                for func, args in callbacks.values():
+                    func(*args)
+            self.update_idletasks()
+
+        def item_count(self):
+            return len(self.find_all())
+
+    return FlushingCanvas
+
+
+def _n_branches(n_splits: int, n_iters: int) -> int:
+    return sum(n_splits ** depth for depth in range(max(n_iters - 1, 0)))
+
+
+def _peak_rss_kb() -> int | None:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def bench_fractal_canopy(new_canvas, fake: bool, n_splits: int, n_iters: int, wave_amp: float, backend: str):
+    """Generates and draws one canopy. Returns the canvas, or None if nothing was drawn on one."""
+    params = dict(off_angle=5, angle_delta=60, n_splits=n_splits, n_iters=n_iters,
+                  length_ratio=0.7, init_length=150, wave_amp=wave_amp, width=6)
+    if backend == "raster" and fake:
+        # Everything the raster backend does except creating the Tk image
+        segments = canopy_segments(400, 580, **{k: v for k, v in params.items() if k != "wave_amp"})
+        encode_png(rasterize_canopy_segments(segments, n_iters, 800, 600, wave_amp=wave_amp))
+        return None
+    canvas = new_canvas()
+    fractal_canopy(canvas, 400, 580, backend=backend, **params)
+    return canvas
+
+
+def bench_canopy_segments(new_canvas, fake: bool, n_splits: int, n_iters: int, instancing: bool):
+    """Generates the segment table of one canopy, without drawing it."""
+    canopy_segments(400, 580, off_angle=5, angle_delta=60, n_splits=n_splits, n_iters=n_iters,
+                    length_ratio=0.7, init_length=150, width=6, instancing=instancing)
+    return None
+
+
+def bench_sine_wave(new_canvas, fake: bool, wave_amp: float, length: float, count: int = 200):
+    """Draws `count` sine wave segments of the given length."""
+    canvas = new_canvas()
+    angles = np.linspace(0, 2 * np.pi, count, endpoint=False)
+    for angle in angles.tolist():
+        end_x, end_y = 400 + np.cos(angle) * length, 300 + np.sin(angle) * length
+        draw_sine_wave_segment(canvas, 400, 300, end_x, end_y, length, wave_amp, "#000000", width=2)
+    return canvas
+
+
+def bench_gradient(new_canvas, fake: bool, steps: int, cached: bool):
+    """Generates a gradient, with the palette cache cleared first unless `cached`."""
+    if not cached:
+        gradient_palette.cache_clear()
+    generate_gradient("#8b4513", "#228b22", steps)
+    return None
+
+
+@functools.lru_cache(maxsize=4)
+def _picking_canopy(n_iters: int) -> np.ndarray:
+    return canopy_segments(400, 580, angle_delta=60, n_splits=2, n_iters=n_iters, length_ratio=0.75,
+                           init_length=150, width=4)
+
+
+def bench_segment_grid(new_canvas, fake: bool, n_iters: int, queries: int):
+    """Indexes the branches of a canopy, then finds the branch nearest to `queries` points within 6 units."""
+    grid = SegmentGrid.from_segments(_picking_canopy(n_iters))
+    points = np.random.default_rng(0).uniform((100, 100), (700, 580), (queries, 2))
+    for x, y in points.tolist():
+        grid.nearest(x, y, 6.0)
+    return None
+
+
+@functools.lru_cache(maxsize=None)
+def _picking_store(n_iters: int) -> GeometryStore:
+    store = GeometryStore(tempfile.mkdtemp(prefix="benchmark_store_"))
+    atexit.register(shutil.rmtree, store.directory, True)
+    store.put({"n_iters": n_iters}, {"segments": _picking_canopy(n_iters)})
+    return store
+
+
+def bench_geometry_store(new_canvas, fake: bool, n_iters: int):
+    """Opens a canopy stored in a geometry store and reads every branch of it, instead of generating it."""
+    _picking_store(n_iters).get({"n_iters": n_iters}).segments.sum()
+    return None
+
+
+def bench_morph_frames(new_canvas, fake: bool, n_iters: int, frames: int = 30):
+    """Generates the frames of a transition between two canopies, without drawing them."""
+    params = dict(x=400, y=580, n_splits=2, n_iters=n_iters, length_ratio=0.7, init_length=150, width=6)
+    for _ in morph_frames(dict(params, angle_delta=20), dict(params, angle_delta=120, off_angle=15), frames):
+        pass
+    return None
+
+
+def bench_lsystem(new_canvas, fake: bool, preset: str, n_iters: int):
+    """Expands an L-system preset and computes the segment table of its curve, without drawing it."""
+    lsystem_segments(PRESETS[preset], n_iters, 400, 580)
+    return None
+
+
+def bench_zoom(new_canvas, fake: bool, n_iters: int, view: str, events: int = 20):
+    """Zooms in on a canopy drawn as plain items or through a CanopyView, one redraw every two wheel events."""
+    canvas = new_canvas()
+    params = dict(angle_delta=60, n_splits=2, n_iters=n_iters, length_ratio=0.75, init_length=150, width=4)
+    if view == "items":
+        fractal_canopy(canvas, 400, 580, **params)
+    else:
+        draw_lod_canopy(canvas, 400, 580, min_pixels=1.0, **params)
+    canvas.flush()
+
+    class Event:
+        widget = canvas
+        x, y, delta = 400, 300, 120
+
+    for event in range(events):
+        zoom.zoom(Event)
+        if event % 2:
+            canvas.flush()
+    canvas.flush()
+    return canvas
+
+
+def benchmark_cases(quick: bool, max_branches: int) -> list[tuple[str, Callable, dict, int]]:
+    """Returns the (name, function, params, branches) of every case of the sweep."""
+    cases = []
+    for n_splits, n_iters, wave_amp, backend in itertools.product(
+            (2, 3, 4), (6, 8) if quick else (6, 8, 10, 12), (0, 5), ("canvas", "raster")):
+        branches = _n_branches(n_splits, n_iters)
+        if branches <= max_branches:
+            cases.append(("fractal_canopy", bench_fractal_canopy,
+                          dict(n_splits=n_splits, n_iters=n_iters, wave_amp=wave_amp, backend=backend),
+                          branches))
+    for n_splits, n_iters, instancing in itertools.product(
+            (2, 4), (10, 14) if quick else (10, 14, 18), (False, True)):
+        branches = _n_branches(n_splits, n_iters)
+        if branches <= max_branches:
+            cases.append(("canopy_segments", bench_canopy_segments,
+                          dict(n_splits=n_splits, n_iters=n_iters, instancing=instancing), branches))
+    for wave_amp, length in itertools.product((2, 10), (50, 400)):
+        cases.append(("draw_sine_wave_segment", bench_sine_wave,
+                      dict(wave_amp=wave_amp, length=length), 200))
+    for steps, cached in itertools.product((10, 100, 1000), (False, True)):
+        cases.append(("generate_gradient", bench_gradient, dict(steps=steps, cached=cached), 0))
+    for n_iters, queries in itertools.product((10, 14) if quick else (10, 14, 17), (0, 1000)):
+        cases.append(("segment_grid", bench_segment_grid, dict(n_iters=n_iters, queries=queries),
+                      _n_branches(2, n_iters)))
+    for n_iters in (10, 14) if quick else (10, 14, 17):
+        cases.append(("geometry_store", bench_geometry_store, dict(n_iters=n_iters), _n_branches(2, n_iters)))
+    for n_iters in (10, 14) if quick else (10, 14, 17):
+        cases.append(("morph_frames", bench_morph_frames, dict(n_iters=n_iters), 30 * _n_branches(2, n_iters)))
+    # With the number of segments each curve draws
+    for preset, n_iters, segments in (("koch", 6, 4 ** 6), ("dragon", 12, 2 ** 12), ("hilbert", 6, 4 ** 6 - 1)) + (
+            () if quick else (("koch", 10, 4 ** 10), ("dragon", 20, 2 ** 20), ("hilbert", 10, 4 ** 10 - 1))):
+        cases.append(("lsystem", bench_lsystem, dict(preset=preset, n_iters=n_iters), segments))
+    for n_iters, view in itertools.product((8, 10) if quick else (8, 10, 12), ("items", "lod")):
+        cases.append(("zoom", bench_zoom, dict(n_iters=n_iters, view=view), _n_branches(2, n_iters)))
+    return cases
+
+
+def run_case(function: Callable, params: dict, new_canvas, fake: bool, repeats: int, memory: bool,
+             profile: bool = False) -> dict:
+    """Runs one case `repeats` times and returns its measurements."""
+    times = []
+    counts = {}
+    for _ in range(repeats):
+        gc.collect()
+        start = time.perf_counter()
+        canvas = function(new_canvas, fake, **params)
+        times.append(time.perf_counter() - start)
+        if canvas is not None:
+            counts = {"items": canvas.item_count(), "items_scaled": canvas.items_scaled}
+            if isinstance(canvas, RecordingCanvas):
+                counts["draw_calls"] = canvas.call_count()
+                if canvas.record:
+                    counts["digest"] = canvas.digest()
+            if not fake:
+                canvas.destroy()
+    result = {"seconds": min(times), "mean_seconds": sum(times) / len(times), "repeats": repeats, **counts}
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        canvas = function(new_canvas, fake, **params)
+        result["peak_alloc_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        if canvas is not None and not fake:
+            canvas.destroy()
+    if profile:
+        # A separate run, so that the instrumentation does not add to the times
+        profile_funcs.reset()
+        profile_funcs.enable()
+        canvas = function(new_canvas, fake, **params)
+        profile_funcs.enable(False)
+        result["profile"] = profile_funcs.stats()
+        if canvas is not None and not fake:
+            canvas.destroy()
+    result["peak_rss_kb"] = _peak_rss_kb()
+    return result
+
+
+def case_key(result: dict) -> str:
+    """Returns the identifier of a case, used to match it with the baseline."""
+    return result["case"] + json.dumps(result["params"], sort_keys=True)
+
+
+def compare(results: list[dict], baseline: dict, tolerance: float) -> list[dict]:
+    """
+    Adds the ratio of every result's time to its baseline time, and returns the regressions:
+    the results more than `tolerance` slower than their baseline, and the results whose
+    drawing hash differs from that of their baseline.
+    """
+    baseline_results = {case_key(result): result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        reference = baseline_results.get(case_key(result))
+        if not reference:
+            continue
+        result["baseline_ratio"] = result["seconds"] / reference["seconds"]
+        if "digest" in result and "digest" in reference:
+            result["output_changed"] = result["digest"] != reference["digest"]
+        if result["baseline_ratio"] > 1 + tolerance or result.get("output_changed"):
+            regressions.append(result)
+    return regressions
+
+
+def parse_args(argv: list | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark canopy generation, drawing and zooming.")
+    parser.add_argument("-o", "--output", help="write the JSON results to this file instead of stdout")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="relative slowdown reported as a regression (default: 0.25)")
+    parser.add_argument("--canvas", choices=("auto", "tk", "fake"), default="auto",
+                        help="canvas used by the drawing cases (default: tk if a display is available)")
+    parser.add_argument("--repeats", type=int, default=3, help="runs per case (default: 3)")
+    parser.add_argument("--quick", action="store_true", help="run a smaller sweep")
+    parser.add_argument("--max-branches", type=int, default=MAX_BRANCHES,
+                        help=f"skip canopies with more branches (default: {MAX_BRANCHES})")
+    parser.add_argument("--filter", default="", help="only run the cases whose name contains this text")
+    parser.add_argument("--no-memory", dest="memory", action="store_false",
+                        help="do not measure the peak allocated memory of every case")
+    parser.add_argument("--record", action="store_true",
+                        help="record the items drawn on the fake canvas and report a hash of every drawing")
+    parser.add_argument("--profile", action="store_true",
+                        help="add the phase times and counters of an instrumented run of every case")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="save the Chrome trace of the instrumented runs (implies --profile)")
+    return parser.parse_args(argv)
+
+
+def main(argv: list | None = None) -> int:
+    args = parse_args(argv)
+    use_tk = args.canvas == "tk" or (args.canvas == "auto" and os.environ.get("DISPLAY"))
+    new_canvas = _tk_canvas_factory() if use_tk else functools.partial(RecordingCanvas, record=args.record)
+
+    results = []
+    trace = []
+    for name, function, params, branches in benchmark_cases(args.quick, args.max_branches):
+        if args.filter not in name:
+            continue
+        result = {"case": name, "params": params, "branches": branches,
+                  **run_case(function, params, new_canvas, not use_tk, args.repeats, args.memory,
+                           args.profile or bool(args.trace))}
+        if branches:
+            result["branches_per_sec"] = branches / result["seconds"]
+        results.append(result)
+        if args.trace:
+            # Every case resets the instrumentation, so its trace is collected right away
+            trace.extend(profile_funcs.trace_events())
+        print(f"{name:24} {json.dumps(params):70} {result['seconds'] * 1000:10.2f} ms",
+              file=sys.stderr, flush=True)
+
+    report = {
+        "meta": {"python": platform.python_version(), "numpy": np.__version__,
+                 "platform": platform.platform(), "canvas": "tk" if use_tk else "fake",
+                 "repeats": args.repeats, "time": time.strftime("%Y-%m-%dT%H:%M:%S")},
+        "results": results,
+    }
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        report["regressions"] = [case_key(result) for result in regressions]
+        for result in regressions:
+            changed = " and a different drawing" if result.get("output_changed") else ""
+            print(f"REGRESSION {case_key(result)}: {result['baseline_ratio']:.2f}x the baseline time{changed}",
+                  file=sys.stderr)
+
+    if args.trace:
+        with open(args.trace, "w", encoding="utf-8") as file:
+            json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, file)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(text + "\n")
+    else:
+        print(text)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,239 @@
+"""
+cache_funcs.py
+
+This module contains a cache of generated fractal canopy geometry, so that
+moving a slider back and forth over the same values does not regenerate the
+same trees again and again.
+
+Entries are keyed on the normalized geometry parameters of `canopy_segments`.
+Colors and the wave amplitude only change how the segments are drawn, not the
+segments themselves, so trees differing only in those share an entry.
+The number of iterations is not part of the key either: since the segment
+table is ordered generation by generation, the table of a shallower tree is a
+prefix of the table of a deeper one, and a deeper tree is grown from the
+leaves of a shallower one instead of from scratch.
+
+Classes:
+    CanopyCache
+        A least-recently-used cache of canopy segment tables with a memory budget.
+
+Functions:
+    cached_canopy_segments()
+        Returns the segment table of a fractal canopy from the default cache.
+"""
+
+from collections import OrderedDict
+import threading
+import numpy as np
+
+from fractal_funcs import canopy_segments, grow_canopy, DEPTH
+import profile_funcs
+
+# Parameters of canopy_segments() that the geometry depends on, except n_iters
+GEOMETRY_DEFAULTS = {
+    "x": 0.0,
+    "y": 0.0,
+    "off_angle": 0,
+    "angle_delta": 10,
+    "start_angle": -90,
+    "n_splits": 2,
+    "length_ratio": 0.75,
+    "init_length": 200,
+    "width": 1,
+    "width_ratio": 0.75,
+    "angle_jitter": 0.0,
+    "length_jitter": 0.0,
+    "width_jitter": 0.0,
+    "branch_drop": 0.0,
+    "seed": None,
+}
+# Parameters of grow_canopy() used to extend a cached table
+GROWTH_PARAMS = ("off_angle", "angle_delta", "n_splits", "length_ratio", "width_ratio",
+                 "angle_jitter", "length_jitter", "width_jitter", "branch_drop")
+DEFAULT_MAX_BYTES = 256 * 2 ** 20
+
+
+def _level_rows(table: np.ndarray, n_iters: int) -> int:
+    """Returns the number of rows of a canopy table that belong to a canopy with `n_iters` iterations."""
+    # Rows are ordered by depth, and the deepest branches of n_iters iterations have depth n_iters - 2
+    return int(np.searchsorted(table[:, DEPTH], n_iters - 1))
+
+
+class CanopyCache:
+    """
+    A least-recently-used cache of canopy segment tables with a memory budget.
+
+    Every entry holds the deepest table generated so far for one set of geometry
+    parameters. Requests for fewer iterations are answered with a read-only view of
+    its first rows; requests for more iterations extend it by growing its leaves.
+    When the entries take up more than `max_bytes`, the least recently used ones
+    are evicted. The cache may be shared between threads: tables are generated
+    without holding its lock, and when two threads generate the same tree, the
+    deeper table is kept.
+
+    Attributes:
+        max_bytes (int): The memory budget of the cached tables, in bytes.
+        hits (int): The number of requests answered from the cache.
+        extensions (int): The number of requests answered by extending a cached table.
+        misses (int): The number of requests that generated a new table.
+        evictions (int): The number of tables evicted to stay within the budget.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.extensions = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[tuple, tuple[int, np.ndarray]] = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def key(**params) -> tuple:
+        """
+        Returns the normalized cache key of a set of `canopy_segments` parameters.
+        Floats are rounded so that values reached through different slider paths match.
+        Randomized canopies are only cached by integer seed.
+        """
+        geometry = {**GEOMETRY_DEFAULTS,
+                    **{name: value for name, value in params.items() if name in GEOMETRY_DEFAULTS}}
+        return tuple(value if value is None
+                     else int(value) if name in ("n_splits", "seed")
+                     else round(float(value), 9)
+                     for name, value in sorted(geometry.items()))
+
+    @staticmethod
+    def cacheable(**params) -> bool:
+        """
+        Tells whether a canopy can be cached: randomized canopies only can with an integer seed,
+        since without one they are meant to be different every time.
+        """
+        seed = params.get("seed")
+        if seed is None:
+            return not any(params.get(name) for name in
+                           ("angle_jitter", "length_jitter", "width_jitter", "branch_drop"))
+        return isinstance(seed, (int, np.integer))
+
+    @property
+    def nbytes(self) -> int:
+        """The memory used by the cached tables, in bytes."""
+        return self._nbytes
+
+    @property
+    def stats(self) -> dict:
+        """The counters of the cache, with the number of entries and the memory they use."""
+        return {"hits": self.hits, "extensions": self.extensions, "misses": self.misses,
+                "evictions": self.evictions, "entries": len(self._entries), "nbytes": self._nbytes}
+
+    def clear(self) -> None:
+        """Removes all entries from the cache. The counters are kept."""
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+
+    def segments(self, n_iters: int = 3, **params) -> np.ndarray:
+        """
+        Returns the segment table of a fractal canopy, generating it only if needed.
+
+        Args:
+            n_iters (int, optional): The number of iterations. Defaults to 3.
+            **params: The other keyword arguments of `fractal_funcs.canopy_segments`
+                that describe the geometry (culling options are not supported).
+
+        Returns:
+            np.ndarray: The read-only segment table, as from `canopy_segments`.
+        """
+        if not self.cacheable(**params):
+            with self._lock:
+                self.misses += 1
+            profile_funcs.count("cache_misses")
+            return canopy_segments(n_iters=n_iters,
+                                   **{**GEOMETRY_DEFAULTS,
+                                      **{name: value for name, value in params.items()
+                                         if name in GEOMETRY_DEFAULTS}})
+        key = self.key(**params)
+        n_splits = int(params.get("n_splits", GEOMETRY_DEFAULTS["n_splits"]))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] >= n_iters:
+                self.hits += 1
+                profile_funcs.count("cache_hits")
+                self._entries.move_to_end(key)
+                return entry[1][:_level_rows(entry[1], n_iters)]
+            extend = entry is not None and entry[0] > 1 and n_splits > 0
+            if extend:
+                self.extensions += 1
+            else:
+                self.misses += 1
+
+        # Generate without holding the lock, so that other threads (e.g. the Tk event loop
+        # while a worker thread extends a deep tree) are not blocked by a long generation
+        if extend:
+            profile_funcs.count("cache_extensions")
+            cached_iters, cached = entry
+            # The leaves of the cached tree are its last rows
+            leaves = cached[_level_rows(cached, cached_iters - 1):]
+            grown, _ = grow_canopy(leaves, n_iters=n_iters,
+                                   **{name: params[name] for name in GROWTH_PARAMS if name in params})
+            table = np.concatenate((cached, grown))
+        else:
+            profile_funcs.count("cache_misses")
+            table = canopy_segments(n_iters=n_iters,
+                                    **{**GEOMETRY_DEFAULTS,
+                                       **{name: value for name, value in params.items()
+                                          if name in GEOMETRY_DEFAULTS}})
+        table.setflags(write=False)
+
+        with self._lock:
+            # Another thread may have stored the same tree meanwhile: keep the deeper table
+            current = self._entries.get(key)
+            if current is not None and current[0] >= n_iters:
+                self._entries.move_to_end(key)
+                return current[1][:_level_rows(current[1], n_iters)]
+            self._store(key, n_iters, table)
+        return table
+
+    def insert(self, table: np.ndarray, n_iters: int = 3, **params) -> None:
+        """
+        Adds a segment table generated elsewhere, e.g. read from a `store_funcs.GeometryStore`,
+        as the entry of its parameters, unless the cache already holds as many iterations.
+
+        Args:
+            table (np.ndarray): The segment table, as from `canopy_segments`; it is made read-only.
+            n_iters (int, optional): The number of iterations of the table. Defaults to 3.
+            **params: The geometry parameters of the table, as for `segments`.
+        """
+        if not self.cacheable(**params):
+            return
+        with self._lock:
+            key = self.key(**params)
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < n_iters:
+                table.setflags(write=False)
+                self._store(key, n_iters, table)
+
+    def _store(self, key: tuple, n_iters: int, table: np.ndarray) -> None:
+        """Stores a table under a key, evicting the least recently used entries if needed."""
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._nbytes -= previous[1].nbytes
+        if table.nbytes > self.max_bytes:
+            return
+        self._entries[key] = (n_iters, table)
+        self._nbytes += table.nbytes
+        while self._nbytes > self.max_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._nbytes -= evicted.nbytes
+            self.evictions += 1
+
+
+default_cache = CanopyCache()
+
+
+def cached_canopy_segments(n_iters: int = 3, **params) -> np.ndarray:
+    """
+    Returns the segment table of a fractal canopy from the default cache.
+    See `CanopyCache.segments`.
+    """
+    return default_cache.segments(n_iters=n_iters, **params)
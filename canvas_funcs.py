@@ -0,0 +1,430 @@
+"""
+canvas_funcs.py
+
+This module contains the drawing-backend protocol of the drawing functions,
+and a recording canvas that implements it without Tkinter or a display.
+
+The drawing functions (`fractal_funcs.fractal_canopy`, `helper_funcs.draw_sine_wave_segment`,
+`sandbox.draw_squares`, `gui.canopy_view.CanopyView`, ...) only use the canvas through the
+few methods listed in `DrawingBackend`, so anything that has them can stand in for a
+`tk.Canvas`. `RecordingCanvas` keeps every item it is asked to create in preallocated
+arrays that grow by doubling: the item types, tags, widths and fill colors, and the
+coordinates of all items in one flat buffer. That is enough to count the draw calls,
+hash the drawing to check that a change left the output alone, and export it.
+
+With `record=False` the canvas only keeps count: the items still get ids and tags,
+so deleting, moving and counting them works, but their coordinates and styles are
+not stored. Drawing on it measures the cost of generating the drawing without Tk.
+
+Classes:
+    DrawingBackend
+        The canvas methods the drawing functions use.
+    RecordingCanvas
+        A canvas that records the items drawn on it in arrays, with no display.
+"""
+
+import hashlib
+from collections import Counter
+from types import SimpleNamespace
+from typing import Callable, Protocol, runtime_checkable
+
+import numpy as np
+
+# The item types a RecordingCanvas records, indexed by their code in RecordingCanvas.types
+ITEM_TYPES = ("line", "rectangle", "image")
+LINE, RECTANGLE, IMAGE = range(len(ITEM_TYPES))
+
+# Number of items and of coordinates a RecordingCanvas has room for before it grows
+INITIAL_CAPACITY = 1024
+
+
+@runtime_checkable
+class DrawingBackend(Protocol):
+    """
+    The canvas methods the drawing functions use. A `tk.Canvas` implements them,
+    and so does a RecordingCanvas. The methods take the same arguments as those of `tk.Canvas`.
+    """
+
+    def create_line(self, *args, **options) -> int: ...
+
+    def create_rectangle(self, *args, **options) -> int: ...
+
+    def create_image(self, *args, **options) -> int: ...
+
+    def coords(self, item, *args): ...
+
+    def itemconfigure(self, item, **options): ...
+
+    def delete(self, *items) -> None: ...
+
+    def move(self, item, dx: float, dy: float) -> None: ...
+
+    def scale(self, item, x_origin: float, y_origin: float, x_scale: float, y_scale: float) -> None: ...
+
+    def canvasx(self, screen_x: float) -> float: ...
+
+    def canvasy(self, screen_y: float) -> float: ...
+
+    def cget(self, option: str): ...
+
+
+def _grown(array: np.ndarray, size: int, fill=0) -> np.ndarray:
+    """Returns a copy of the array with room for `size` entries, the new ones set to `fill`."""
+    grown = np.full(size, fill, dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+def _flat_coordinates(args: tuple) -> np.ndarray:
+    """Returns the coordinates passed to a create or coords call as a flat float array."""
+    values = args[0] if len(args) == 1 else args
+    coordinates = np.asarray(values, dtype=float).ravel()
+    if len(coordinates) % 2:
+        raise ValueError(f"Expected an even number of coordinates, got {len(coordinates)}")
+    return coordinates
+
+
+class RecordingCanvas:
+    """
+    A canvas that records the items drawn on it in arrays, with no display.
+
+    Item ids start at 1 and are never reused, like those of a Tkinter canvas; the
+    item with id i is entry i - 1 of the arrays. Items accept the `tags`, `width` and
+    `fill` options; other options are ignored. Tags in `move`, `scale`, `delete`,
+    `itemconfigure` and `find_withtag` may be combined with "&&" and negated with "!",
+    e.g. "all&&!view". Callbacks scheduled with `after` run when `flush` is called,
+    and those bound to "<Destroy>" when `destroy` is called.
+
+    Attributes:
+        width (int): The width of the canvas, as given by `cget("width")` and `winfo_width`.
+        height (int): The height of the canvas.
+        record (bool): Whether the coordinates and styles of the items are recorded.
+        calls (Counter): The number of calls of every drawing method, by name.
+        items_scaled (int): The total number of items moved or scaled by `move` and `scale`.
+        types (np.ndarray): The ITEM_TYPES code of every item.
+        alive (np.ndarray): Whether every item is still on the canvas.
+        widths (np.ndarray): The line width of every item.
+        bindings (dict): The callbacks bound to every event sequence with `bind`.
+    """
+
+    def __init__(self, width: int = 800, height: int = 600, record: bool = True,
+                 capacity: int = INITIAL_CAPACITY):
+        self.width = width
+        self.height = height
+        self.record = record
+        self.calls = Counter()
+        self.items_scaled = 0
+        self.bindings = {}
+        self._n_items = 0
+        self.types = np.zeros(capacity, dtype=np.uint8)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.widths = np.zeros(capacity)
+        self._tag_sets = np.zeros(capacity, dtype=np.int32)
+        self._fills = np.zeros(capacity, dtype=np.int32)
+        self._coord_starts = np.zeros(capacity, dtype=np.int64)
+        self._coord_counts = np.zeros(capacity, dtype=np.int64)
+        # The coordinates of all items; x at even and y at odd positions, since every item
+        # starts at an even position. Ranges left behind by `coords` have no owner (-1).
+        self._coords = np.zeros(capacity * 4)
+        self._coord_owners = np.full(capacity * 4, -1, dtype=np.int64)
+        self._coord_end = 0
+        # Tag sets and colors are interned, so that items only hold their index
+        self._tag_table = [frozenset()]
+        self._tag_index = {frozenset(): 0}
+        self._color_table = [""]
+        self._color_index = {"": 0}
+        self._scroll = [0.0, 0.0]
+        self._scan_mark = (0.0, 0.0, 0.0, 0.0)
+        self._callbacks = {}
+        self._last_callback = 0
+
+    # Creating items
+
+    def _intern_tags(self, tags) -> int:
+        tags = frozenset((tags,) if isinstance(tags, str) else tags or ())
+        if tags not in self._tag_index:
+            self._tag_index[tags] = len(self._tag_table)
+            self._tag_table.append(tags)
+        return self._tag_index[tags]
+
+    def _intern_color(self, color: str) -> int:
+        if color not in self._color_index:
+            self._color_index[color] = len(self._color_table)
+            self._color_table.append(color)
+        return self._color_index[color]
+
+    def _create(self, item_type: int, args: tuple, options: dict) -> int:
+        index = self._n_items
+        if index == len(self.types):
+            size = 2 * len(self.types)
+            self.types = _grown(self.types, size)
+            self.alive = _grown(self.alive, size)
+            self.widths = _grown(self.widths, size)
+            self._tag_sets = _grown(self._tag_sets, size)
+            self._fills = _grown(self._fills, size)
+            self._coord_starts = _grown(self._coord_starts, size)
+            self._coord_counts = _grown(self._coord_counts, size)
+        self._n_items += 1
+        self.types[index] = item_type
+        self.alive[index] = True
+        self._tag_sets[index] = self._intern_tags(options.get("tags"))
+        if self.record:
+            self.widths[index] = float(options.get("width", 1.0))
+            self._fills[index] = self._intern_color(options.get("fill", ""))
+            self._store_coordinates(index, _flat_coordinates(args))
+        return index + 1
+
+    def create_line(self, *args, **options) -> int:
+        self.calls["create_line"] += 1
+        return self._create(LINE, args, options)
+
+    def create_rectangle(self, *args, **options) -> int:
+        self.calls["create_rectangle"] += 1
+        return self._create(RECTANGLE, args, options)
+
+    def create_image(self, *args, **options) -> int:
+        self.calls["create_image"] += 1
+        return self._create(IMAGE, args, options)
+
+    # Coordinates
+
+    def _store_coordinates(self, index: int, coordinates: np.ndarray) -> None:
+        start, count = self._coord_starts[index], self._coord_counts[index]
+        if count != len(coordinates):
+            self._coord_owners[start:start + count] = -1
+            start = self._allocate(len(coordinates))
+            self._coord_owners[start:start + len(coordinates)] = index
+            self._coord_starts[index] = start
+            self._coord_counts[index] = len(coordinates)
+        self._coords[start:start + len(coordinates)] = coordinates
+
+    def _live_slots(self) -> np.ndarray:
+        """Returns the positions of the coordinates of the items still on the canvas, item by item."""
+        owners = self._coord_owners[:self._coord_end]
+        slots = np.flatnonzero(owners >= 0)
+        slots = slots[self.alive[owners[slots]]]
+        return slots[np.argsort(owners[slots], kind="stable")]
+
+    def _allocate(self, count: int) -> int:
+        """Returns the start of room for `count` coordinates at the end of the buffer, compacting or growing it."""
+        if self._coord_end + count > len(self._coords):
+            slots = self._live_slots()
+            # Compact the buffer if it is mostly stale, otherwise double it
+            size = len(self._coords)
+            while len(slots) + count > size // 2:
+                size *= 2
+            coords, owners = self._coords[slots], self._coord_owners[slots]
+            self._coords = np.zeros(size)
+            self._coord_owners = np.full(size, -1, dtype=np.int64)
+            self._coords[:len(slots)] = coords
+            self._coord_owners[:len(slots)] = owners
+            items = np.unique(owners)
+            self._coord_starts[items] = np.searchsorted(owners, items)
+            self._coord_end = len(slots)
+        start = self._coord_end
+        self._coord_end += count
+        return start
+
+    def coords(self, item, *args):
+        """Sets the coordinates of an item, or returns them as a list if none are given."""
+        self.calls["coords"] += 1
+        matches = np.flatnonzero(self._match(item))
+        if not len(matches) or not self.record:
+            return [] if not args else None
+        index = int(matches[0])
+        if not args:
+            start = self._coord_starts[index]
+            return self._coords[start:start + self._coord_counts[index]].tolist()
+        self._store_coordinates(index, _flat_coordinates(args))
+
+    def _transform(self, item, x_scale: float, y_scale: float, dx: float, dy: float) -> None:
+        matched = self._match(item)
+        self.items_scaled += int(matched.sum())
+        if self.record and matched.any():
+            owners = self._coord_owners[:self._coord_end]
+            slots = np.flatnonzero(owners >= 0)
+            slots = slots[matched[owners[slots]]]
+            x_slots, y_slots = slots[slots % 2 == 0], slots[slots % 2 == 1]
+            self._coords[x_slots] = self._coords[x_slots] * x_scale + dx
+            self._coords[y_slots] = self._coords[y_slots] * y_scale + dy
+
+    def move(self, item, dx: float, dy: float) -> None:
+        self.calls["move"] += 1
+        self._transform(item, 1.0, 1.0, dx, dy)
+
+    def scale(self, item, x_origin: float, y_origin: float, x_scale: float, y_scale: float) -> None:
+        self.calls["scale"] += 1
+        self._transform(item, x_scale, y_scale, x_origin * (1 - x_scale), y_origin * (1 - y_scale))
+
+    # Items
+
+    def _match(self, item) -> np.ndarray:
+        """Returns a mask of the items on the canvas that have the given id or match the tag expression."""
+        alive = self.alive[:self._n_items]
+        if not isinstance(item, str):
+            matched = np.zeros(self._n_items, dtype=bool)
+            if 1 <= item <= self._n_items:
+                matched[item - 1] = alive[item - 1]
+            return matched
+        matched = alive.copy()
+        for term in item.split("&&"):
+            negated = term.startswith("!")
+            tag = term[1:] if negated else term
+            if tag == "all":
+                has_tag = np.ones(self._n_items, dtype=bool)
+            else:
+                in_set = np.array([tag in tags for tags in self._tag_table])
+                has_tag = in_set[self._tag_sets[:self._n_items]]
+            matched &= ~has_tag if negated else has_tag
+        return matched
+
+    def delete(self, *items) -> None:
+        self.calls["delete"] += 1
+        ids = [item for item in items if not isinstance(item, str)]
+        if ids:
+            indices = np.asarray(ids, dtype=np.int64) - 1
+            self.alive[indices[(indices >= 0) & (indices < self._n_items)]] = False
+        for tag in (item for item in items if isinstance(item, str)):
+            self.alive[:self._n_items] &= ~self._match(tag)
+
+    def itemconfigure(self, item, **options) -> None:
+        self.calls["itemconfigure"] += 1
+        matched = self._match(item)
+        if "tags" in options:
+            self._tag_sets[:self._n_items][matched] = self._intern_tags(options["tags"])
+        if self.record and "width" in options:
+            self.widths[:self._n_items][matched] = float(options["width"])
+        if self.record and "fill" in options:
+            self._fills[:self._n_items][matched] = self._intern_color(options["fill"])
+
+    itemconfig = itemconfigure
+
+    def itemcget(self, item, option: str):
+        """Returns the "width", "fill" or "tags" option of an item."""
+        index = int(np.flatnonzero(self._match(item))[0])
+        if option == "tags":
+            return " ".join(sorted(self._tag_table[self._tag_sets[index]]))
+        if option == "width":
+            return self.widths[index]
+        if option == "fill":
+            return self._color_table[self._fills[index]]
+        raise ValueError(f"Unknown item option {option!r}")
+
+    def type(self, item) -> str | None:
+        matches = np.flatnonzero(self._match(item))
+        return ITEM_TYPES[self.types[matches[0]]] if len(matches) else None
+
+    def find_all(self) -> tuple:
+        return tuple((np.flatnonzero(self.alive[:self._n_items]) + 1).tolist())
+
+    def find_withtag(self, item) -> tuple:
+        return tuple((np.flatnonzero(self._match(item)) + 1).tolist())
+
+    def item_count(self) -> int:
+        """Returns the number of items on the canvas."""
+        return int(self.alive[:self._n_items].sum())
+
+    # The view and the widget
+
+    def canvasx(self, screen_x: float) -> float:
+        return screen_x + self._scroll[0]
+
+    def canvasy(self, screen_y: float) -> float:
+        return screen_y + self._scroll[1]
+
+    def scan_mark(self, x: float, y: float) -> None:
+        self._scan_mark = (x, y, *self._scroll)
+
+    def scan_dragto(self, x: float, y: float, gain: float = 10) -> None:
+        mark_x, mark_y, scroll_x, scroll_y = self._scan_mark
+        self._scroll = [scroll_x - (x - mark_x) * gain, scroll_y - (y - mark_y) * gain]
+
+    def cget(self, option: str):
+        if option == "width":
+            return str(self.width)
+        if option == "height":
+            return str(self.height)
+        raise ValueError(f"Unknown canvas option {option!r}")
+
+    def winfo_width(self) -> int:
+        return self.width
+
+    def winfo_height(self) -> int:
+        return self.height
+
+    def bind(self, sequence: str, func: Callable, add: str | None = None) -> None:
+        self.bindings[sequence] = self.bindings.get(sequence, []) + [func] if add else [func]
+
+    def after(self, ms: int, func: Callable, *args) -> str:
+        self._last_callback += 1
+        callback_id = f"after#{self._last_callback}"
+        self._callbacks[callback_id] = (func, args)
+        return callback_id
+
+    def after_cancel(self, callback_id: str) -> None:
+        self._callbacks.pop(callback_id, None)
+
+    def flush(self) -> None:
+        """Runs the callbacks scheduled with `after`, including those they schedule, until none are left."""
+        while self._callbacks:
+            callbacks, self._callbacks = self._callbacks, {}
+            for func, args in callbacks.values():
+                func(*args)
+
+    def destroy(self) -> None:
+        for func in self.bindings.pop("<Destroy>", []):
+            func(SimpleNamespace(widget=self))
+        self._callbacks.clear()
+        self.delete("all")
+
+    # Results
+
+    def call_count(self, name: str | None = None) -> int:
+        """Returns the number of calls of one drawing method, or of all of them."""
+        return self.calls[name] if name else sum(self.calls.values())
+
+    def export(self) -> dict[str, np.ndarray]:
+        """
+        Returns the items on the canvas, in the order they were created.
+
+        Returns:
+            dict: The arrays "ids", "types" (ITEM_TYPES names), "widths", "fills", "tags"
+                (space-separated and sorted), "coords" (the coordinates of all items, one after
+                the other) and "coord_offsets" (item i has coords[coord_offsets[i]:coord_offsets[i + 1]]).
+        """
+        if not self.record:
+            raise RuntimeError("The canvas was created with record=False and has no items to export")
+        indices = np.flatnonzero(self.alive[:self._n_items])
+        counts = self._coord_counts[indices]
+        tag_names = np.array([" ".join(sorted(tags)) for tags in self._tag_table], dtype=str)
+        return {
+            "ids": indices + 1,
+            "types": np.array(ITEM_TYPES)[self.types[indices]],
+            "widths": self.widths[indices],
+            "fills": np.array(self._color_table, dtype=str)[self._fills[indices]],
+            "tags": tag_names[self._tag_sets[indices]],
+            "coords": self._coords[self._live_slots()],
+            "coord_offsets": np.concatenate(([0], np.cumsum(counts))),
+        }
+
+    def save(self, path: str) -> None:
+        """Saves the items on the canvas, as from `export`, to a .npz file."""
+        np.savez_compressed(path, **self.export())
+
+    def digest(self, decimals: int = 3) -> str:
+        """
+        Returns a hash of the items on the canvas, to compare drawings.
+
+        Two drawings have the same digest if they have the same items in the same order, with
+        the same types, tags, widths, colors and coordinates rounded to `decimals` decimals.
+        Item ids are not hashed, so redrawing the same picture gives the same digest.
+        """
+        items = self.export()
+        sha = hashlib.sha256()
+        for name in ("types", "fills", "tags"):
+            sha.update("\n".join(items[name].tolist()).encode())
+        for name in ("widths", "coords"):
+            # Adding 0.0 turns -0.0 into 0.0
+            sha.update((np.round(items[name], decimals) + 0.0).tobytes())
+        sha.update(items["coord_offsets"].astype(np.int64).tobytes())
+        return sha.hexdigest()
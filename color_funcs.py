@@ -0,0 +1,245 @@
+"""
+color_funcs.py
+
+This module contains vectorized color functions: conversions of whole arrays
+of colors between hex strings, RGB, HSV and OKLab, and gradients between two
+colors interpolated in any of these spaces.
+
+Gradients are used as lookup tables: `gradient_palette` returns the colors of
+a gradient as an array of hex strings, cached by (start, end, steps, space),
+so that moving the color sliders back and forth does not recompute them, and
+the color of every branch of a canopy is then a single array index.
+
+Wherever a hex color is expected, the common color names of `NAMED_COLORS`
+(e.g. "red" or "forest green") are accepted as well, as on a Tkinter canvas.
+
+Functions:
+    hex_to_rgb_array()
+        Converts hex color strings to an array of RGB values.
+    rgb_to_hex_array()
+        Converts an array of RGB values to hex color strings.
+    rgb_to_hsv()
+        Converts RGB values to HSV values.
+    hsv_to_rgb()
+        Converts HSV values to RGB values.
+    rgb_to_oklab()
+        Converts RGB values to the perceptual OKLab space.
+    oklab_to_rgb()
+        Converts OKLab values to RGB values.
+    interpolate_colors()
+        Interpolates between two RGB colors in a given color space.
+    gradient_palette()
+        Returns the colors of a gradient between two hex colors, cached.
+"""
+
+from functools import lru_cache
+import numpy as np
+
+# Color spaces in which gradients can be interpolated
+COLOR_SPACES = ("rgb", "linear", "hsv", "oklab")
+
+# Common Tk color names (case and spaces are ignored), with the values of Tk 8.6
+NAMED_COLORS = {
+    "black": "#000000", "white": "#ffffff", "red": "#ff0000", "green": "#008000",
+    "blue": "#0000ff", "yellow": "#ffff00", "cyan": "#00ffff", "magenta": "#ff00ff",
+    "gray": "#808080", "grey": "#808080", "silver": "#c0c0c0", "maroon": "#800000",
+    "purple": "#800080", "olive": "#808000", "navy": "#000080", "teal": "#008080",
+    "lime": "#00ff00", "aqua": "#00ffff", "fuchsia": "#ff00ff", "orange": "#ffa500",
+    "brown": "#a52a2a", "pink": "#ffc0cb", "gold": "#ffd700", "violet": "#ee82ee",
+    "indigo": "#4b0082", "darkgreen": "#006400", "darkblue": "#00008b", "darkred": "#8b0000",
+    "lightblue": "#add8e6", "lightgreen": "#90ee90", "lightgray": "#d3d3d3", "lightgrey": "#d3d3d3",
+    "darkgray": "#a9a9a9", "darkgrey": "#a9a9a9", "forestgreen": "#228b22", "seagreen": "#2e8b57",
+    "olivedrab": "#6b8e23", "skyblue": "#87ceeb", "steelblue": "#4682b4", "tan": "#d2b48c",
+    "beige": "#f5f5dc", "khaki": "#f0e68c", "coral": "#ff7f50", "salmon": "#fa8072",
+    "turquoise": "#40e0d0", "chocolate": "#d2691e", "sienna": "#a0522d", "saddlebrown": "#8b4513",
+    "crimson": "#dc143c",
+}
+
+_HEX_DIGITS = np.frombuffer(b"0123456789abcdef", dtype=np.uint8)
+# The value of every ASCII hex digit, and 255 for every other byte
+_HEX_VALUES = np.full(256, 255, dtype=np.uint8)
+_HEX_VALUES[np.frombuffer(b"0123456789", dtype=np.uint8)] = np.arange(10)
+_HEX_VALUES[np.frombuffer(b"abcdef", dtype=np.uint8)] = np.arange(10, 16)
+_HEX_VALUES[np.frombuffer(b"ABCDEF", dtype=np.uint8)] = np.arange(10, 16)
+
+# Linear sRGB to LMS cone responses, and cube-rooted LMS to OKLab (Björn Ottosson, 2020)
+_RGB_TO_LMS = np.array([[0.4122214708, 0.5363325363, 0.0514459929],
+                        [0.2119034982, 0.6806995451, 0.1073969566],
+                        [0.0883024619, 0.2817188376, 0.6299787005]])
+_LMS_TO_OKLAB = np.array([[0.2104542553, 0.7936177850, -0.0040720468],
+                          [1.9779984951, -2.4285922050, 0.4505937099],
+                          [0.0259040371, 0.7827717662, -0.8086757660]])
+
+
+def hex_to_rgb_array(colors: str | list | np.ndarray) -> np.ndarray:
+    """
+    Converts hex color strings to an array of RGB values.
+
+    Args:
+        colors (str, list or np.ndarray): One or more hex color strings (e.g., "#ff0000")
+            or names of `NAMED_COLORS` (e.g., "red").
+
+    Returns:
+        np.ndarray: A uint8 array of shape colors.shape + (3,).
+    """
+    colors = np.asarray(colors, dtype=str)
+    named = ~np.char.startswith(colors, "#")
+    if named.any():
+        # Names are looked up one by one; others are taken as hex digits without the "#"
+        colors = colors.astype(f"<U{max(colors.dtype.itemsize // 4, 7)}")
+        colors[named] = [NAMED_COLORS.get(name.replace(" ", "").lower(), name)
+                         for name in colors[named].tolist()]
+    codes = np.char.lstrip(colors, "#")
+    if codes.size and (np.char.str_len(codes) != 6).any():
+        raise ValueError("Colors must be hex colors with six digits, e.g. '#ff0000', "
+                         "or names of color_funcs.NAMED_COLORS, e.g. 'red'")
+    raw = np.frombuffer(codes.astype("S6").tobytes(), dtype=np.uint8).reshape(codes.shape + (6,))
+    digits = _HEX_VALUES[raw]
+    if (digits > 15).any():
+        raise ValueError("Hex colors may only contain the digits 0-9 and a-f")
+    return digits[..., 0::2] * 16 + digits[..., 1::2]
+
+
+def rgb_to_hex_array(rgb: np.ndarray) -> np.ndarray:
+    """
+    Converts an array of RGB values to hex color strings.
+
+    Args:
+        rgb (np.ndarray): An array of shape (..., 3) of values between 0 and 255.
+            Floats are rounded and clipped.
+
+    Returns:
+        np.ndarray: A string array of shape rgb.shape[:-1] (e.g., "#ff0000").
+    """
+    rgb = np.asarray(rgb)
+    if rgb.dtype != np.uint8:
+        rgb = np.clip(np.rint(rgb), 0, 255).astype(np.uint8)
+    chars = np.empty(rgb.shape[:-1] + (7,), dtype=np.uint8)
+    chars[..., 0] = ord("#")
+    chars[..., 1::2] = _HEX_DIGITS[rgb >> 4]
+    chars[..., 2::2] = _HEX_DIGITS[rgb & 15]
+    return np.ascontiguousarray(chars).view("S7")[..., 0].astype(str)
+
+
+def rgb_to_hsv(rgb: np.ndarray) -> np.ndarray:
+    """
+    Converts RGB values (0 to 255) to HSV values: hue in degrees, saturation and value from 0 to 1.
+    """
+    rgb = np.asarray(rgb, dtype=float) / 255
+    value = rgb.max(axis=-1)
+    chroma = value - rgb.min(axis=-1)
+    safe_chroma = np.where(chroma > 0, chroma, 1)
+    red, green, blue = np.moveaxis(rgb, -1, 0)
+    hue = np.select([value == red, value == green],
+                    [((green - blue) / safe_chroma) % 6, (blue - red) / safe_chroma + 2],
+                    (red - green) / safe_chroma + 4)
+    hue = np.where(chroma > 0, hue * 60, 0.0)
+    saturation = np.where(value > 0, chroma / np.where(value > 0, value, 1), 0.0)
+    return np.stack((hue, saturation, value), axis=-1)
+
+
+def hsv_to_rgb(hsv: np.ndarray) -> np.ndarray:
+    """
+    Converts HSV values (hue in degrees, saturation and value from 0 to 1) to RGB values (0 to 255).
+    """
+    hsv = np.asarray(hsv, dtype=float)
+    hue, saturation, value = np.moveaxis(hsv, -1, 0)
+    # Each channel follows the same piecewise linear curve, shifted around the color wheel
+    k = (np.array([5, 3, 1]) + (hue[..., np.newaxis] % 360) / 60) % 6
+    ramp = np.clip(np.minimum(k, 4 - k), 0, 1)
+    return (value[..., np.newaxis] * (1 - saturation[..., np.newaxis] * ramp)) * 255
+
+
+def _srgb_to_linear(rgb: np.ndarray) -> np.ndarray:
+    rgb = np.asarray(rgb, dtype=float) / 255
+    return np.where(rgb <= 0.04045, rgb / 12.92, ((rgb + 0.055) / 1.055) ** 2.4)
+
+
+def _linear_to_srgb(linear: np.ndarray) -> np.ndarray:
+    linear = np.clip(linear, 0, 1)
+    return np.where(linear <= 0.0031308, linear * 12.92, 1.055 * linear ** (1 / 2.4) - 0.055) * 255
+
+
+def rgb_to_oklab(rgb: np.ndarray) -> np.ndarray:
+    """
+    Converts RGB values (0 to 255) to the perceptual OKLab space, in which
+    equal distances look like equal color differences.
+    """
+    return np.cbrt(_srgb_to_linear(rgb) @ _RGB_TO_LMS.T) @ _LMS_TO_OKLAB.T
+
+
+def oklab_to_rgb(lab: np.ndarray) -> np.ndarray:
+    """Converts OKLab values to RGB values (0 to 255), clipped to the sRGB gamut."""
+    lms = (np.asarray(lab, dtype=float) @ np.linalg.inv(_LMS_TO_OKLAB).T) ** 3
+    return _linear_to_srgb(lms @ np.linalg.inv(_RGB_TO_LMS).T)
+
+
+def interpolate_colors(
+    start: np.ndarray,
+    end: np.ndarray,
+    factors: np.ndarray,
+    space: str = "rgb",
+) -> np.ndarray:
+    """
+    Interpolates between two RGB colors in a given color space.
+
+    Args:
+        start (np.ndarray): The starting RGB color (0 to 255).
+        end (np.ndarray): The ending RGB color (0 to 255).
+        factors (np.ndarray): The interpolation positions, between 0 and 1.
+        space (str, optional): One of COLOR_SPACES. "rgb" interpolates the sRGB values,
+            "linear" the light intensities, "hsv" goes around the color wheel the short way,
+            and "oklab" gives perceptually even steps. Defaults to "rgb".
+
+    Returns:
+        np.ndarray: A float array of shape (len(factors), 3) of RGB values (0 to 255).
+    """
+    start, end = np.asarray(start, dtype=float), np.asarray(end, dtype=float)
+    factors = np.asarray(factors, dtype=float)[:, np.newaxis]
+    if space == "rgb":
+        return start + (end - start) * factors
+    if space == "linear":
+        start, end = _srgb_to_linear(start), _srgb_to_linear(end)
+        return _linear_to_srgb(start + (end - start) * factors)
+    if space == "hsv":
+        start, end = rgb_to_hsv(start), rgb_to_hsv(end)
+        # Take the shorter way around the color wheel
+        end[0] = start[0] + (end[0] - start[0] + 180) % 360 - 180
+        return hsv_to_rgb(start + (end - start) * factors)
+    if space == "oklab":
+        start, end = rgb_to_oklab(start), rgb_to_oklab(end)
+        return oklab_to_rgb(start + (end - start) * factors)
+    raise ValueError(f"Unknown color space {space!r}, expected one of {COLOR_SPACES}")
+
+
+@lru_cache(maxsize=256)
+def gradient_palette(start: str, end: str, steps: int, space: str = "rgb") -> np.ndarray:
+    """
+    Returns the colors of a gradient between two hex colors. The result is cached.
+
+    In the "rgb" space the positions are step / (steps - 1) and the channels are computed
+    and truncated the way `helper_funcs.interpolate_color` does, so the palette is the same,
+    bit for bit, as the one `helper_funcs.generate_gradient` made one color at a time;
+    in the other spaces the channels are rounded.
+
+    Args:
+        start (str): The starting hex color string (e.g., "#ff0000").
+        end (str): The ending hex color string (e.g., "#0000ff").
+        steps (int): The number of colors.
+        space (str, optional): The space in which to interpolate, see `interpolate_colors`.
+            Defaults to "rgb".
+
+    Returns:
+        np.ndarray: A read-only array of `steps` hex color strings.
+
+    Raises:
+        ZeroDivisionError: If `steps` is 1, as from `generate_gradient`: a gradient has two ends.
+    """
+    if steps == 1:
+        raise ZeroDivisionError("A gradient needs at least 2 steps")
+    # Divided rather than from np.linspace, whose positions can differ in the last bit
+    factors = np.arange(steps) / (steps - 1)
+    rgb = interpolate_colors(hex_to_rgb_array(start), hex_to_rgb_array(end), factors, space)
+    palette = rgb_to_hex_array(np.trunc(rgb) if space == "rgb" else rgb)
+    palette.setflags(write=False)
+    return palette
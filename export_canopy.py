@@ -0,0 +1,365 @@
+"""
+This script renders fractal canopies to files without a display.
+
+The parameters of `fractal_canopy` are read from the command line, or
+from a JSON file (one object or a list of objects) or a JSONL file
+(one object per line) describing many canopies. Every canopy is written
+as a PNG image, an SVG drawing or an NPZ archive of its segment table.
+Jobs are read, rendered and written one at a time, so memory use does
+not grow with the number of jobs.
+
+With --format pack, all canopies are written into one geometry pack (see
+store_funcs) instead, e.g. the targets of a level pack: the segment table,
+a preview image and the score descriptor of every canopy, which can then be
+opened memory-mapped without generating anything. The pack is written to
+--output, or to canopies.pack in --out-dir.
+
+Usage examples:
+    python export_canopy.py --n-iters 9 --n-splits 3 --angle-delta 90 -o tree.png
+    python export_canopy.py --params targets.jsonl --format svg --out-dir targets/
+    python export_canopy.py --n-iters 10 --angle-jitter 15 --length-jitter 0.2 --seed 7 -o wild.png
+    python export_canopy.py --lsystem dragon --n-iters 16 --fit -o dragon.png
+    python export_canopy.py --params levels.jsonl --size 160x160 --fit -o levels.pack
+
+With --frames, every canopy is rendered as an animation of that many frames,
+written as numbered files: the canopy growing from nothing, or with --morph-to
+(or a "morph_to" object in the parameters) a transition from the canopy to
+another one (see animation_funcs). Frames are rendered and written one at a
+time as well. They can be assembled into a video or GIF with other tools, e.g.
+
+    python export_canopy.py --n-iters 12 --frames 60 --out-dir growth/
+    ffmpeg -framerate 30 -i growth/canopy_00000_%04d.png growth.mp4
+
+Every parameter object may contain the keyword arguments of `fractal_canopy`
+(except `canvas`), plus:
+    "name": the file name of the output, without extension.
+    "gradient": a [start, end] pair of colors, used instead of "color"
+        to color the canopy from the root to the leaves.
+    "morph_to": the parameters of the last frame of an animation, which
+        default to those of the canopy.
+    "lsystem": the name of an L-system of `lsystem_funcs.PRESETS` to render
+        instead of a canopy, with n_iters iterations of its rules, steps of
+        init_length and start_angle, width and the colors as for canopies.
+Options given on the command line are the defaults for every object.
+"""
+
+import argparse
+import json
+import os
+import sys
+from typing import Iterator
+
+import numpy as np
+
+from animation_funcs import morph_frames, growth_frames
+from color_funcs import hex_to_rgb_array, rgb_to_hex_array, NAMED_COLORS
+from fractal_funcs import (canopy_segments, rasterize_canopy_segments, segment_coordinates,
+                           depth_colors, transform_segments,
+                           SEGMENT_FIELDS, X0, Y0, X1, Y1, WIDTH, DEPTH)
+from helper_funcs import generate_gradient
+from lsystem_funcs import lsystem_segments, PRESETS
+from parallel_funcs import parallel_canopy_segments
+from raster_funcs import encode_png
+from score_funcs import canopy_descriptors
+from store_funcs import StoredCanopy, write_pack, PACK_EXTENSION
+
+# Keyword arguments of canopy_segments() accepted in parameter objects
+GEOMETRY_PARAMS = ("x", "y", "off_angle", "angle_delta", "start_angle", "n_splits", "n_iters",
+                   "length_ratio", "init_length", "width", "width_ratio",
+                   "angle_jitter", "length_jitter", "width_jitter", "branch_drop", "seed")
+
+
+def read_jobs(path: str) -> Iterator[dict]:
+    """
+    Yields the parameter objects of a JSON or JSONL file.
+    JSONL files are read one line at a time.
+    """
+    with open(path, encoding="utf-8") as file:
+        if path.endswith(".jsonl"):
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            jobs = json.load(file)
+            yield from (jobs if isinstance(jobs, list) else [jobs])
+
+
+def fit_transform(segments: np.ndarray, width: int, height: int, margin: float) -> tuple[float, float, float]:
+    """
+    Returns the (scale, offset_x, offset_y) transform that scales and centres the segments
+    so the canopy fills the image, leaving a margin (see `fractal_funcs.transform_segments`).
+    """
+    if not len(segments):
+        return 1.0, 0.0, 0.0
+    pad = segments[:, WIDTH].max() / 2
+    x_min, x_max = segments[:, [X0, X1]].min() - pad, segments[:, [X0, X1]].max() + pad
+    y_min, y_max = segments[:, [Y0, Y1]].min() - pad, segments[:, [Y0, Y1]].max() + pad
+    scale = min((width - 2 * margin) / max(x_max - x_min, 1e-9),
+                (height - 2 * margin) / max(y_max - y_min, 1e-9))
+    return (scale,
+            (width - (x_max - x_min) * scale) / 2 - x_min * scale,
+            (height - (y_max - y_min) * scale) / 2 - y_min * scale)
+
+
+def fit_segments(segments: np.ndarray, width: int, height: int, margin: float) -> tuple[np.ndarray, float]:
+    """
+    Scales and centres the segments so the canopy fills the image, leaving a margin.
+    Returns the transformed segments and the scale factor that was applied.
+    """
+    scale, offset_x, offset_y = fit_transform(segments, width, height, margin)
+    if not len(segments):
+        return segments, scale
+    return transform_segments(segments, scale, offset_x, offset_y), scale
+
+
+def write_svg(path: str,
+              segments: np.ndarray,
+              n_iters: int,
+              width: int,
+              height: int,
+              color: str | list,
+              wave_amp: float,
+              background: str | None) -> None:
+    """Writes the segments as an SVG drawing, one line or polyline element per branch."""
+    coordinates = segment_coordinates(segments, wave_amp)
+    colors = depth_colors(segments[:, DEPTH], n_iters, color)
+    with open(path, "w", encoding="utf-8") as file:
+        file.write(f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+                   f'viewBox="0 0 {width} {height}">\n')
+        if background:
+            file.write(f'<rect width="100%" height="100%" fill="{background}"/>\n')
+        file.write('<g fill="none" stroke-linecap="round" stroke-linejoin="round">\n')
+        for coords, branch_width, fill in zip(coordinates, segments[:, WIDTH].tolist(), colors):
+            points = " ".join(f"{coords[i]:.2f},{coords[i + 1]:.2f}" for i in range(0, len(coords), 2))
+            file.write(f'<polyline points="{points}" stroke="{fill}" stroke-width="{branch_width:.3g}"/>\n')
+        file.write("</g>\n</svg>\n")
+
+
+def canopy_image(segments: np.ndarray,
+                 n_iters: int,
+                 color: str | list,
+                 wave_amp: float,
+                 args: argparse.Namespace) -> np.ndarray:
+    """Renders the segments of one canopy, in image coordinates, into an RGBA image of the size of the options."""
+    width, height = args.size
+    return rasterize_canopy_segments(segments, n_iters, width, height, color,
+                                     wave_amp=wave_amp,
+                                     background=(tuple(hex_to_rgb_array(args.background).tolist()) + (255,)
+                                                 if args.background else (0, 0, 0, 0)))
+
+
+def write_canopy(path: str,
+                 segments: np.ndarray,
+                 n_iters: int,
+                 color: str | list,
+                 wave_amp: float,
+                 params: dict,
+                 args: argparse.Namespace) -> None:
+    """Writes the segments of one canopy, in image coordinates, to a file in the format of the options."""
+    width, height = args.size
+    if args.format == "png":
+        with open(path, "wb") as file:
+            file.write(encode_png(canopy_image(segments, n_iters, color, wave_amp, args)))
+    elif args.format == "svg":
+        write_svg(path, segments, n_iters, width, height, color, wave_amp, args.background)
+    else:
+        np.savez_compressed(path, segments=segments, fields=np.array(SEGMENT_FIELDS),
+                            params=json.dumps(params))
+
+
+def job_canopy(params: dict, args: argparse.Namespace) -> tuple[np.ndarray, int, str | list, float, dict]:
+    """
+    Computes the segments of one canopy in image coordinates, and returns them with the number
+    of iterations, the colors and wave amplitude to draw them with, and the complete parameters.
+    """
+    width, height = args.size
+    params = {"x": width / 2, "y": height - args.margin, **params}
+    n_iters = params.get("n_iters", 3)
+    wave_amp = params.get("wave_amp", 0)
+
+    geometry = {key: params[key] for key in GEOMETRY_PARAMS if key in params}
+    if "lsystem" in params:
+        segments = lsystem_segments(PRESETS[params["lsystem"]], n_iters, params["x"], params["y"],
+                                    params.get("start_angle", -90), params.get("init_length", 10),
+                                    params.get("width", 1))
+        # Colors go by bracket depth, which may exceed the number of iterations
+        n_iters = int(segments[:, DEPTH].max(initial=0)) + 1
+    elif args.workers > 1:
+        segments = parallel_canopy_segments(**geometry, max_workers=args.workers)
+    else:
+        segments = canopy_segments(**geometry, instancing=args.instancing)
+    if "gradient" in params:
+        color = generate_gradient(*params["gradient"], max(n_iters - 1, 2))
+    else:
+        color = params.get("color", "#000000")
+    if args.fit:
+        segments, scale = fit_segments(segments, width, height, args.margin + abs(wave_amp))
+        wave_amp *= scale
+    return segments, n_iters, color, wave_amp, params
+
+
+def render_job(params: dict, index: int, args: argparse.Namespace) -> str:
+    """Renders one canopy and writes it to a file, returning the path of the file."""
+    segments, n_iters, color, wave_amp, params = job_canopy(params, args)
+    name = params.get("name", f"{args.prefix}{index:05d}")
+    path = args.output or os.path.join(args.out_dir, f"{name}.{args.format}")
+    write_canopy(path, segments, n_iters, color, wave_amp, params, args)
+    return path
+
+
+def pack_canopy(params: dict, index: int, args: argparse.Namespace) -> StoredCanopy:
+    """
+    Renders one canopy as an entry of a geometry pack: its segment table in image coordinates,
+    a preview image and its score descriptor. The entry is addressed by the parameters of the
+    canopy together with the image size and --fit, on which the segments depend.
+    """
+    segments, n_iters, color, wave_amp, params = job_canopy(params, args)
+    return StoredCanopy({**params, "size": list(args.size), "fit": args.fit},
+                        {"segments": segments,
+                         "preview": canopy_image(segments, n_iters, color, wave_amp, args),
+                         "descriptor": canopy_descriptors([segments])[0]},
+                        {"name": params.get("name", f"{args.prefix}{index:05d}")})
+
+
+def render_animation(params: dict, index: int, args: argparse.Namespace) -> Iterator[str]:
+    """
+    Renders the frames of the animation of one canopy and writes them to files one at a time,
+    yielding the path of every file. With --fit, all frames get the transform that fits the
+    first and last frames together, so that the canopy does not jump from frame to frame.
+    """
+    if "lsystem" in params:
+        raise ValueError("Animations are of canopies; L-systems cannot be animated")
+    width, height = args.size
+    params = {"x": width / 2, "y": height - args.margin, **params}
+    end = {**params, **params.pop("morph_to", {})}
+
+    def frames():
+        if end == params:
+            return growth_frames(params, args.frames)
+        return morph_frames(params, end, args.frames)
+
+    transform = None
+    if args.fit:
+        first_and_last = np.concatenate([frame.segments for frame in morph_frames(params, end, 2)])
+        margin = args.margin + max(abs(params.get("wave_amp", 0)), abs(end.get("wave_amp", 0)))
+        transform = fit_transform(first_and_last, width, height, margin)
+
+    name = params.get("name", f"{args.prefix}{index:05d}")
+    for frame in frames():
+        segments, wave_amp = frame.segments, frame.wave_amp
+        if transform is not None:
+            segments = transform_segments(segments, *transform)
+            wave_amp *= transform[0]
+        path = os.path.join(args.out_dir, f"{name}_{frame.index:04d}.{args.format}")
+        write_canopy(path, segments, frame.n_iters, frame.color, wave_amp, frame.params, args)
+        yield path
+
+
+def color_arg(value: str) -> str:
+    """Parses a color option, a hex color or a color name, into a hex color."""
+    try:
+        return str(rgb_to_hex_array(hex_to_rgb_array(value)))
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"invalid color {value!r}: use a hex color such as '#ff0000' "
+            f"or one of the names {', '.join(sorted(NAMED_COLORS))}") from None
+
+
+def parse_args(argv: list | None = None) -> tuple[argparse.Namespace, dict]:
+    """Parses the command line into the export options and the default canopy parameters."""
+    parser = argparse.ArgumentParser(description="Render fractal canopies to PNG, SVG or NPZ files, or a geometry pack.")
+    parser.add_argument("--params", help="JSON or JSONL file of canopy parameter objects")
+    parser.add_argument("--format", choices=("png", "svg", "npz", "pack"), help="output format "
+                        "(default: taken from --output, otherwise png)")
+    parser.add_argument("-o", "--output", help="output file, for a single canopy or a pack")
+    parser.add_argument("--out-dir", default=".", help="output directory for --params (default: .)")
+    parser.add_argument("--prefix", default="canopy_", help="file name prefix of unnamed jobs")
+    parser.add_argument("--size", type=lambda s: tuple(int(v) for v in s.lower().split("x")),
+                        default=(500, 500), help="image size as WIDTHxHEIGHT (default: 500x500)")
+    parser.add_argument("--margin", type=float, default=10, help="margin in pixels (default: 10)")
+    parser.add_argument("--fit", action="store_true", help="scale each canopy to fill the image")
+    parser.add_argument("--background", default="#ffffff", type=lambda value: value and color_arg(value),
+                        help="background color, or '' for transparent (default: #ffffff)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of processes generating each canopy; canopies with a "
+                             "branch drop or fewer than 2**20 branches are generated serially (default: 1)")
+    parser.add_argument("--instancing", action="store_true",
+                        help="generate non-random canopies from copies of one canonical subtree, which is faster")
+
+    parser.add_argument("--lsystem", choices=sorted(PRESETS),
+                        help="render an L-system instead of a canopy, with --n-iters iterations")
+    parser.add_argument("--frames", type=int,
+                        help="render an animation of this many frames, written as numbered files in --out-dir")
+    parser.add_argument("--morph-to", metavar="FILE",
+                        help="JSON file of the parameters of the last frame of the animation "
+                             "(default: the canopy grows from nothing)")
+
+    canopy = parser.add_argument_group("canopy parameters (see fractal_canopy)")
+    for name, kind in (("x", float), ("y", float), ("off_angle", float), ("angle_delta", float),
+                       ("start_angle", float), ("n_splits", int), ("n_iters", int),
+                       ("length_ratio", float), ("init_length", float), ("wave_amp", float),
+                       ("width", float), ("width_ratio", float), ("angle_jitter", float),
+                       ("length_jitter", float), ("width_jitter", float), ("branch_drop", float),
+                       ("seed", int)):
+        canopy.add_argument("--" + name.replace("_", "-"), dest=name, type=kind)
+    canopy.add_argument("--color", nargs="+", type=color_arg,
+                        help="one color or one per iteration, as hex colors or color names")
+    canopy.add_argument("--gradient", nargs=2, metavar=("ROOT", "LEAF"), type=color_arg,
+                        help="color the canopy with a gradient between two colors")
+
+    args = parser.parse_args(argv)
+    if args.format is None:
+        extension = os.path.splitext(args.output or "")[1].lstrip(".").lower()
+        args.format = extension if extension in ("png", "svg", "npz", "pack") else "png"
+    if args.params and args.output and args.format != "pack":
+        parser.error("--output renders a single canopy; use --out-dir with --params")
+    if args.frames is not None and args.format == "pack":
+        parser.error("--frames writes numbered files, not packs")
+    if args.frames is not None and (args.output or args.frames < 1):
+        parser.error("--frames needs a positive number of frames and writes them to --out-dir")
+    if args.lsystem and args.frames is not None:
+        parser.error("--frames animates canopies, not L-systems")
+    if args.morph_to and args.frames is None:
+        parser.error("--morph-to animates the canopy; give the number of frames with --frames")
+
+    defaults = {name: value for name, value in vars(args).items()
+                if name in GEOMETRY_PARAMS + ("wave_amp", "gradient") and value is not None}
+    if args.color:
+        defaults["color"] = args.color[0] if len(args.color) == 1 else args.color
+    if args.lsystem:
+        defaults["lsystem"] = args.lsystem
+    if args.morph_to:
+        with open(args.morph_to, encoding="utf-8") as file:
+            defaults["morph_to"] = json.load(file)
+    return args, defaults
+
+
+def job_params(defaults: dict, params: dict) -> dict:
+    """Returns the parameters of one job: those of its object, with the options as defaults."""
+    job = {**defaults, **params}
+    # A color given by the job takes precedence over a default gradient
+    if "color" in params and "gradient" not in params:
+        job.pop("gradient", None)
+    return job
+
+
+def main(argv: list | None = None) -> None:
+    args, defaults = parse_args(argv)
+    jobs = (job_params(defaults, params) for params in (read_jobs(args.params) if args.params else [{}]))
+    if args.params or args.frames or (args.format == "pack" and not args.output):
+        os.makedirs(args.out_dir, exist_ok=True)
+    if args.format == "pack":
+        path = args.output or os.path.join(args.out_dir, "canopies" + PACK_EXTENSION)
+        write_pack(path, (pack_canopy(job, index, args) for index, job in enumerate(jobs)))
+        print(path, flush=True)
+        return
+    for index, job in enumerate(jobs):
+        if args.frames:
+            for path in render_animation(job, index, args):
+                print(path, flush=True)
+        else:
+            print(render_job(job, index, args), flush=True)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
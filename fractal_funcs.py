@@ -3,22 +3,730 @@ fractal_funcs.py
 
 This module contains functions for generating various
 fractal patterns designed for use with a Tkinter canvas.
-The fractal generating functions utilize recursion to
-create complex and visually appealing structures.
+The fractal generating functions build each generation of the
+structure from the previous one, so the geometry of a whole tree
+is computed with a handful of array operations.
 
 Functions:
+    root_key()
+        Returns the path key of the trunk of a randomized canopy.
+    child_keys()
+        Returns the path keys of the children of branches.
+    branch_uniforms()
+        Returns uniform random numbers for branches, derived from their path keys.
+    canopy_segments()
+        Generates the segment table of a fractal canopy, one generation at a time.
+    instanced_canopy_segments()
+        Generates the segment table of a fractal canopy by instancing one canonical subtree.
+    subtree_extent()
+        Returns an upper bound of how far the subtree of each branch reaches from its end point.
+    subtree_in_viewport()
+        Tells which subtrees may intersect a rectangular viewport.
+    segments_in_viewport()
+        Tells which branches may intersect a rectangular viewport.
+    grow_canopy()
+        Grows the subtrees of a set of branches, skipping subtrees that cannot be seen.
+    transform_segments()
+        Scales and translates the branches of a segment table.
+    depth_colors()
+        Returns the color of every branch of a segment table.
+    segment_coordinates()
+        Returns the coordinates of the line drawn for every branch of a segment table.
+    draw_canopy_segments()
+        Draws the branches of a segment table on a Tkinter canvas.
+    rasterize_canopy_segments()
+        Renders the branches of a segment table into an RGBA image.
     fractal_canopy()
-        Recursively draws a fractal canopy (a tree-like structure) on the provided Tkinter canvas.
+        Draws a fractal canopy (a tree-like structure) on the provided Tkinter canvas.
 """
 
 import tkinter as tk
 import numpy as np
-from numpy import radians as rad
-from helper_funcs import draw_sine_wave_segment
+from helper_funcs import adaptive_sine_wave_polylines, WAVE_PIXELS_PER_SAMPLE
+from canvas_funcs import DrawingBackend
+from color_funcs import hex_to_rgb_array
+import profile_funcs
+from raster_funcs import rasterize_lines, photo_image
+
+# Column layout of the segment table returned by canopy_segments()
+SEGMENT_FIELDS = ("x0", "y0", "x1", "y1", "angle", "length", "width", "depth", "key")
+X0, Y0, X1, Y1, ANGLE, LENGTH, WIDTH, DEPTH, KEY = range(len(SEGMENT_FIELDS))
+
+# Path keys are integers below 2 ** KEY_BITS, so that float64 columns hold them exactly
+KEY_BITS = 52
+# Number of random values drawn per branch: angle, length, width and whether it is dropped
+_RANDOM_STREAMS = 4
+
+
+def _mix(values: np.ndarray) -> np.ndarray:
+    """Scrambles 64-bit integers with the bijective finalizer of splitmix64."""
+    values = values ^ (values >> np.uint64(30))
+    values *= np.uint64(0xbf58476d1ce4e5b9)
+    values ^= values >> np.uint64(27)
+    values *= np.uint64(0x94d049bb133111eb)
+    return values ^ (values >> np.uint64(31))
+
+
+def root_key(seed: int | np.random.Generator | None = None) -> int:
+    """
+    Returns the path key of the trunk of a randomized canopy.
+
+    Args:
+        seed (int, np.random.Generator or None): A seed or generator for `numpy.random.default_rng`.
+            None gives a different canopy every time.
+
+    Returns:
+        int: A key below 2 ** KEY_BITS.
+    """
+    return int(np.random.default_rng(seed).integers(0, 2 ** KEY_BITS))
+
+
+def child_keys(keys: np.ndarray, n_splits: int) -> np.ndarray:
+    """
+    Returns the path keys of the children of branches, `n_splits` per branch in order.
+    The key of a branch depends only on the key of the trunk and the path from the trunk to
+    the branch, so any subtree can be regenerated on its own from the key of its root.
+    """
+    parents = np.asarray(keys, dtype=np.float64).astype(np.uint64)
+    paths = (parents[:, np.newaxis] * np.uint64(0x9e3779b97f4a7c15)
+             + np.arange(1, n_splits + 1, dtype=np.uint64)).ravel()
+    return (_mix(paths) >> np.uint64(64 - KEY_BITS)).astype(np.float64)
+
+
+def branch_uniforms(keys: np.ndarray, n_streams: int = _RANDOM_STREAMS) -> np.ndarray:
+    """
+    Returns `n_streams` uniform random numbers in [0, 1) for every branch, derived from its path key.
+    They are computed for a whole generation at once, and are the same whenever the branch is generated.
+    """
+    streams = np.arange(1, n_streams + 1, dtype=np.uint64) * np.uint64(0xd1b54a32d192ed03)
+    bits = _mix(np.asarray(keys, dtype=np.float64).astype(np.uint64)[:, np.newaxis] ^ streams)
+    return (bits >> np.uint64(11)).astype(np.float64) * 2.0 ** -53
+
+
+def subtree_extent(
+    segments: np.ndarray,
+    n_iters: int,
+    length_ratio: float = 0.75,
+    length_jitter: float = 0.0,
+) -> np.ndarray:
+    """
+    Returns an upper bound of how far the subtree of each branch reaches from its end point.
+
+    The children of a branch of length L are at most L * r long, their
+    children L * r^2 and so on, so the whole subtree fits in a disc
+    around the end point whose radius is the geometric series
+    L * (r + r^2 + ... + r^m) over the m levels still to be generated.
+
+    Args:
+        segments (np.ndarray): Rows of a segment table.
+        n_iters (int): The number of iterations of the canopy, as in `fractal_canopy`.
+        length_ratio (float, optional): The ratio by which the branch length decreases.
+            Defaults to 0.75.
+        length_jitter (float, optional): The relative random variation of the branch
+            lengths, see `grow_canopy`. Defaults to 0.
+
+    Returns:
+        np.ndarray: The radius of the subtree of every branch.
+    """
+    # With random variation, every generation is at most this much shorter than the previous one
+    ratio = abs(length_ratio) * (1 + abs(length_jitter))
+    levels_left = np.maximum(n_iters - 2 - segments[:, DEPTH], 0)
+    if ratio == 1:
+        series = levels_left
+    else:
+        series = ratio * (1 - ratio ** levels_left) / (1 - ratio)
+    return np.abs(segments[:, LENGTH]) * series
+
+
+def subtree_in_viewport(
+    segments: np.ndarray,
+    extent: np.ndarray,
+    viewport: tuple[float, float, float, float],
+) -> np.ndarray:
+    """
+    Tells which subtrees may intersect a rectangular viewport.
+
+    The subtree of each branch is bounded by the disc of radius `extent`
+    around the branch end point; the test is whether that disc and the
+    viewport rectangle overlap, so it never rejects a visible subtree.
+
+    Args:
+        segments (np.ndarray): Rows of a segment table.
+        extent (np.ndarray): The subtree radius of every row, see `subtree_extent`.
+        viewport (tuple): The visible rectangle as (x_min, y_min, x_max, y_max).
+
+    Returns:
+        np.ndarray: A boolean mask of the rows whose subtree may be visible.
+    """
+    x_min, y_min, x_max, y_max = viewport
+    # Distance from each disc centre to the nearest point of the rectangle
+    dx = np.maximum(np.maximum(x_min - segments[:, X1], segments[:, X1] - x_max), 0)
+    dy = np.maximum(np.maximum(y_min - segments[:, Y1], segments[:, Y1] - y_max), 0)
+    return dx * dx + dy * dy <= extent * extent
+
+
+def segments_in_viewport(
+    segments: np.ndarray,
+    viewport: tuple[float, float, float, float],
+    margin: float | np.ndarray = 0.0,
+) -> np.ndarray:
+    """
+    Tells which branches may intersect a rectangular viewport.
+
+    Args:
+        segments (np.ndarray): Rows of a segment table.
+        viewport (tuple): The visible rectangle as (x_min, y_min, x_max, y_max).
+        margin (float or np.ndarray, optional): How far around each branch its drawing
+            may reach, e.g. half its width or the amplitude of its wave. Defaults to 0.
+
+    Returns:
+        np.ndarray: A boolean mask of the rows whose bounding box overlaps the viewport.
+    """
+    x_min, y_min, x_max, y_max = viewport
+    return ((np.minimum(segments[:, X0], segments[:, X1]) - margin <= x_max)
+            & (np.maximum(segments[:, X0], segments[:, X1]) + margin >= x_min)
+            & (np.minimum(segments[:, Y0], segments[:, Y1]) - margin <= y_max)
+            & (np.maximum(segments[:, Y0], segments[:, Y1]) + margin >= y_min))
+
+
+@profile_funcs.timed()
+def grow_canopy(
+    seeds: np.ndarray,
+    off_angle: float = 0,
+    angle_delta: float = 10,
+    n_splits: int = 2,
+    n_iters: int = 3,
+    length_ratio: float = 0.75,
+    width_ratio: float = 0.75,
+    view_scale: float = 1.0,
+    min_pixels: float = 0.0,
+    viewport: tuple[float, float, float, float] | None = None,
+    angle_jitter: float = 0.0,
+    length_jitter: float = 0.0,
+    width_jitter: float = 0.0,
+    branch_drop: float = 0.0,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Grows the subtrees of a set of branches, one generation at a time.
+
+    Every generation is computed from the previous one in a single
+    broadcast step: each parent end point is repeated `n_splits` times
+    and the child angles are the parent angles plus the split offsets.
+
+    A branch whose subtree would span fewer than `min_pixels` pixels at
+    `view_scale` (see `subtree_extent`), or whose subtree lies entirely
+    outside `viewport` (see `subtree_in_viewport`), is not subdivided.
+    It is returned in the frontier instead, so that it can be grown later,
+    for example when the view is zoomed in or panned.
+
+    With any of the jitter arguments or `branch_drop`, every branch varies at random.
+    Its random numbers are derived from its path key (see `child_keys` and
+    `branch_uniforms`), drawn for a whole generation at once, so a subtree comes
+    out the same whether it is grown with the whole tree, from the frontier, from
+    a cached table or by a worker process. The seeds must then carry path keys,
+    as the rows from a randomized `canopy_segments` do.
+
+    Args:
+        seeds (np.ndarray): Rows of a segment table whose subtrees should be grown.
+        off_angle (float, optional): The offset angle for the branches in degrees. Defaults to 0.
+        angle_delta (float, optional): The angle between the branches in degrees. Defaults to 10.
+        n_splits (int, optional): The number of branches to split into at each iteration. Defaults to 2.
+        n_iters (int, optional): The number of iterations, as in `fractal_canopy`. Defaults to 3.
+        length_ratio (float, optional): The ratio by which the branch length decreases. Defaults to 0.75.
+        width_ratio (float, optional): The ratio by which the branch width decreases. Defaults to 0.75.
+        view_scale (float, optional): The zoom scale from model units to pixels. Defaults to 1.
+        min_pixels (float, optional): The smallest subtree extent in pixels that is still
+            subdivided. Defaults to 0, which grows every subtree completely.
+        viewport (tuple, optional): The visible rectangle as (x_min, y_min, x_max, y_max)
+            in the coordinates of the segments. Defaults to None, which grows subtrees
+            wherever they are.
+        angle_jitter (float, optional): The largest random change of a branch angle, in degrees.
+            Defaults to 0.
+        length_jitter (float, optional): The largest random change of a branch length,
+            relative to it (0.2 for up to 20% longer or shorter). Defaults to 0.
+        width_jitter (float, optional): The largest random change of a branch width,
+            relative to it. Defaults to 0.
+        branch_drop (float, optional): The probability that a branch is left out,
+            together with its subtree. Defaults to 0.
+
+    Returns:
+        tuple: The segment table of the new branches and the segment table of
+            the branches left for later subdivision.
+    """
+    split_offsets = np.linspace(-angle_delta / 2, angle_delta / 2, n_splits)
+    randomized = bool(angle_jitter or length_jitter or width_jitter or branch_drop)
+    levels = []
+    frontier = []
+    parents = seeds[seeds[:, DEPTH] < n_iters - 2] if n_splits > 0 else seeds[:0]
+    while len(parents):
+        if min_pixels > 0 or viewport is not None:
+            extent = subtree_extent(parents, n_iters, length_ratio, length_jitter)
+            visible = extent * view_scale >= min_pixels
+            if viewport is not None:
+                visible &= subtree_in_viewport(parents, extent, viewport)
+            if not visible.all():
+                frontier.append(parents[~visible])
+                parents = parents[visible]
+
+        # Every branch splits into n_splits children starting at its end point
+        children = np.empty((len(parents) * n_splits, len(SEGMENT_FIELDS)))
+        children[:, X0] = np.repeat(parents[:, X1], n_splits)
+        children[:, Y0] = np.repeat(parents[:, Y1], n_splits)
+        children[:, ANGLE] = (parents[:, ANGLE, np.newaxis] + off_angle + split_offsets).ravel()
+        children[:, LENGTH] = np.repeat(parents[:, LENGTH] * length_ratio, n_splits)
+        children[:, WIDTH] = np.repeat(parents[:, WIDTH] * width_ratio, n_splits)
+        children[:, DEPTH] = np.repeat(parents[:, DEPTH] + 1, n_splits)
+        if randomized:
+            children[:, KEY] = child_keys(parents[:, KEY], n_splits)
+            # One batch of random numbers for the whole generation, in [-1, 1)
+            jitter = branch_uniforms(children[:, KEY]) * 2 - 1
+            children[:, ANGLE] += jitter[:, 0] * angle_jitter
+            children[:, LENGTH] *= 1 + jitter[:, 1] * length_jitter
+            children[:, WIDTH] *= 1 + jitter[:, 2] * width_jitter
+            if branch_drop:
+                children = children[(jitter[:, 3] + 1) / 2 >= branch_drop]
+        else:
+            children[:, KEY] = 0
+        angles_rad = np.radians(children[:, ANGLE])
+        children[:, X1] = children[:, X0] + np.cos(angles_rad) * children[:, LENGTH]
+        children[:, Y1] = children[:, Y0] + np.sin(angles_rad) * children[:, LENGTH]
+        levels.append(children)
+
+        growing = children[:, DEPTH] < n_iters - 2
+        parents = children if growing.all() else children[growing]
+
+    empty = np.empty((0, len(SEGMENT_FIELDS)))
+    profile_funcs.count("branches_generated", sum(len(level) for level in levels))
+    return (np.concatenate(levels) if levels else empty,
+            np.concatenate(frontier) if frontier else empty)
+
+
+def canopy_segments(
+    x: float,
+    y: float,
+    off_angle: float = 0,
+    angle_delta: float = 10,
+    start_angle: float = -90,
+    n_splits: int = 2,
+    n_iters: int = 3,
+    length_ratio: float = 0.75,
+    init_length: float = 200,
+    width: float = 1,
+    width_ratio: float = 0.75,
+    view_scale: float = 1.0,
+    min_pixels: float = 0.0,
+    viewport: tuple[float, float, float, float] | None = None,
+    return_frontier: bool = False,
+    angle_jitter: float = 0.0,
+    length_jitter: float = 0.0,
+    width_jitter: float = 0.0,
+    branch_drop: float = 0.0,
+    seed: int | np.random.Generator | None = None,
+    instancing: bool = False,
+) -> np.ndarray | tuple[np.ndarray, np.ndarray]:
+    """
+    Generates the geometry of a fractal canopy as a segment table.
+
+    The table has one row per branch and the columns listed in
+    `SEGMENT_FIELDS` (start point, end point, angle in degrees, length,
+    width, depth, where the trunk has depth 0, and the path key of randomized
+    canopies). Rows are ordered generation by generation and, when nothing
+    is culled or dropped, the children of the i-th branch of a generation
+    are rows `i * n_splits ... i * n_splits + n_splits - 1` of the next one.
+
+    With a positive `min_pixels`, subtrees smaller than that many pixels
+    at `view_scale` are not generated, and with a `viewport`, neither are
+    subtrees outside of it (see `grow_canopy`).
+
+    Args:
+        x (float): The x-coordinate of the starting point of the fractal canopy.
+        y (float): The y-coordinate of the starting point of the fractal canopy.
+        off_angle (float, optional): The offset angle for the branches in degrees. Defaults to 0.
+        angle_delta (float, optional): The angle between the branches in degrees. Defaults to 10.
+        start_angle (float, optional): The angle of the trunk in degrees. Defaults to -90 (upwards).
+        n_splits (int, optional): The number of branches to split into at each iteration. Defaults to 2.
+        n_iters (int, optional): The number of iterations, as in `fractal_canopy`. Defaults to 3.
+        length_ratio (float, optional): The ratio by which the branch length decreases. Defaults to 0.75.
+        init_length (float, optional): The length of the trunk. Defaults to 200.
+        width (float, optional): The width of the trunk. Defaults to 1.
+        width_ratio (float, optional): The ratio by which the branch width decreases. Defaults to 0.75.
+        view_scale (float, optional): The zoom scale from model units to pixels. Defaults to 1.
+        min_pixels (float, optional): The smallest subtree extent in pixels that is still
+            subdivided. Defaults to 0, which generates the whole tree.
+        viewport (tuple, optional): The visible rectangle as (x_min, y_min, x_max, y_max).
+            Defaults to None, which does not cull by position.
+        return_frontier (bool, optional): Whether to also return the branches whose
+            subtrees were culled. Defaults to False.
+        angle_jitter, length_jitter, width_jitter, branch_drop: The random variation
+            of the branches, see `grow_canopy`. Default to 0, which gives no variation.
+        seed (int or np.random.Generator, optional): The seed of a randomized canopy;
+            the same seed gives the same canopy. Defaults to None, a new canopy every time.
+        instancing (bool, optional): Whether to generate the canopy from copies of one
+            canonical subtree (see `instanced_canopy_segments`), which is faster. It only
+            applies to canopies that are neither randomized nor culled. Defaults to False.
+
+    Returns:
+        np.ndarray: A float array of shape (n_branches, len(SEGMENT_FIELDS)),
+            followed by the frontier table if `return_frontier` is True.
+    """
+    randomized = bool(angle_jitter or length_jitter or width_jitter or branch_drop)
+    if instancing and not randomized and min_pixels <= 0 and viewport is None:
+        segments = instanced_canopy_segments(x, y, off_angle, angle_delta, start_angle, n_splits, n_iters,
+                                             length_ratio, init_length, width, width_ratio)
+        if return_frontier:
+            return segments, np.empty((0, len(SEGMENT_FIELDS)))
+        return segments
+    trunk = np.empty((1 if n_iters > 1 else 0, len(SEGMENT_FIELDS)))
+    if len(trunk):
+        start_angle_rad = np.radians(start_angle)
+        trunk[0] = (x, y,
+                    x + np.cos(start_angle_rad) * init_length,
+                    y + np.sin(start_angle_rad) * init_length,
+                    start_angle, init_length, width, 0,
+                    root_key(seed) if randomized else 0)
+    # The first split is centred on the trunk angle plus the offset, like all later ones
+    branches, frontier = grow_canopy(trunk,
+                                     off_angle=off_angle,
+                                     angle_delta=angle_delta,
+                                     n_splits=n_splits,
+                                     n_iters=n_iters,
+                                     length_ratio=length_ratio,
+                                     width_ratio=width_ratio,
+                                     view_scale=view_scale,
+                                     min_pixels=min_pixels,
+                                     viewport=viewport,
+                                     angle_jitter=angle_jitter,
+                                     length_jitter=length_jitter,
+                                     width_jitter=width_jitter,
+                                     branch_drop=branch_drop)
+    profile_funcs.count("branches_generated", len(trunk))
+    segments = np.concatenate((trunk, branches))
+    if return_frontier:
+        return segments, frontier
+    return segments
+
+
+def _directional_generations(
+    start: complex,
+    direction: complex,
+    angle: float,
+    length: float,
+    n_generations: int,
+    rotations: np.ndarray,
+    split_angles: np.ndarray,
+    length_ratio: float,
+) -> tuple[list, list, list]:
+    """
+    Grows the generations of a subtree from one branch without trigonometry: the unit direction
+    of every child is that of its parent multiplied by one of the `rotations`.
+
+    Returns:
+        tuple: Lists with the start points (complex), unit directions (complex) and angles
+            in degrees of the branches of every generation, the given branch being the first.
+    """
+    starts, directions, angles = [np.array([start])], [np.array([direction])], [np.array([float(angle)])]
+    n_splits = len(rotations)
+    for _ in range(n_generations - 1):
+        ends = starts[-1] + directions[-1] * length
+        starts.append(np.repeat(ends, n_splits))
+        directions.append((directions[-1][:, np.newaxis] * rotations).ravel())
+        angles.append((angles[-1][:, np.newaxis] + split_angles).ravel())
+        length *= length_ratio
+    return starts, directions, angles
+
+
+def instanced_canopy_segments(
+    x: float,
+    y: float,
+    off_angle: float = 0,
+    angle_delta: float = 10,
+    start_angle: float = -90,
+    n_splits: int = 2,
+    n_iters: int = 3,
+    length_ratio: float = 0.75,
+    init_length: float = 200,
+    width: float = 1,
+    width_ratio: float = 0.75,
+    instance_depth: int | None = None,
+) -> np.ndarray:
+    """
+    Generates the segment table of a fractal canopy by instancing one canonical subtree.
+
+    The angles and ratios are the same at every split, so all subtrees rooted at one
+    generation are copies of each other, only rotated and translated. The top
+    generations are grown down to the roots of these copies, and the canonical
+    subtree below one root is grown once; every copy is then placed with a single
+    complex multiply-add per generation, for all copies at once.
+
+    No branch direction needs trigonometry: the directions of the children of a branch
+    are its direction multiplied by the n_splits unit complex numbers of the split
+    angles, computed once. The table is the same as from `canopy_segments`, up to
+    rounding, and in the same order.
+
+    Args:
+        x, y, off_angle, angle_delta, start_angle, n_splits, n_iters, length_ratio,
+            init_length, width, width_ratio: As for `canopy_segments`.
+        instance_depth (int, optional): The number of generations of the canonical subtree.
+            Defaults to None, which takes half of the generations, so that the top
+            generations and the canonical subtree are both about the square root of the tree.
+
+    Returns:
+        np.ndarray: A float array of shape (n_branches, len(SEGMENT_FIELDS)).
+    """
+    n_generations = max(n_iters - 1, 0)
+    if n_splits < 1:
+        n_generations = min(n_generations, 1)
+    if instance_depth is None:
+        instance_depth = n_generations // 2
+    instance_depth = min(max(instance_depth, 0), max(n_generations - 1, 0))
+    top_generations = n_generations - instance_depth
+
+    split_angles = off_angle + np.linspace(-angle_delta / 2, angle_delta / 2, n_splits)
+    rotations = np.exp(1j * np.radians(split_angles))
+    lengths = [float(init_length)]
+    widths = [float(width)]
+    for _ in range(n_generations - 1):
+        lengths.append(lengths[-1] * length_ratio)
+        widths.append(widths[-1] * width_ratio)
+
+    starts, directions, angles = _directional_generations(complex(x, y), np.exp(1j * np.radians(start_angle)),
+                                                          start_angle, init_length, top_generations,
+                                                          rotations, split_angles, length_ratio)
+    if instance_depth:
+        # The canonical subtree hangs from a root ending at the origin and pointing along angle 0;
+        # every root of the top generations places one copy of it
+        roots_end = starts[-1] + directions[-1] * lengths[top_generations - 1]
+        roots_direction = directions[-1]
+        roots_angle = angles[-1]
+        canonical = _directional_generations(-lengths[top_generations - 1], 1, 0.0, lengths[top_generations - 1],
+                                             instance_depth + 1, rotations, split_angles, length_ratio)
+        canonical_ends = [start + direction * length
+                          for start, direction, length in zip(canonical[0][1:], canonical[1][1:],
+                                                              lengths[top_generations:])]
+
+    sizes = [n_splits ** depth for depth in range(n_generations)]
+    segments = np.empty((sum(sizes), len(SEGMENT_FIELDS)))
+    row = 0
+    for depth, size in enumerate(sizes):
+        rows = segments[row:row + size]
+        row += size
+        if depth < top_generations:
+            start, angle = starts[depth], angles[depth]
+            end = start + directions[depth] * lengths[depth]
+        else:
+            # All copies of one generation of the canonical subtree at once
+            level = depth - top_generations + 1
+            start = (roots_end[:, np.newaxis] + roots_direction[:, np.newaxis] * canonical[0][level]).ravel()
+            end = (roots_end[:, np.newaxis]
+                   + roots_direction[:, np.newaxis] * canonical_ends[level - 1]).ravel()
+            angle = (roots_angle[:, np.newaxis] + canonical[2][level]).ravel()
+        rows[:, X0] = start.real
+        rows[:, Y0] = start.imag
+        rows[:, X1] = end.real
+        rows[:, Y1] = end.imag
+        rows[:, ANGLE] = angle
+        rows[:, LENGTH] = lengths[depth]
+        rows[:, WIDTH] = widths[depth]
+        rows[:, DEPTH] = depth
+        rows[:, KEY] = 0
+    profile_funcs.count("branches_generated", len(segments))
+    return segments
+
+
+def transform_segments(
+    segments: np.ndarray,
+    scale: float = 1.0,
+    offset_x: float = 0.0,
+    offset_y: float = 0.0,
+) -> np.ndarray:
+    """
+    Scales and translates the branches of a segment table, e.g. from model to canvas coordinates.
+    Points are mapped to (x * scale + offset_x, y * scale + offset_y) and lengths are scaled;
+    angles, widths and depths are left as they are.
+
+    Args:
+        segments (np.ndarray): The segment table.
+        scale (float, optional): The scale factor. Defaults to 1.
+        offset_x (float, optional): The translation along x. Defaults to 0.
+        offset_y (float, optional): The translation along y. Defaults to 0.
+
+    Returns:
+        np.ndarray: The transformed copy of the segment table.
+    """
+    transformed = segments.copy()
+    transformed[:, [X0, X1]] = segments[:, [X0, X1]] * scale + offset_x
+    transformed[:, [Y0, Y1]] = segments[:, [Y0, Y1]] * scale + offset_y
+    transformed[:, LENGTH] = segments[:, LENGTH] * scale
+    return transformed
+
+
+def depth_colors(
+    depths: np.ndarray,
+    n_iters: int,
+    color: str | list = "#000000",
+) -> list:
+    """
+    Returns the color of every branch based on its depth.
+    If a list of colors is provided, the color changes with each iteration:
+    the leaves get the last color, their parents the one before, and so on.
+
+    Args:
+        depths (np.ndarray): The depth of every branch (0 for the trunk).
+        n_iters (int): The number of iterations of the canopy.
+        color (str or list): The color of the branches in hex format, or a list or array
+            of hex values such as a palette from `color_funcs.gradient_palette`.
+
+    Returns:
+        list: The color of every branch.
+    """
+    if isinstance(color, str):
+        return [color] * len(depths)
+    # One lookup for all branches; negative indices count from the leaves
+    return np.asarray(color)[np.asarray(depths, dtype=int) - n_iters + 1].tolist()
+
+
+def segment_coordinates(
+    segments: np.ndarray,
+    wave_amp: float = 0,
+    view_scale: float = 1.0,
+    wave_pixels_per_sample: float = WAVE_PIXELS_PER_SAMPLE,
+) -> list:
+    """
+    Returns the flat coordinate list of the line drawn for every branch of a segment table.
+
+    Straight branches have the four coordinates of their end points. If wave_amp
+    is non-zero, all sine wave branches are generated in one batch, sampled
+    according to their on-screen length, and each has the coordinates of its polyline.
+
+    Args:
+        segments (np.ndarray): The segment table, in canvas coordinates.
+        wave_amp (float, optional): The amplitude of the sine wave segments. Defaults to 0.
+        view_scale (float, optional): The current zoom scale from model units to pixels.
+            Defaults to 1.
+        wave_pixels_per_sample (float, optional): The on-screen distance between the samples
+            of a sine wave segment. Defaults to WAVE_PIXELS_PER_SAMPLE.
+
+    Returns:
+        list: A list of [x0, y0, x1, y1, ...] coordinate lists, one per row.
+    """
+    if wave_amp == 0:
+        return segments[:, X0:Y1 + 1].tolist()
+    points, offsets = adaptive_sine_wave_polylines(segments[:, X0], segments[:, Y0],
+                                                   segments[:, X1], segments[:, Y1],
+                                                   segments[:, LENGTH], wave_amp,
+                                                   scale=view_scale,
+                                                   pixels_per_sample=wave_pixels_per_sample)
+    flat_points = points.ravel().tolist()
+    return [flat_points[2 * start:2 * end]
+            for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+
+
+def draw_canopy_segments(
+    canvas: DrawingBackend,
+    segments: np.ndarray,
+    n_iters: int,
+    color: str | list = "#000000",
+    wave_amp: float = 0,
+    view_scale: float = 1.0,
+    wave_pixels_per_sample: float = WAVE_PIXELS_PER_SAMPLE,
+    tags: str | tuple = (),
+) -> list:
+    """
+    Draws the branches of a segment table on a Tkinter canvas, one line item per branch.
+    If wave_amp is non-zero, each branch is drawn as a sine wave polyline (see `segment_coordinates`).
+
+    Args:
+        canvas (DrawingBackend): The Tkinter canvas, or any other drawing backend
+            (see `canvas_funcs`), on which to draw the branches.
+        segments (np.ndarray): The segment table, in canvas coordinates.
+        n_iters (int): The number of iterations of the canopy, used to pick colors.
+        color (str or list, optional): The color of the branches in hex format or
+            a list of hex values. Defaults to "#000000" (black).
+        wave_amp (float, optional): The amplitude of the sine wave segments. Defaults to 0.
+        view_scale (float, optional): The current zoom scale from model units to pixels.
+            Defaults to 1.
+        wave_pixels_per_sample (float, optional): The on-screen distance between the samples
+            of a sine wave segment. Defaults to WAVE_PIXELS_PER_SAMPLE.
+        tags (str or tuple, optional): Tags given to the created items. Defaults to none.
+
+    Returns:
+        list: The ids of the created canvas items, in the order of the rows.
+    """
+    with profile_funcs.phase("segment_coordinates"):
+        coordinates = segment_coordinates(segments, wave_amp, view_scale, wave_pixels_per_sample)
+        colors = depth_colors(segments[:, DEPTH], n_iters, color)
+    with profile_funcs.phase("create_items"):
+        item_ids = [canvas.create_line(coords, width=branch_width, fill=fill, tags=tags)
+                    for coords, branch_width, fill in zip(coordinates, segments[:, WIDTH].tolist(), colors)]
+    profile_funcs.count("items_created", len(item_ids))
+    return item_ids
+
+
+@profile_funcs.timed()
+def rasterize_canopy_segments(
+    segments: np.ndarray,
+    n_iters: int,
+    width: int,
+    height: int,
+    color: str | list = "#000000",
+    wave_amp: float = 0,
+    origin: tuple[float, float] = (0.0, 0.0),
+    background: tuple = (0, 0, 0, 0),
+    view_scale: float = 1.0,
+    wave_pixels_per_sample: float = WAVE_PIXELS_PER_SAMPLE,
+) -> np.ndarray:
+    """
+    Renders the branches of a segment table into an RGBA image.
+
+    This needs no Tkinter canvas or display. If wave_amp is non-zero, the
+    sine wave polylines are generated in one batch and every piece of them
+    is rendered as a separate line.
+
+    Args:
+        segments (np.ndarray): The segment table, in pixel coordinates.
+        n_iters (int): The number of iterations of the canopy, used to pick colors.
+        width (int): The width of the image.
+        height (int): The height of the image.
+        color (str or list, optional): The color of the branches in hex format or
+            a list of hex values. Defaults to "#000000" (black).
+        wave_amp (float, optional): The amplitude of the sine wave segments. Defaults to 0.
+        origin (tuple, optional): The coordinates shown at the top left pixel. Defaults to (0, 0).
+        background (tuple, optional): The RGBA color of the background.
+            Defaults to (0, 0, 0, 0), fully transparent.
+        view_scale (float, optional): The current zoom scale from model units to pixels.
+            Defaults to 1.
+        wave_pixels_per_sample (float, optional): The on-screen distance between the samples
+            of a sine wave segment. Defaults to WAVE_PIXELS_PER_SAMPLE.
+
+    Returns:
+        np.ndarray: The image as a (height, width, 4) uint8 array.
+    """
+    depths = segments[:, DEPTH].astype(int)
+    palette = np.full((depths.max(initial=0) + 1, 4), 255, dtype=np.uint8)
+    palette[:, :3] = hex_to_rgb_array(depth_colors(np.arange(len(palette)), n_iters, color))
+    colors = palette[depths]
+    widths = segments[:, WIDTH]
+    lines = segments[:, X0:Y1 + 1]
+    if wave_amp != 0:
+        points, offsets = adaptive_sine_wave_polylines(segments[:, X0], segments[:, Y0],
+                                                       segments[:, X1], segments[:, Y1],
+                                                       segments[:, LENGTH], wave_amp,
+                                                       scale=view_scale,
+                                                       pixels_per_sample=wave_pixels_per_sample)
+        # Each polyline of n points becomes n - 1 pieces of its branch's width and color
+        pieces = np.diff(offsets) - 1
+        starts = np.delete(points, offsets[1:] - 1, axis=0)
+        ends = np.delete(points, offsets[:-1], axis=0)
+        lines = np.concatenate((starts, ends), axis=-1)
+        colors = np.repeat(colors, pieces, axis=0)
+        widths = np.repeat(widths, pieces)
+    return rasterize_lines(lines[:, 0] - origin[0], lines[:, 1] - origin[1],
+                           lines[:, 2] - origin[0], lines[:, 3] - origin[1],
+                           widths, colors, width, height, background)
 
 
 def fractal_canopy(
-    canvas: tk.Canvas,
+    canvas: DrawingBackend,
     x: float,
     y: float,
     off_angle: float = 0,
@@ -33,18 +741,35 @@ def fractal_canopy(
     width_ratio: float = 0.75,
     color="#000000",
     first_iter: bool = True,
+    view_scale: float = 1.0,
+    wave_pixels_per_sample: float = WAVE_PIXELS_PER_SAMPLE,
+    min_pixels: float = 0.0,
+    backend: str = "canvas",
+    angle_jitter: float = 0.0,
+    length_jitter: float = 0.0,
+    width_jitter: float = 0.0,
+    branch_drop: float = 0.0,
+    seed: int | np.random.Generator | None = None,
+    instancing: bool = False,
 ) -> None:
     """
-    Recursively draws a fractal canopy (a tree-like structure) on the provided Tkinter canvas.
+    Draws a fractal canopy (a tree-like structure) on the provided Tkinter canvas.
 
-    This function uses recursion to draw a fractal canopy
-    by splitting each branch into multiple smaller branches
-    at specified angles and lengths.
+    The fractal canopy splits each branch into multiple smaller branches
+    at specified angles and lengths. The geometry is generated up front
+    by `canopy_segments` and then drawn from the resulting segment table.
     Optionally, sine wave segments can be added to the branches.
 
+    With the "canvas" backend every branch is a line item on the canvas. With the
+    "raster" backend the visible part of the canopy is rendered into an image
+    (see `rasterize_canopy_segments`) and shown as a single image item, which
+    keeps very large canopies cheap for Tkinter to display. A canvas shows one
+    raster canopy at a time: drawing another replaces the image of the previous one.
+
     Args:
-        canvas (tk.Canvas):
-            The Tkinter canvas on which to draw the fractal canopy.
+        canvas (DrawingBackend):
+            The Tkinter canvas on which to draw the fractal canopy. With the "canvas" backend
+            any other drawing backend works too, e.g. a `canvas_funcs.RecordingCanvas`.
         x (float):
             The x-coordinate of the starting point of the fractal canopy.
         y (float):
@@ -58,10 +783,11 @@ def fractal_canopy(
         n_splits (int, optional): 
             The number of branches to split into at each iteration. Defaults to 2.
         n_iters (int, optional): 
-            The number of recursive iterations to perform. Defaults to 3.
+            The number of iterations to perform. Defaults to 3.
         length_ratio (float, optional): 
             The ratio by which the length of each branch decreases at each iteration.
-            Defaults to 0.75.
+            Defaults to 0.75. It applies at every generation; the recursive version of this
+            function applied it below the trunk only, and 0.75 at every deeper generation.
         init_length (float, optional): 
             The initial length of the first branch. Defaults to 200.
         wave_amp (float, optional): 
@@ -77,115 +803,71 @@ def fractal_canopy(
             If a list of hex values of length `n_iters` is provided,
             the color will change with each iteration.
         first_iter (bool, optional): 
-            A flag indicating whether this is the first iteration.
-            Defaults to True. Do not modify this parameter.
+            Kept for compatibility with the former recursive implementation.
+            It is ignored.
+        view_scale (float, optional):
+            The current zoom scale from model units to pixels. Defaults to 1.
+            Used to choose how finely sine wave segments are sampled.
+        wave_pixels_per_sample (float, optional):
+            The on-screen distance between the samples of a sine wave segment.
+            Defaults to WAVE_PIXELS_PER_SAMPLE.
+        min_pixels (float, optional):
+            Subtrees spanning fewer pixels than this at `view_scale` are not drawn.
+            Defaults to 0, which draws the whole tree.
+        backend (str, optional):
+            "canvas" to draw line items or "raster" to draw a single image.
+            Defaults to "canvas".
+        angle_jitter, length_jitter, width_jitter, branch_drop (float, optional):
+            The random variation of the branches, see `grow_canopy`. Default to 0.
+        seed (int or np.random.Generator, optional):
+            The seed of a randomized canopy. Defaults to None.
+        instancing (bool, optional):
+            Whether to generate the canopy from copies of one canonical subtree,
+            see `canopy_segments`. Defaults to False.
 
     Returns:
         None
     """
-    def draw_branch(
-        x: float,
-        y: float,
-        end_x: float,
-        end_y: float,
-        width: float,
-        color: str
-    ) -> None:
-        """
-        Draws a branch segment on the canvas.
-        If wave_amp is non-zero, a sine wave segment is drawn instead.
-
-        Args:
-            x (float): The x-coordinate of the starting point of the branch.
-            y (float): The y-coordinate of the starting point of the branch.
-            end_x (float): The x-coordinate of the ending point of the branch.
-            end_y (float): The y-coordinate of the ending point of the branch.
-            width (float): The width of the branch.
-            color (str): The color of the branch in hex format.
-        
-        Returns:
-            None
-        """
-        if wave_amp != 0:
-            draw_sine_wave_segment(canvas, x, y, end_x, end_y,
-                                   init_length, wave_amp,
-                                   width=width, fill=color)
-        else:
-            canvas.create_line(x, y, end_x, end_y, width=width, fill=color)
-
-
-    def get_color(
-        n_iters: int,
-        color: str|list
-    ) -> str:
-        """
-        Returns the color for the current iteration based on the provided color.
-        If a list of colors is provided, the color changes with each iteration.
-
-        Args:
-            n_iters (int): The current iteration number.
-            color (str or list): The color of the branches in hex format or a list of hex values.
-
-        Returns:
-            str: The color for the current iteration.
-        """
-        if isinstance(color, str):
-            return color
-        return color[-(n_iters-1)]
-
-
-    # Base case - stop recursion if n_iters is 1
-    if n_iters == 1:
-        return
-    start_angle_rad = rad(start_angle)
-
-    # Draw the first branch segment
-    if first_iter:
-        end_x = (x
-                 + np.cos(start_angle_rad)
-                 * init_length)
-        end_y = (y
-                 + np.sin(start_angle_rad)
-                 * init_length)
-        draw_branch(x, y, end_x, end_y, width, get_color(n_iters, color))
-        fractal_canopy(canvas, end_x, end_y,
-                       n_iters=n_iters-1,
-                       first_iter=False,
-                       n_splits=n_splits,
-                       angle_delta=angle_delta,
-                       start_angle=np.degrees(start_angle_rad) + off_angle,
-                       init_length=(init_length * length_ratio),
-                       off_angle=off_angle,
-                       wave_amp=wave_amp,
-                       width=width * width_ratio,
-                       width_ratio=width_ratio,
-                       color=color)
+    segments = canopy_segments(x, y,
+                               off_angle=off_angle,
+                               angle_delta=angle_delta,
+                               start_angle=start_angle,
+                               n_splits=n_splits,
+                               n_iters=n_iters,
+                               length_ratio=length_ratio,
+                               init_length=init_length,
+                               width=width,
+                               width_ratio=width_ratio,
+                               view_scale=view_scale,
+                               min_pixels=min_pixels,
+                               angle_jitter=angle_jitter,
+                               length_jitter=length_jitter,
+                               width_jitter=width_jitter,
+                               branch_drop=branch_drop,
+                               seed=seed,
+                               instancing=instancing)
+    if backend == "canvas":
+        draw_canopy_segments(canvas, segments, n_iters, color,
+                             wave_amp=wave_amp,
+                             view_scale=view_scale,
+                             wave_pixels_per_sample=wave_pixels_per_sample)
+    elif backend == "raster":
+        image_width = int(canvas.cget("width"))
+        image_height = int(canvas.cget("height"))
+        origin = (canvas.canvasx(0), canvas.canvasy(0))
+        image = photo_image(rasterize_canopy_segments(segments, n_iters,
+                                                      image_width, image_height, color,
+                                                      wave_amp=wave_amp,
+                                                      origin=origin,
+                                                      view_scale=view_scale,
+                                                      wave_pixels_per_sample=wave_pixels_per_sample),
+                            master=canvas)
+        # The new image replaces the one of the previous raster drawing, if any
+        previous = getattr(canvas, "raster_item", None)
+        if previous is not None:
+            canvas.delete(previous)
+        canvas.raster_item = canvas.create_image(*origin, image=image, anchor=tk.NW)
+        # The canvas does not keep a reference to the image, so it would be garbage collected
+        canvas.raster_image = image
     else:
-        # Calculate the angles for the branches
-        left_angle = start_angle - (angle_delta / 2)
-        right_angle = start_angle + (angle_delta / 2)
-        angles = np.linspace(left_angle, right_angle, n_splits)
-        # For each angle, draw a branch and recursively call the function
-        for angle in angles:
-            angle_rad = rad(angle)
-            end_x = (x
-                     + np.cos(angle_rad)
-                     * init_length)
-            end_y = (y
-                     + np.sin(angle_rad)
-                     * init_length)
-            draw_branch(x, y, end_x, end_y, width, get_color(n_iters, color))
-            fractal_canopy(canvas,
-                           end_x,
-                           end_y,
-                           n_iters=n_iters-1,
-                           first_iter=False,
-                           init_length=init_length * length_ratio,
-                           start_angle=np.degrees(angle_rad) + off_angle,
-                           n_splits=n_splits,
-                           angle_delta=angle_delta,
-                           off_angle=off_angle,
-                           wave_amp=wave_amp,
-                           width=width * width_ratio,
-                           width_ratio=width_ratio,
-                           color=color)
+        raise ValueError(f"Unknown backend {backend!r}, expected 'canvas' or 'raster'")
@@ -0,0 +1,251 @@
+"""
+geometry_funcs.py
+
+This module contains a compact store of the branches of a fractal canopy,
+so that a drawn tree can be queried (hit-tested, re-colored, compared with
+a target) without going through the canvas.
+
+The branches are kept as a struct of arrays: one float32 array per coordinate
+field, a uint8 depth and an int32 parent index per branch, about 33 bytes per
+branch in total. Branches are ordered by depth, and the children of a branch
+are contiguous, so a whole generation or the children of a branch are plain
+slices of the arrays, without copying. `Branch` is a lightweight view of a
+single branch for code that walks the tree one branch at a time.
+
+Classes:
+    CanopyGeometry
+        The branches of a fractal canopy, stored as a struct of arrays.
+    Branch
+        A view of one branch of a CanopyGeometry.
+"""
+
+from typing import Iterator
+import numpy as np
+
+from fractal_funcs import child_keys, SEGMENT_FIELDS, X0, Y0, X1, Y1, ANGLE, LENGTH, WIDTH, DEPTH, KEY
+
+# The float fields of a CanopyGeometry, in the order of the segment table
+FLOAT_FIELDS = SEGMENT_FIELDS[:DEPTH]
+
+
+class CanopyGeometry:
+    """
+    The branches of a fractal canopy, stored as a struct of arrays.
+
+    Attributes:
+        data (np.ndarray): A (len(FLOAT_FIELDS), n_branches) float32 array; every row is
+            one field (x0, y0, x1, y1, angle, length, width) and is contiguous.
+        depth (np.ndarray): The uint8 depth of every branch (0 for the trunk).
+        parent (np.ndarray): The int32 index of the parent of every branch, or -1 for the trunk.
+        depth_offsets (np.ndarray): The index of the first branch of every depth, followed by
+            the number of branches; the branches of depth d are depth_offsets[d]:depth_offsets[d + 1].
+    """
+
+    __slots__ = ("data", "depth", "parent", "depth_offsets")
+
+    def __init__(self, data: np.ndarray, depth: np.ndarray, parent: np.ndarray, depth_offsets: np.ndarray):
+        self.data = data
+        self.depth = depth
+        self.parent = parent
+        self.depth_offsets = depth_offsets
+
+    @classmethod
+    def from_segments(cls, segments: np.ndarray, n_splits: int | None = None) -> "CanopyGeometry":
+        """
+        Builds the store from a segment table, e.g. from `fractal_funcs.canopy_segments`.
+
+        The parents are taken from the structure of the table, not from the coordinates of
+        the branches, which many branches share when the angle between branches is 0:
+        the rows of a depth are the children of the branches of the previous depth, n_splits
+        per branch, in the order of their parents. Where branches were culled, the k-th group
+        of children starting at a point belongs to the k-th branch of the previous depth ending
+        there; branches ending at the same point are culled alike. The branches of randomized
+        canopies are matched to their parents by path key instead (see `fractal_funcs.child_keys`),
+        so those tables may have dropped branches and rows in any order.
+
+        Args:
+            segments (np.ndarray): A segment table with the columns of SEGMENT_FIELDS.
+            n_splits (int, optional): The number of branches every branch splits into. Defaults to
+                None, which takes it from the number of branches of every depth.
+
+        Returns:
+            CanopyGeometry: The branches, ordered by depth and, within a depth, by parent.
+        """
+        depths = segments[:, DEPTH].astype(np.int64)
+        n_depths = int(depths.max()) + 1 if len(depths) else 0
+        if n_depths > 256:
+            raise ValueError("A CanopyGeometry holds at most 256 generations")
+        counts = np.bincount(depths, minlength=n_depths)
+        depth_offsets = np.concatenate(([0], np.cumsum(counts)))
+        by_depth = np.argsort(depths, kind="stable")
+        keyed = bool((segments[:, KEY] != 0).any())
+        guessed = n_splits is None
+        if guessed:
+            # With dropped branches this is only a lower bound, raised below if some key is not found
+            n_splits = max([int(-(-counts[depth] // max(counts[depth - 1], 1))) for depth in range(1, n_depths)],
+                           default=1)
+
+        # The trunks keep their order; every later generation is sorted by parent
+        order = by_depth.copy()
+        parent = np.full(len(segments), -1, dtype=np.int32)
+        for depth in range(1, n_depths):
+            start, stop = depth_offsets[depth], depth_offsets[depth + 1]
+            rows = by_depth[start:stop]
+            previous = order[depth_offsets[depth - 1]:start]
+            if keyed:
+                parents = _parents_by_key(segments, rows, previous, n_splits)
+                while parents is None and guessed and n_splits < len(rows):
+                    n_splits *= 2
+                    parents = _parents_by_key(segments, rows, previous, n_splits)
+            elif len(rows) == len(previous) * n_splits:
+                parents = np.arange(len(rows)) // n_splits
+            else:
+                parents = _parents_of_culled(segments, rows, previous, n_splits)
+            if parents is None:
+                raise ValueError(f"Some branches of depth {depth} are not children of branches of depth {depth - 1}")
+            parents = parents + depth_offsets[depth - 1]
+            by_parent = np.argsort(parents, kind="stable")
+            order[start:stop] = rows[by_parent]
+            parent[start:stop] = parents[by_parent]
+
+        data = np.ascontiguousarray(segments[order, :DEPTH].T, dtype=np.float32)
+        return cls(data, depths[order].astype(np.uint8), parent, depth_offsets)
+
+    def __len__(self) -> int:
+        return len(self.depth)
+
+    def __getitem__(self, index: int) -> "Branch":
+        if not -len(self) <= index < len(self):
+            raise IndexError("branch index out of range")
+        return Branch(self, index % len(self))
+
+    def __iter__(self) -> Iterator["Branch"]:
+        return (Branch(self, index) for index in range(len(self)))
+
+    @property
+    def nbytes(self) -> int:
+        """The memory used by the arrays, in bytes."""
+        return self.data.nbytes + self.depth.nbytes + self.parent.nbytes + self.depth_offsets.nbytes
+
+    @property
+    def n_generations(self) -> int:
+        """The number of depths that have branches."""
+        return len(self.depth_offsets) - 1
+
+    def field(self, name: str) -> np.ndarray:
+        """Returns the float32 array of one of FLOAT_FIELDS, without copying."""
+        return self.data[FLOAT_FIELDS.index(name)]
+
+    def generation(self, depth: int) -> slice:
+        """Returns the slice of the branches of one depth, e.g. `geometry.data[:, geometry.generation(2)]`."""
+        return slice(int(self.depth_offsets[depth]), int(self.depth_offsets[depth + 1]))
+
+    def children(self, index: int) -> slice:
+        """Returns the slice of the children of a branch."""
+        depth = int(self.depth[index])
+        if depth + 1 >= self.n_generations:
+            return slice(len(self), len(self))
+        next_generation = self.generation(depth + 1)
+        parents = self.parent[next_generation]
+        return slice(next_generation.start + int(np.searchsorted(parents, index, side="left")),
+                     next_generation.start + int(np.searchsorted(parents, index, side="right")))
+
+    def segments(self) -> np.ndarray:
+        """Returns the branches as a float64 segment table, ordered as in the store, without path keys."""
+        table = np.zeros((len(self), len(SEGMENT_FIELDS)))
+        table[:, :DEPTH] = self.data.T
+        table[:, DEPTH] = self.depth
+        return table
+
+
+def _parents_by_key(segments: np.ndarray, rows: np.ndarray, previous: np.ndarray, n_splits: int) -> np.ndarray | None:
+    """
+    Returns the position in `previous` of the parent of every row of a randomized canopy,
+    whose path keys are those of `child_keys`, or None if some row is not a child of `previous`.
+    """
+    expected = child_keys(segments[previous, KEY], n_splits)
+    if not len(expected):
+        return None if len(rows) else np.zeros(0, dtype=np.int64)
+    sorted_expected = np.argsort(expected, kind="stable")
+    keys = segments[rows, KEY]
+    found = sorted_expected[np.minimum(np.searchsorted(expected[sorted_expected], keys), len(expected) - 1)]
+    if (expected[found] != keys).any():
+        return None
+    return found // n_splits
+
+
+def _parents_of_culled(segments: np.ndarray, rows: np.ndarray, previous: np.ndarray, n_splits: int) -> np.ndarray | None:
+    """
+    Returns the position in `previous` of the parent of every row of a generation in which some
+    branches were not subdivided, or None if the rows do not come in groups of children.
+    The k-th group of n_splits rows starting at a point is given the k-th branch ending there.
+    """
+    if n_splits < 1 or len(rows) % n_splits:
+        return None
+    groups = rows[::n_splits]
+    starts = segments[groups, X0] + 1j * segments[groups, Y0]
+    if (np.repeat(starts, n_splits) != segments[rows, X0] + 1j * segments[rows, Y0]).any():
+        return None
+    ends = segments[previous, X1] + 1j * segments[previous, Y1]
+    ends_order = np.argsort(ends, kind="stable")
+    starts_order = np.argsort(starts, kind="stable")
+    sorted_ends, sorted_starts = ends[ends_order], starts[starts_order]
+    # The rank of every group among the groups starting at the same point
+    rank = np.arange(len(groups)) - np.searchsorted(sorted_starts, sorted_starts)
+    found = np.searchsorted(sorted_ends, sorted_starts) + rank
+    if (found >= len(ends)).any() or (sorted_ends[np.minimum(found, len(ends) - 1)] != sorted_starts).any():
+        return None
+    group_parents = np.empty(len(groups), dtype=np.int64)
+    group_parents[starts_order] = ends_order[found]
+    return np.repeat(group_parents, n_splits)
+
+
+class Branch:
+    """
+    A view of one branch of a CanopyGeometry. It holds no data of its own.
+
+    Attributes:
+        geometry (CanopyGeometry): The store the branch belongs to.
+        index (int): The index of the branch in the store.
+    """
+
+    __slots__ = ("geometry", "index")
+
+    def __init__(self, geometry: CanopyGeometry, index: int):
+        self.geometry = geometry
+        self.index = index
+
+    def __repr__(self) -> str:
+        return (f"Branch({self.index}, depth={self.depth}, "
+                f"({self.x0:.2f}, {self.y0:.2f}) -> ({self.x1:.2f}, {self.y1:.2f}))")
+
+    def __eq__(self, other) -> bool:
+        return (isinstance(other, Branch) and other.geometry is self.geometry
+                and other.index == self.index)
+
+    def __hash__(self) -> int:
+        return hash((id(self.geometry), self.index))
+
+    x0 = property(lambda self: float(self.geometry.data[X0, self.index]))
+    y0 = property(lambda self: float(self.geometry.data[Y0, self.index]))
+    x1 = property(lambda self: float(self.geometry.data[X1, self.index]))
+    y1 = property(lambda self: float(self.geometry.data[Y1, self.index]))
+    angle = property(lambda self: float(self.geometry.data[ANGLE, self.index]))
+    length = property(lambda self: float(self.geometry.data[LENGTH, self.index]))
+    width = property(lambda self: float(self.geometry.data[WIDTH, self.index]))
+
+    @property
+    def depth(self) -> int:
+        return int(self.geometry.depth[self.index])
+
+    @property
+    def parent(self) -> "Branch | None":
+        """The parent branch, or None for the trunk."""
+        parent = int(self.geometry.parent[self.index])
+        return Branch(self.geometry, parent) if parent >= 0 else None
+
+    @property
+    def children(self) -> list["Branch"]:
+        """The child branches."""
+        children = self.geometry.children(self.index)
+        return [Branch(self.geometry, index) for index in range(children.start, children.stop)]
@@ -2,9 +2,19 @@
 Initialization module for the GUI package.
 
 This module imports and exposes functions for initializing the GUI,
-creating sliders, and binding canvas zoom events.
+creating sliders, binding canvas zoom events, drawing canopies
+with level of detail, redrawing them when the sliders move,
+highlighting the branch under the mouse, playing canopy animations,
+keeping the scene in a geometry store from one launch to the next
+and showing the profiling instrumentation on the canvas.
 """
 
 from gui.gui_init import initialise_gui
 from gui.sliders import populate_sliders
 from gui.zoom import bind_canvas_zoom_events
+from gui.canopy_view import draw_lod_canopy
+from gui.redraw import bind_slider_redraw
+from gui.hover import bind_branch_hover
+from gui.animation import play_canopy_animation
+from gui.scene import restore_sliders, bind_scene_store
+from gui.profile_overlay import show_profile_overlay
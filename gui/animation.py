@@ -0,0 +1,115 @@
+"""
+Animation
+=========
+Module for playing canopy animations from `animation_funcs` on a canvas.
+
+Frames are drawn through a `CanopyView`, one per `after()` tick, so the event loop keeps running
+between frames and panning and zooming work during the animation. The view keeps its items from
+frame to frame: only the branches that moved get new coordinates, only those whose color changed
+are reconfigured, and items are only created or deleted when the number of branches changes.
+Frames are taken from the generator as they are played, so an animation of any length plays in
+constant memory.
+
+Classes:
+        CanopyAnimation: Plays the frames of a canopy animation on a canopy view.
+
+Functions:
+        play_canopy_animation(canvas, frames, interval_ms, on_done): Plays a canopy animation on a canvas.
+"""
+import tkinter as tk
+from typing import Callable, Iterator
+
+from animation_funcs import CanopyFrame
+from cache_funcs import GROWTH_PARAMS
+from gui.canopy_view import CanopyView
+
+# Time between two frames, in milliseconds
+FRAME_INTERVAL_MS = 40
+
+
+class CanopyAnimation:
+    """
+    Plays the frames of a canopy animation on a canopy view.
+
+    Attributes:
+        view (CanopyView): The view on which the frames are drawn.
+        frames (Iterator): The frames still to play, e.g. from `animation_funcs.morph_frames`.
+        interval_ms (int): The time between two frames.
+        on_done (Callable): Called without arguments after the last frame.
+        frame (CanopyFrame): The frame shown last, or None before the first one.
+    """
+
+    def __init__(
+        self,
+        view: CanopyView,
+        frames: Iterator[CanopyFrame],
+        interval_ms: int = FRAME_INTERVAL_MS,
+        on_done: Callable[[], None] | None = None,
+    ):
+        self.view = view
+        self.frames = iter(frames)
+        self.interval_ms = interval_ms
+        self.on_done = on_done
+        self.frame = None
+        self._after_id = None
+
+    @property
+    def playing(self) -> bool:
+        """Whether the next frame is scheduled."""
+        return self._after_id is not None
+
+    def start(self) -> None:
+        """Shows the next frame now and the following ones every `interval_ms`."""
+        self.stop()
+        self._show_next()
+
+    def stop(self) -> None:
+        """Stops the animation after the frame shown last; `start` resumes it."""
+        if self._after_id is not None:
+            self.view.canvas.after_cancel(self._after_id)
+            self._after_id = None
+
+    def _show_next(self) -> None:
+        self._after_id = None
+        frame = next(self.frames, None)
+        if frame is None:
+            if self.on_done is not None:
+                self.on_done()
+            return
+        self.frame = frame
+        # The view holds the frame's table, which the next frame overwrites in place;
+        # the update after that moves the items whose branches changed
+        self.view.set_canopy(frame.segments, frame.n_iters, frame.color, frame.wave_amp,
+                             growth_params={name: frame.params[name] for name in GROWTH_PARAMS
+                                            if name in frame.params})
+        self.view.trim()
+        self.view.refresh()
+        self._after_id = self.view.canvas.after(self.interval_ms, self._show_next)
+
+
+def play_canopy_animation(
+    canvas: tk.Canvas,
+    frames: Iterator[CanopyFrame],
+    interval_ms: int = FRAME_INTERVAL_MS,
+    on_done: Callable[[], None] | None = None,
+    view: CanopyView | None = None,
+) -> CanopyAnimation:
+    """
+    Plays a canopy animation on a canvas, one frame every `interval_ms`.
+
+    Parameters:
+        canvas (tk.Canvas): The canvas on which to play the animation.
+        frames (Iterator): The frames, e.g. from `animation_funcs.morph_frames` or `growth_frames`.
+        interval_ms (int): The time between two frames. Defaults to FRAME_INTERVAL_MS.
+        on_done (Callable, optional): Called without arguments after the last frame. Defaults to None.
+        view (CanopyView, optional): The view on which to draw the frames, whose items are reused,
+            e.g. the `view` of the `CanopyRedraw` from `bind_slider_redraw`. Defaults to None,
+            which creates one.
+
+    Returns:
+        CanopyAnimation: The animation, which can be stopped and resumed.
+    """
+    animation = CanopyAnimation(view if view is not None else CanopyView(canvas, min_pixels=0.5),
+                                frames, interval_ms, on_done)
+    animation.start()
+    return animation
@@ -0,0 +1,377 @@
+"""
+Canopy View
+===========
+Module for drawing fractal canopies on a zoomable canvas with level of detail.
+
+Subtrees that would be smaller than a few pixels at the current zoom scale, or that lie
+entirely outside the visible part of the canvas, are not generated. They are remembered
+instead, and grown on demand once the user zooms or pans far enough for them to become visible.
+
+The generated branches are kept in model coordinates (those of the canvas before any zooming),
+and only the branches in view have canvas items. On the redraw following a pan or zoom, items
+are created for branches that came into view and deleted for those that left it, and the items
+that stay are re-projected through the view transform in one batch and moved with `canvas.coords`.
+The drawing cost therefore follows what can actually be seen rather than everything that has
+been generated so far.
+
+Replacing the canopy, e.g. when a slider moves, does not delete its items either. The items are
+kept per branch index and brought in line with the new table on the following updates: only
+branches whose geometry changed get new coordinates, only those whose color changed are
+reconfigured, and items are only created or deleted when the number of branches changes.
+
+Classes:
+        CanopyView: The canopy shown on a canvas, kept in sync with its view.
+
+Functions:
+        draw_lod_canopy(canvas, x, y, ...): Draws a fractal canopy that refines itself as the canvas is zoomed.
+"""
+import time
+import tkinter as tk
+import numpy as np
+
+import profile_funcs
+from fractal_funcs import (canopy_segments, grow_canopy, draw_canopy_segments, depth_colors,
+                           segment_coordinates, subtree_extent, segments_in_viewport,
+                           transform_segments, SEGMENT_FIELDS, LENGTH, WIDTH, DEPTH)
+from gui.zoom import get_view_transform, visible_region, add_view_listener, VIEW_TAG
+
+
+def _to_canvas_coordinates(canvas: tk.Canvas, segments: np.ndarray) -> tuple[np.ndarray, float]:
+    """Maps segments from model to canvas coordinates, returning them with the view scale."""
+    scale, offset_x, offset_y = get_view_transform(canvas)
+    return transform_segments(segments, scale, offset_x, offset_y), scale
+
+
+# Number of items created between two checks of the time budget
+ITEMS_PER_CHECK = 256
+# Time the canvas may spend creating items before control returns to the event loop, in milliseconds
+FRAME_BUDGET_MS = 12
+
+
+def _padded(viewport: tuple[float, float, float, float], padding: float) -> tuple[float, float, float, float]:
+    x_min, y_min, x_max, y_max = viewport
+    return x_min - padding, y_min - padding, x_max + padding, y_max + padding
+
+
+def _same_colors(color: str | list | np.ndarray, other: str | list | np.ndarray) -> bool:
+    """Tells whether two `color` arguments of `draw_canopy_segments` are the same."""
+    if isinstance(color, str) or isinstance(other, str):
+        return color == other if isinstance(color, str) and isinstance(other, str) else False
+    return color is other or np.array_equal(np.asarray(color), np.asarray(other))
+
+
+class CanopyView:
+    """
+    The canopy shown on a canvas, kept in sync with the view of the canvas.
+
+    The view holds a segment table in model coordinates and the canvas items of the
+    rows currently shown. `update` brings the items in line with the table and the view
+    transform: it grows the frontier (if the canopy was generated with culling), deletes
+    the items of rows that left the view, re-projects the items that stay and creates
+    items for the rows that came into view. It is called on the redraw after every pan
+    or zoom, and can be given a deadline so that large canopies are drawn over several
+    calls, coarse generations first; `refresh` does that from the Tkinter event loop.
+    The frontier is only grown again once the view has moved, and an update when neither
+    the table nor the view changed since the last complete one returns at once.
+
+    The items are pooled by row. When the canopy is replaced, the items of the rows it had
+    are kept, including those beyond the end of the new table, which are reused when the
+    table is extended; `update` only changes what differs from what the items show, and
+    `trim` deletes the items left over once the new table is complete.
+
+    Attributes:
+        canvas (tk.Canvas): The canvas on which the canopy is drawn.
+        min_pixels (float): The smallest subtree extent in pixels that is drawn.
+        segments (np.ndarray): The segment table in model coordinates.
+        item_ids (np.ndarray): The canvas item of every row, or 0 if the row is not drawn.
+            It may be longer than the segment table while items of a previous canopy are kept.
+        item_segments (np.ndarray): The rows, in model coordinates, that the items show.
+        item_fills (np.ndarray): The colors of the items.
+        version (int): Incremented whenever the segment table changes, by `set_canopy` or `extend`.
+        replaced_version (int): The `version` set by the last `set_canopy` or `clear`. Each table
+            since then starts with the rows of the tables before it.
+        building (bool): Whether rows are still being added to the canopy with `extend`,
+            e.g. by a progressive redraw, so that indexes of the table can wait for the last rows.
+    """
+
+    def __init__(self, canvas: tk.Canvas, min_pixels: float = 1.0):
+        self.canvas = canvas
+        self.min_pixels = min_pixels
+        self.segments = np.empty((0, len(SEGMENT_FIELDS)))
+        self.item_ids = np.zeros(0, dtype=np.int64)
+        self.item_segments = np.empty((0, len(SEGMENT_FIELDS)))
+        self.item_fills = np.empty(0, dtype=object)
+        self.frontier = np.empty((0, len(SEGMENT_FIELDS)))
+        self.n_iters = 3
+        self.color = "#000000"
+        self.wave_amp = 0
+        self.growth_params = {}
+        self.version = 0
+        self.replaced_version = 0
+        self.building = False
+        self._drawn_transform = None
+        self._drawn_wave_amp = 0
+        # The view the frontier was last grown for, and the state of the last complete update
+        self._grown_view = None
+        self._updated_state = None
+        self._fills_changed = False
+        self._refresh_id = None
+        add_view_listener(canvas, lambda canvas: self.refresh())
+
+    def refresh(self) -> None:
+        """
+        Updates the items for at most FRAME_BUDGET_MS, and schedules the rest of the
+        update on the event loop, so that the canvas stays responsive.
+        """
+        if self._refresh_id is not None:
+            self.canvas.after_cancel(self._refresh_id)
+            self._refresh_id = None
+        if not self.update(time.perf_counter() + FRAME_BUDGET_MS / 1000):
+            self._refresh_id = self.canvas.after(1, self.refresh)
+
+    def clear(self) -> None:
+        """Deletes all items of the canopy and empties its segment table."""
+        drawn = self.item_ids[self.item_ids > 0]
+        if len(drawn):
+            self.canvas.delete(*drawn.tolist())
+            profile_funcs.count("items_deleted", len(drawn))
+        self.segments = self.segments[:0]
+        self.frontier = self.frontier[:0]
+        self._grown_view = None
+        self.version += 1
+        self.replaced_version = self.version
+        self._resize_items(0)
+
+    def trim(self) -> None:
+        """Deletes the items kept beyond the end of the segment table."""
+        leftover = self.item_ids[len(self.segments):]
+        leftover = leftover[leftover > 0]
+        if len(leftover):
+            self.canvas.delete(*leftover.tolist())
+            profile_funcs.count("items_deleted", len(leftover))
+        self._resize_items(len(self.segments))
+
+    def set_canopy(
+        self,
+        segments: np.ndarray,
+        n_iters: int,
+        color: str | list = "#000000",
+        wave_amp: float = 0,
+        frontier: np.ndarray | None = None,
+        growth_params: dict | None = None,
+    ) -> None:
+        """
+        Replaces the canopy. The items are brought in line with it by the following calls to `update`.
+
+        Args:
+            segments (np.ndarray): The segment table in model coordinates.
+            n_iters (int): The number of iterations of the canopy.
+            color (str or list, optional): The color or colors of the branches. Defaults to black.
+            wave_amp (float, optional): The amplitude of the sine wave segments. Defaults to 0.
+            frontier (np.ndarray, optional): The branches whose subtrees were culled
+                and should be grown when they become visible. Defaults to none.
+            growth_params (dict, optional): The `grow_canopy` arguments used to grow the
+                frontier: off_angle, angle_delta, n_splits, length_ratio and width_ratio,
+                and the random variation of a randomized canopy.
+        """
+        if n_iters != self.n_iters or not _same_colors(color, self.color):
+            self._fills_changed = True
+        self.n_iters = n_iters
+        self.color = color
+        self.wave_amp = wave_amp
+        self.growth_params = growth_params or {}
+        self.segments = segments
+        self.frontier = frontier if frontier is not None else self.frontier[:0]
+        self._grown_view = None
+        self.version += 1
+        self.replaced_version = self.version
+        self._resize_items(max(len(segments), len(self.item_ids)))
+
+    def extend(self, segments: np.ndarray, frontier: np.ndarray | None = None) -> None:
+        """
+        Replaces the segment table by one that starts with the rows of the current one,
+        e.g. the same canopy with more iterations. The items of the current rows are kept.
+        """
+        if (self.item_ids[len(self.segments):len(segments)] > 0).any():
+            # Items kept from a previous canopy may have the colors of another depth
+            self._fills_changed = True
+        self.segments = segments
+        self.version += 1
+        self._resize_items(max(len(segments), len(self.item_ids)))
+        if frontier is not None:
+            self.frontier = frontier
+            self._grown_view = None
+
+    def _resize_items(self, n_rows: int) -> None:
+        """Truncates or pads the item arrays to `n_rows` rows."""
+        added = n_rows - len(self.item_ids)
+        if added <= 0:
+            self.item_ids = self.item_ids[:n_rows]
+            self.item_segments = self.item_segments[:n_rows]
+            self.item_fills = self.item_fills[:n_rows]
+            return
+        self.item_ids = np.concatenate((self.item_ids, np.zeros(added, dtype=np.int64)))
+        self.item_segments = np.concatenate((self.item_segments,
+                                             np.zeros((added, len(SEGMENT_FIELDS)))))
+        self.item_fills = np.concatenate((self.item_fills, np.empty(added, dtype=object)))
+
+    @profile_funcs.timed("view_update")
+    def update(self, deadline: float | None = None) -> bool:
+        """
+        Brings the canvas items in line with the segment table and the view of the canvas.
+
+        Args:
+            deadline (float, optional): The `time.perf_counter` value after which no more
+                items are created. Defaults to None, which creates all of them.
+
+        Returns:
+            bool: Whether all the items are up to date.
+        """
+        canvas = self.canvas
+        transform = get_view_transform(canvas)
+        scale = transform[0]
+        viewport = visible_region(canvas)
+        view = (transform, viewport, self.wave_amp, self.min_pixels)
+        if (self.version, view) == self._updated_state and not self._fills_changed:
+            # Nothing moved or changed since the last complete update
+            return True
+        self._updated_state = None
+        length_ratio = self.growth_params.get("length_ratio", 0.75)
+        length_jitter = self.growth_params.get("length_jitter", 0.0)
+        # How far the drawing of a branch may reach beyond its end points
+        padding = abs(self.wave_amp) + (self.segments[:, WIDTH].max(initial=0) / 2)
+
+        # The frontier left by growing it for this view has nothing more to grow for it
+        if len(self.frontier) and view != self._grown_view:
+            grown, self.frontier = grow_canopy(self.frontier,
+                                               n_iters=self.n_iters,
+                                               view_scale=scale,
+                                               min_pixels=self.min_pixels,
+                                               viewport=_padded(viewport, padding),
+                                               **self.growth_params)
+            if len(grown):
+                self.extend(np.concatenate((self.segments, grown)))
+            self._grown_view = view
+        segments = self.segments
+        item_ids = self.item_ids[:len(segments)]
+
+        # A branch is shown if it is in view and the subtree it heads is large enough,
+        # which is the same test that decided whether its parent was subdivided
+        shown = ((segments[:, LENGTH] + subtree_extent(segments, self.n_iters, length_ratio, length_jitter)) * scale
+                 >= self.min_pixels)
+        shown &= segments_in_viewport(segments, viewport, abs(self.wave_amp) + segments[:, WIDTH] / 2)
+        drawn = item_ids > 0
+
+        hidden = drawn & ~shown
+        if hidden.any():
+            canvas.delete(*item_ids[hidden].tolist())
+            profile_funcs.count("items_deleted", int(hidden.sum()))
+            item_ids[hidden] = 0
+        kept = np.flatnonzero(drawn & shown)
+        if transform != self._drawn_transform or self.wave_amp != self._drawn_wave_amp:
+            moved = kept
+        else:
+            moved = kept[(self.item_segments[kept] != segments[kept]).any(axis=1)]
+        if len(moved):
+            projected, _ = _to_canvas_coordinates(canvas, segments[moved])
+            for item_id, coords in zip(item_ids[moved].tolist(),
+                                       segment_coordinates(projected, self.wave_amp * scale)):
+                canvas.coords(item_id, coords)
+            profile_funcs.count("items_moved", len(moved))
+            resized = self.item_segments[moved, WIDTH] != segments[moved, WIDTH]
+            for item_id, branch_width in zip(item_ids[moved][resized].tolist(),
+                                             projected[resized, WIDTH].tolist()):
+                canvas.itemconfigure(item_id, width=branch_width)
+            self.item_segments[moved] = segments[moved]
+        if self._fills_changed and len(kept):
+            fills = np.array(depth_colors(segments[kept, DEPTH], self.n_iters, self.color), dtype=object)
+            recolored = fills != self.item_fills[kept]
+            for item_id, fill in zip(item_ids[kept][recolored].tolist(), fills[recolored].tolist()):
+                canvas.itemconfigure(item_id, fill=fill)
+            profile_funcs.count("items_recolored", int(recolored.sum()))
+            self.item_fills[kept] = fills
+        self._fills_changed = False
+        self._drawn_transform = transform
+        self._drawn_wave_amp = self.wave_amp
+
+        # Rows are ordered generation by generation, so coarse levels are drawn first
+        exposed = np.flatnonzero(shown & ~drawn)
+        for start in range(0, len(exposed), ITEMS_PER_CHECK):
+            # At least one chunk is drawn per call, so that repeated calls always make progress
+            if start and deadline is not None and time.perf_counter() > deadline:
+                return False
+            rows = exposed[start:start + ITEMS_PER_CHECK]
+            projected, _ = _to_canvas_coordinates(canvas, segments[rows])
+            item_ids[rows] = draw_canopy_segments(canvas, projected, self.n_iters, self.color,
+                                                  wave_amp=self.wave_amp * scale,
+                                                  tags=VIEW_TAG)
+            self.item_segments[rows] = segments[rows]
+            self.item_fills[rows] = depth_colors(segments[rows, DEPTH], self.n_iters, self.color)
+        self._updated_state = (self.version, view)
+        return True
+
+
+def draw_lod_canopy(
+    canvas: tk.Canvas,
+    x: float,
+    y: float,
+    off_angle: float = 0,
+    angle_delta: float = 10,
+    start_angle: float = -90,
+    n_splits: int = 2,
+    n_iters: int = 3,
+    length_ratio: float = 0.75,
+    init_length: float = 200,
+    wave_amp: float = 0,
+    width: float = 1,
+    width_ratio: float = 0.75,
+    color="#000000",
+    min_pixels: float = 1.0,
+    angle_jitter: float = 0.0,
+    length_jitter: float = 0.0,
+    width_jitter: float = 0.0,
+    branch_drop: float = 0.0,
+    seed: int | np.random.Generator | None = None,
+) -> CanopyView:
+    """
+    Draws a fractal canopy whose culled subtrees are refined when the canvas is zoomed or panned.
+
+    The parameters are those of `fractal_funcs.fractal_canopy`, in the coordinates the canvas
+    had before any zooming. Subtrees spanning fewer than `min_pixels` pixels at the current
+    zoom scale, or lying outside the visible region, are skipped; after every pan or zoom,
+    the skipped subtrees that have become large enough and visible are grown, and the canvas
+    items are brought in line with the branches in view and the view transform.
+
+    Parameters:
+        canvas (tk.Canvas): The canvas on which to draw. Its zoom events should be bound
+            with `bind_canvas_zoom_events`.
+        x, y, off_angle, angle_delta, start_angle, n_splits, n_iters, length_ratio,
+        init_length, wave_amp, width, width_ratio, color: See `fractal_funcs.fractal_canopy`.
+        min_pixels (float): The smallest subtree extent in pixels that is drawn. Defaults to 1.
+        angle_jitter, length_jitter, width_jitter, branch_drop, seed: The random variation of
+            the branches, see `fractal_funcs.canopy_segments`. Culled subtrees grown later
+            come out as they would have in the whole canopy.
+
+    Returns:
+        CanopyView: The view that keeps the canopy in sync with the canvas.
+    """
+    growth_params = dict(off_angle=off_angle, angle_delta=angle_delta, n_splits=n_splits,
+                         length_ratio=length_ratio, width_ratio=width_ratio,
+                         angle_jitter=angle_jitter, length_jitter=length_jitter,
+                         width_jitter=width_jitter, branch_drop=branch_drop)
+    view = CanopyView(canvas, min_pixels)
+    scale, _, _ = get_view_transform(canvas)
+    segments, frontier = canopy_segments(x, y,
+                                         start_angle=start_angle,
+                                         n_iters=n_iters,
+                                         init_length=init_length,
+                                         width=width,
+                                         view_scale=scale,
+                                         min_pixels=min_pixels,
+                                         viewport=_padded(visible_region(canvas), abs(wave_amp) + width / 2),
+                                         return_frontier=True,
+                                         seed=seed,
+                                         **growth_params)
+    view.set_canopy(segments, n_iters, color, wave_amp, frontier, growth_params)
+    view.update()
+    return view
@@ -0,0 +1,158 @@
+"""
+Hover
+=====
+Module for finding and highlighting the branch of a canopy under the mouse.
+
+The branches of the canopy shown in a `CanopyView` are indexed in a `spatial_funcs.SegmentGrid`
+in model coordinates, so the index does not change when the canvas is panned or zoomed: the mouse
+position is mapped to model coordinates through the inverse of the view transform instead, and the
+picking radius is divided by the view scale, so that it stays the same number of pixels at any zoom.
+Only the branches that have canvas items can be picked. The index is rebuilt lazily, on the first
+motion event after the canopy changed, so a motion event costs one grid lookup. While a redraw is
+still adding generations to the canopy, the index of its first rows is kept, and the index is
+only rebuilt once the canopy is complete.
+
+The hovered branch is highlighted by a line item over it, tagged with the view tag and re-projected
+by a view listener, like the items of the canopy itself.
+
+Classes:
+        BranchPicker: Finds the branch of a canopy view under the mouse and highlights it.
+
+Functions:
+        bind_branch_hover(canvas, view, on_hover, radius): Highlights the branch under the mouse.
+"""
+import tkinter as tk
+from typing import Callable
+
+import numpy as np
+
+from fractal_funcs import X0, Y0, X1, Y1, WIDTH
+from spatial_funcs import SegmentGrid
+from gui.canopy_view import CanopyView
+from gui.zoom import get_view_transform, add_view_listener, VIEW_TAG
+
+# Largest distance between the mouse and a branch for the branch to be picked, in pixels
+HOVER_PIXELS = 6
+# Tag of the highlight item
+HOVER_TAG = "hover"
+
+
+class BranchPicker:
+    """
+    Finds the branch of a canopy view under the mouse and highlights it.
+
+    Attributes:
+        view (CanopyView): The canopy whose branches are picked.
+        radius (float): The largest distance between the mouse and a picked branch, in pixels.
+        on_hover (Callable): Called with the row index and segment table row of the newly
+            hovered branch, or with -1 and None when the mouse leaves the branches.
+        highlight (str): The color of the highlight, or "" for no highlight.
+        hovered (int): The row index of the hovered branch, or -1.
+        grid (SegmentGrid): The index of the branches of the view, or None before the first lookup.
+    """
+
+    def __init__(
+        self,
+        view: CanopyView,
+        radius: float = HOVER_PIXELS,
+        on_hover: Callable[[int, np.ndarray | None], None] | None = None,
+        highlight: str = "#ff8800",
+    ):
+        self.view = view
+        self.radius = radius
+        self.on_hover = on_hover
+        self.highlight = highlight
+        self.hovered = -1
+        self.grid = None
+        # The view version the grid was built for
+        self._indexed = -1
+        self._highlight_id = 0
+        add_view_listener(view.canvas, lambda canvas: self._place_highlight())
+
+    def _current_grid(self) -> SegmentGrid:
+        """Returns the index of the branches of the view, rebuilding it if the canopy changed."""
+        view = self.view
+        if self._indexed == view.version:
+            return self.grid
+        if view.building and self.grid is not None and self._indexed >= view.replaced_version:
+            # The grid indexes the first rows of the canopy being built: these can be picked
+            # until the build finishes, instead of rebuilding the grid for every batch of rows
+            return self.grid
+        self.grid = SegmentGrid.from_segments(view.segments, margin=view.wave_amp)
+        self._indexed = view.version
+        return self.grid
+
+    def pick(self, canvas_x: float, canvas_y: float) -> tuple[int, float]:
+        """
+        Finds the drawn branch closest to a point of the canvas, within `radius` pixels.
+
+        Parameters:
+            canvas_x (float): The x-coordinate of the point, in canvas coordinates.
+            canvas_y (float): The y-coordinate of the point, in canvas coordinates.
+
+        Returns:
+            tuple: The row index of the branch and its distance in pixels, or (-1, inf).
+        """
+        grid = self._current_grid()
+        scale, offset_x, offset_y = get_view_transform(self.view.canvas)
+        drawn = self.view.item_ids[:len(grid)] > 0
+        index, distance = grid.nearest((canvas_x - offset_x) / scale, (canvas_y - offset_y) / scale,
+                                       self.radius / scale, drawn)
+        return index, distance * scale
+
+    def on_motion(self, event: tk.Event) -> None:
+        """Highlights the branch under the mouse, and reports it if it changed."""
+        canvas = self.view.canvas
+        index, _ = self.pick(canvas.canvasx(event.x), canvas.canvasy(event.y))
+        if index == self.hovered:
+            return
+        self.hovered = index
+        self._place_highlight()
+        if self.on_hover is not None:
+            self.on_hover(index, self.view.segments[index] if index >= 0 else None)
+
+    def _place_highlight(self) -> None:
+        """Draws the highlight over the hovered branch, through the current view transform."""
+        canvas = self.view.canvas
+        if self.hovered < 0 or self.hovered >= len(self.view.segments) or not self.highlight:
+            if self._highlight_id:
+                canvas.delete(self._highlight_id)
+                self._highlight_id = 0
+            return
+        scale, offset_x, offset_y = get_view_transform(canvas)
+        row = self.view.segments[self.hovered]
+        coordinates = (row[X0] * scale + offset_x, row[Y0] * scale + offset_y,
+                       row[X1] * scale + offset_x, row[Y1] * scale + offset_y)
+        # Branch widths are in pixels, so the highlight is a fixed number of pixels wider
+        width = max(row[WIDTH], 1) + 2
+        if self._highlight_id:
+            canvas.coords(self._highlight_id, *coordinates)
+            canvas.itemconfigure(self._highlight_id, width=width)
+        else:
+            self._highlight_id = canvas.create_line(*coordinates, fill=self.highlight, width=width,
+                                                    capstyle=tk.ROUND, tags=(VIEW_TAG, HOVER_TAG))
+
+
+def bind_branch_hover(
+    canvas: tk.Canvas,
+    view: CanopyView,
+    on_hover: Callable[[int, np.ndarray | None], None] | None = None,
+    radius: float = HOVER_PIXELS,
+) -> BranchPicker:
+    """
+    Highlights the branch of a canopy under the mouse.
+
+    Parameters:
+        canvas (tk.Canvas): The canvas on which the canopy is drawn.
+        view (CanopyView): The canopy, e.g. the `view` of the `CanopyRedraw` from `bind_slider_redraw`.
+        on_hover (Callable, optional): Called with the row index and segment table row of the newly
+            hovered branch, or with -1 and None when the mouse leaves the branches. Defaults to None.
+        radius (float): The largest distance between the mouse and a picked branch, in pixels.
+            Defaults to HOVER_PIXELS.
+
+    Returns:
+        BranchPicker: The picker, e.g. to pick branches at other points.
+    """
+    picker = BranchPicker(view, radius, on_hover)
+    canvas.bind("<Motion>", picker.on_motion, add="+")
+    return picker
@@ -0,0 +1,70 @@
+"""
+Profile Overlay
+===============
+Module for showing the instrumentation of `profile_funcs` on the canvas itself.
+
+The overlay is a text item in the top left corner of the canvas, updated a few times per second with
+the time of the last frame (the longest of the last zoom redraw and the last drawing slice), the number
+of items on the canvas, and the branches generated and cache hits so far. It is tagged with the view tag,
+so zooming does not scale it, and is moved back to the corner on every update, so panning does not move
+it away.
+
+Functions:
+        show_profile_overlay(canvas, interval_ms): Switches the instrumentation on and shows it on the canvas.
+"""
+import tkinter as tk
+
+import profile_funcs
+from gui.zoom import VIEW_TAG
+
+# Tag of the overlay text item
+OVERLAY_TAG = "profile_overlay"
+# Time between two updates of the overlay, in milliseconds
+OVERLAY_MS = 250
+# The phases that make up a frame of the event loop
+FRAME_PHASES = ("zoom_frame", "redraw_step")
+
+
+def overlay_text(item_count: int) -> str:
+    """
+    Returns the text of the overlay from the instrumentation recorded so far.
+
+    Parameters:
+        item_count (int): The number of items on the canvas, not counting the overlay.
+    """
+    stats = profile_funcs.stats()
+    phases = [stats["phases"][name] for name in FRAME_PHASES if name in stats["phases"]]
+    counters = stats["counters"]
+    if phases:
+        last = max(phases, key=lambda totals: totals["last_end_ms"])
+        frame = f"frame {last['last_ms']:.1f} ms (max {max(totals['max_ms'] for totals in phases):.1f} ms)"
+    else:
+        frame = "frame -"
+    return (f"{frame} | items {item_count}"
+            f" | generated {counters.get('branches_generated', 0)}"
+            f" | cache {counters.get('cache_hits', 0)} hits / {counters.get('cache_misses', 0)} misses")
+
+
+def show_profile_overlay(canvas: tk.Canvas, interval_ms: int = OVERLAY_MS) -> int:
+    """
+    Switches the instrumentation on and shows it in the top left corner of the canvas.
+
+    Parameters:
+        canvas (tk.Canvas): The canvas on which to show the overlay.
+        interval_ms (int): The time between two updates of the overlay. Defaults to OVERLAY_MS.
+
+    Returns:
+        int: The id of the overlay text item.
+    """
+    profile_funcs.enable()
+    text_id = canvas.create_text(0, 0, anchor=tk.NW, fill="#444444", font=("TkFixedFont", 9),
+                                 tags=(VIEW_TAG, OVERLAY_TAG))
+
+    def update():
+        canvas.coords(text_id, canvas.canvasx(4), canvas.canvasy(4))
+        canvas.itemconfigure(text_id, text=overlay_text(len(canvas.find_all()) - 1))
+        canvas.tag_raise(OVERLAY_TAG)
+        canvas.after(interval_ms, update)
+
+    update()
+    return text_id
@@ -0,0 +1,279 @@
+"""
+Redraw
+======
+Module for redrawing the fractal canopy whenever the sliders move.
+
+Dragging a slider produces a stream of value changes. They are debounced: the canopy is only
+rebuilt once the sliders have been still for DEBOUNCE_MS, with the values they have by then.
+A rebuild that is still in progress when newer values arrive is cancelled. The canvas items of
+the previous canopy are reused for the new one, and when only the colors changed, the geometry
+is not rebuilt at all.
+
+A rebuild never holds the Tkinter event loop for more than FRAME_BUDGET_MS at a time. It draws
+the trunk at once, while a `GeometryWorker` generates the following generations on a background
+thread. An `after()` timer takes the finished batches off the worker's queue and draws as much as
+fits in each slice, so the coarse shape of the tree appears at once, the finer generations fill
+in progressively, and panning and zooming stay responsive while a large tree is being computed.
+
+With a `store_funcs.GeometryStore`, a canopy found in the store is not generated at all: its segment
+table is mapped from the store file and handed to the cache, so that nearby trees grow from it. On the
+first rebuild, e.g. at startup, its stored preview image is shown at once while the items are created
+over the following slices, and removed once they are all drawn. `save_scene` stores the canopy shown.
+The store is looked up on every rebuild, which stays cheap on the event loop: a canopy that is not
+stored costs one failed file open, and the store keeps the canopies it has opened.
+
+Classes:
+        CanopyRedraw: Rebuilds the canopy progressively from parameters read on demand.
+
+Functions:
+        slider_canopy_params(sliders, canvas): Converts the slider values to canopy parameters.
+        bind_slider_redraw(canvas, sliders): Redraws the canopy on the canvas whenever the sliders move.
+"""
+import time
+import tkinter as tk
+from typing import Callable
+
+import numpy as np
+
+import profile_funcs
+from cache_funcs import CanopyCache, default_cache, GEOMETRY_DEFAULTS
+from color_funcs import gradient_palette, hsv_to_rgb, rgb_to_hex_array
+from fractal_funcs import rasterize_canopy_segments
+from raster_funcs import photo_image
+from store_funcs import GeometryStore, StoredCanopy
+from gui.canopy_view import CanopyView, FRAME_BUDGET_MS
+from gui.worker import GeometryWorker
+from gui.zoom import get_view_transform, add_view_listener, VIEW_TAG
+
+# Quiet time after the last slider change before the canopy is rebuilt, in milliseconds
+DEBOUNCE_MS = 40
+# Largest number of branches of a canopy drawn from the sliders
+MAX_BRANCHES = 30000
+# Number of iterations of a canopy drawn from the sliders, unless it exceeds MAX_BRANCHES
+N_ITERS = 12
+# Interval between two checks for generations from the worker thread, in milliseconds
+POLL_MS = 10
+# Tag of the preview image of a stored canopy
+PREVIEW_TAG = "preview"
+
+
+def hue_to_hex(hue: float, saturation: float = 0.75, value: float = 0.6) -> str:
+    """Converts a hue in degrees to a hex color string."""
+    return str(rgb_to_hex_array(hsv_to_rgb((hue, saturation, value))))
+
+
+def slider_canopy_params(sliders: dict[str, tk.Scale], canvas: tk.Canvas, n_iters: int = N_ITERS) -> dict:
+    """
+    Converts the values of the sliders created by `populate_sliders` to `fractal_canopy` parameters.
+
+    The canopy stands at the bottom centre of the canvas. "Initial Length" is the fraction of the
+    canvas height that the whole canopy spans, and the root and leaf colors are the hues at the
+    ends of a gradient interpolated in the perceptual OKLab space.
+    """
+    width, height = int(canvas.cget("width")), int(canvas.cget("height"))
+    length_ratio = float(sliders["Length Ratio"].get())
+    # The trunk and all the generations above it add up to init_length * (1 + r + r^2 + ...)
+    series = sum(length_ratio ** depth for depth in range(n_iters - 1))
+    return {
+        "x": width / 2,
+        "y": height - 10,
+        "off_angle": float(sliders["Angle Offset"].get()),
+        "angle_delta": float(sliders["Angle Size"].get()),
+        "n_splits": int(sliders["Number of Branches"].get()),
+        "n_iters": n_iters,
+        "length_ratio": length_ratio,
+        "init_length": float(sliders["Initial Length"].get()) * (height - 20) / series,
+        "width": 8,
+        "width_ratio": float(sliders["Width Ratio"].get()),
+        "color": gradient_palette(hue_to_hex(float(sliders["Root Color"].get())),
+                                  hue_to_hex(float(sliders["Leaf Color"].get())),
+                                  max(n_iters - 1, 2), "oklab"),
+    }
+
+
+class CanopyRedraw:
+    """
+    Rebuilds the canopy shown in a `CanopyView` progressively from parameters read on demand.
+
+    Attributes:
+        view (CanopyView): The view in which the canopy is drawn.
+        read_params (callable): Returns the current `fractal_canopy` parameters.
+        max_branches (int): The number of iterations is reduced until the canopy has at most
+            this many branches.
+        cache (CanopyCache): The cache from which the generations are taken.
+        store (GeometryStore): The store in which canopies are looked up before being generated, or None.
+        worker (GeometryWorker): The worker generating the generations in the background.
+    """
+
+    def __init__(
+        self,
+        view: CanopyView,
+        read_params: Callable[[], dict],
+        max_branches: int = MAX_BRANCHES,
+        cache: CanopyCache = default_cache,
+        store: GeometryStore | None = None,
+    ):
+        self.view = view
+        self.read_params = read_params
+        self.max_branches = max_branches
+        self.cache = cache
+        self.store = store
+        self.worker = GeometryWorker(cache)
+        self._generation = 0
+        self._debounce_id = None
+        self._step_id = None
+        # The geometry key and number of iterations of the canopy drawn in full, if any
+        self._drawn_key = None
+        # The scene parameters of the canopy being drawn, and of the one drawn in full
+        self._scene = None
+        self._drawn_scene = None
+        self._preview_id = 0
+        self._preview_image = None
+        add_view_listener(view.canvas, lambda canvas: self._hide_preview())
+
+    def schedule(self, *_) -> None:
+        """Schedules a rebuild once no further call has been made for DEBOUNCE_MS."""
+        canvas = self.view.canvas
+        if self._debounce_id is not None:
+            canvas.after_cancel(self._debounce_id)
+        self._debounce_id = canvas.after(DEBOUNCE_MS, self.start)
+
+    def cancel(self) -> None:
+        """Stops the rebuild in progress, if any."""
+        self._generation += 1
+        self.worker.cancel()
+        self.view.building = False
+        if self._step_id is not None:
+            self.view.canvas.after_cancel(self._step_id)
+            self._step_id = None
+
+    def start(self) -> None:
+        """Starts rebuilding the canopy from the current parameters, cancelling any rebuild in progress."""
+        self._debounce_id = None
+        self.cancel()
+        params = self.read_params()
+        geometry = {name: value for name, value in params.items() if name in GEOMETRY_DEFAULTS}
+        n_splits = geometry.get("n_splits", GEOMETRY_DEFAULTS["n_splits"])
+        n_iters = params.get("n_iters", 3)
+        while n_iters > 2 and sum(n_splits ** depth for depth in range(n_iters - 1)) > self.max_branches:
+            n_iters -= 1
+        color, wave_amp = params.get("color", "#000000"), params.get("wave_amp", 0)
+        key = (self.cache.key(**geometry), n_iters)
+        self._scene = self.scene_params(params, n_iters)
+        first_draw = not len(self.view.item_ids)
+        self._hide_preview()
+        stored = self.store.get(self._scene) if self.store is not None and key != self._drawn_key else None
+        if key == self._drawn_key:
+            # Only the colors or the wave changed: keep the geometry, restyle the items
+            self.view.set_canopy(self.view.segments, n_iters, color, wave_amp)
+        elif stored is not None:
+            # Nothing to generate: the items are created from the stored table over the next slices
+            self._drawn_key = None
+            self.cache.insert(stored.segments, n_iters, **geometry)
+            self.view.set_canopy(stored.segments, n_iters, color, wave_amp)
+            if first_draw and stored.preview is not None:
+                self._show_preview(stored.preview)
+        else:
+            self._drawn_key = None
+            # Draw the trunk at once and let the worker generate the rest
+            first_iters = min(n_iters, 2)
+            self.view.set_canopy(self.cache.segments(n_iters=first_iters, **geometry), n_iters,
+                                 color, wave_amp)
+            self.worker.submit(geometry, first_iters, n_iters)
+            self.view.building = True
+        self._step(self._generation, key)
+
+    @profile_funcs.timed("redraw_step")
+    def _step(self, generation: int, key: tuple) -> None:
+        """Draws the generations received from the worker for as long as fits in one slice of the event loop."""
+        self._step_id = None
+        if generation != self._generation:
+            return
+        deadline = time.perf_counter() + FRAME_BUDGET_MS / 1000
+        while (drawn := self.view.update(deadline)) and time.perf_counter() <= deadline:
+            batch = self.worker.poll()
+            if batch is None:
+                break
+            self.view.extend(batch)
+        if drawn and self.worker.done:
+            # Delete the items of the previous canopy that the new one has no branches for
+            self.view.trim()
+            self.view.building = False
+            self._hide_preview()
+            self._drawn_key = key
+            self._drawn_scene = self._scene
+            return
+        # Continue drawing in the next slice, or wait for the worker
+        self._step_id = self.view.canvas.after(1 if not drawn else POLL_MS, self._step, generation, key)
+
+    def scene_params(self, params: dict, n_iters: int) -> dict:
+        """
+        Returns the parameters under which the canopy drawn from `params` is stored:
+        its parameters with the number of iterations drawn, and the size of the canvas.
+        """
+        canvas = self.view.canvas
+        return {**params, "n_iters": n_iters, "size": [int(canvas.cget("width")), int(canvas.cget("height"))]}
+
+    def save_scene(self, info: dict | None = None) -> StoredCanopy | None:
+        """
+        Stores the canopy drawn in full, with a preview image of the canvas before any zooming,
+        and marks it as the last scene of the store.
+
+        Parameters:
+            info (dict, optional): Data stored with the canopy, e.g. the slider values. Defaults to None.
+
+        Returns:
+            StoredCanopy: The stored canopy, or None if there is no store or no canopy drawn in full.
+        """
+        if self.store is None or self._drawn_scene is None:
+            return None
+        scene = self._drawn_scene
+        width, height = scene["size"]
+        preview = rasterize_canopy_segments(self.view.segments, scene["n_iters"], width, height,
+                                            scene.get("color", "#000000"), scene.get("wave_amp", 0),
+                                            background=(255, 255, 255, 255))
+        stored = self.store.put(scene, {"segments": self.view.segments, "preview": preview}, info)
+        self.store.remember(stored.key)
+        self.store.prune()
+        return stored
+
+    def _show_preview(self, preview: np.ndarray) -> None:
+        """Shows a preview image of the canopy under its items, while they are created."""
+        canvas = self.view.canvas
+        if get_view_transform(canvas) != (1.0, 0.0, 0.0):
+            return
+        self._preview_image = photo_image(preview, canvas)
+        self._preview_id = canvas.create_image(0, 0, image=self._preview_image, anchor=tk.NW,
+                                               tags=(VIEW_TAG, PREVIEW_TAG))
+
+    def _hide_preview(self) -> None:
+        """Deletes the preview image, if any; it is not re-projected when the view changes."""
+        if self._preview_id:
+            self.view.canvas.delete(self._preview_id)
+            self._preview_id = 0
+            self._preview_image = None
+
+
+def bind_slider_redraw(
+    canvas: tk.Canvas, sliders: dict[str, tk.Scale], n_iters: int = N_ITERS,
+    store: GeometryStore | None = None,
+) -> CanopyRedraw:
+    """
+    Draws the canopy described by the sliders on the canvas, and redraws it whenever they move.
+
+    Parameters:
+        canvas (tk.Canvas): The canvas on which to draw.
+        sliders (dict): The sliders created by `populate_sliders`, by label.
+        n_iters (int): The number of iterations of the canopy. Defaults to N_ITERS.
+        store (GeometryStore, optional): The store in which canopies are looked up before
+            being generated. Defaults to None.
+
+    Returns:
+        CanopyRedraw: The scheduler of the redraws.
+    """
+    redraw = CanopyRedraw(CanopyView(canvas, min_pixels=0.5),
+                          lambda: slider_canopy_params(sliders, canvas, n_iters), store=store)
+    for slider in sliders.values():
+        slider.configure(command=redraw.schedule)
+    redraw.schedule()
+    return redraw
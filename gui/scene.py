@@ -0,0 +1,56 @@
+"""
+Scene
+=====
+Module for keeping the scene of the main window from one launch to the next.
+
+When the window is closed, the canopy shown is saved to the `store_funcs.GeometryStore` of the redraw,
+with the values of the sliders, as the last scene of the store. At the next launch the sliders are set
+back to these values before the first rebuild, which then finds the canopy in the store: its preview is
+shown at once and its items are created from the mapped segment table, without generating anything.
+Without a last scene the default slider values are drawn, from the store as well if it holds them.
+
+Functions:
+        restore_sliders(sliders, store): Sets the sliders to the values of the last scene of a store.
+        bind_scene_store(window, sliders, redraw): Saves the scene when the window is closed.
+"""
+import tkinter as tk
+
+from store_funcs import GeometryStore
+from gui.redraw import CanopyRedraw
+
+
+def restore_sliders(sliders: dict[str, tk.Scale], store: GeometryStore) -> bool:
+    """
+    Sets the sliders to the values of the last scene of a store.
+
+    Parameters:
+        sliders (dict): The sliders created by `populate_sliders`, by label.
+        store (GeometryStore): The store.
+
+    Returns:
+        bool: Whether the store has a last scene with slider values.
+    """
+    scene = store.last()
+    values = scene.info.get("sliders", {}) if scene is not None else {}
+    for label, value in values.items():
+        if label in sliders:
+            sliders[label].set(value)
+    return bool(values)
+
+
+def bind_scene_store(window: tk.Tk, sliders: dict[str, tk.Scale], redraw: CanopyRedraw) -> None:
+    """
+    Saves the canopy shown and the slider values to the store of a redraw when the window is closed.
+
+    Parameters:
+        window (tk.Tk): The main window.
+        sliders (dict): The sliders created by `populate_sliders`, by label.
+        redraw (CanopyRedraw): The redraw of the canopy, e.g. from `bind_slider_redraw` with a store.
+    """
+    def close():
+        try:
+            redraw.save_scene({"sliders": {label: slider.get() for label, slider in sliders.items()}})
+        finally:
+            window.destroy()
+
+    window.protocol("WM_DELETE_WINDOW", close)
@@ -8,10 +8,13 @@ It also defines the event handlers as well as the generator for the grid layout
 A populate_sliders function is provided to add sliders for different parameters to the sliders frame.
 """
 import tkinter as tk
+from typing import Callable
 
 
 def create_slider(
-        parent: tk.Widget, label: str, from_: int | float, to: int | float, row: int, column: int
+        parent: tk.Widget, label: str, from_: int | float, to: int | float, row: int, column: int,
+        resolution: int | float = 1, value: int | float | None = None,
+        command: Callable[[str], None] | None = None
 ) -> tk.Scale:
     """
     Create a slider and add it to the parent widget.
@@ -23,11 +26,20 @@ def create_slider(
         to (int or float): The ending value of the slider.
         row (int): The row position in the grid layout.
         column (int): The column position in the grid layout.
+        resolution (int or float): The step between the values of the slider. Defaults to 1.
+        value (int or float, optional): The initial value of the slider. Defaults to `from_`.
+        command (callable, optional): Called with the new value whenever the slider moves.
 
     Returns:
         tk.Scale: The created slider widget.
     """
-    slider = tk.Scale(parent, label=label, from_=from_, to=to, orient=tk.HORIZONTAL, length=120)
+    slider = tk.Scale(parent, label=label, from_=from_, to=to, orient=tk.HORIZONTAL, length=120,
+                      resolution=resolution)
+    if value is not None:
+        slider.set(value)
+    # The command is set after the initial value so that setting it does not trigger it
+    if command is not None:
+        slider.configure(command=command)
     slider.grid(row=row, column=column, padx=25, pady=3)
     return slider
 
@@ -43,30 +55,40 @@ def column_sequence_generator(num_columns: int):
         row += 1
 
 
-def populate_sliders(sliders_frame: tk.Frame, num_columns: int = 2) -> None:
+def populate_sliders(
+        sliders_frame: tk.Frame, num_columns: int = 2, command: Callable[[str], None] | None = None
+) -> dict[str, tk.Scale]:
     """
     Add sliders for different parameters to the sliders frame.
 
     Parameters:
         sliders_frame (tk.Frame): The frame to which the sliders will be added.
         num_columns (int): The number of columns in the grid layout of the sliders frame.
+        command (callable, optional): Called with the new value whenever any of the sliders moves.
+
+    Returns:
+        dict: The created sliders, by label.
     """
     for i in range(num_columns):
         sliders_frame.columnconfigure(i, weight=1)
 
     column_sequence = column_sequence_generator(num_columns)
 
+    # (label, from, to, resolution, initial value)
     sliders = [
-        ("Angle Offset", -45, 45),
-        ("Angle Size", 0, 180),
-        ("Number of Branches", 2, 8),
-        ("Length Ratio", 0, 1),
-        ("Initial Length", 0.5, 0.75),
-        ("Width Ratio", 0.5, 0.75),
-        ("Root Color", 0, 360),
-        ("Leaf Color", 0, 360)
+        ("Angle Offset", -45, 45, 1, 0),
+        ("Angle Size", 0, 180, 1, 60),
+        ("Number of Branches", 2, 8, 1, 3),
+        ("Length Ratio", 0, 1, 0.01, 0.6),
+        ("Initial Length", 0.5, 0.75, 0.01, 0.6),
+        ("Width Ratio", 0.5, 0.75, 0.01, 0.7),
+        ("Root Color", 0, 360, 1, 30),
+        ("Leaf Color", 0, 360, 1, 120)
     ]
 
-    for slider in sliders:
+    created = {}
+    for label, from_, to, resolution, value in sliders:
         placement = next(column_sequence)
-        create_slider(sliders_frame, *slider, *placement)
+        created[label] = create_slider(sliders_frame, label, from_, to, *placement,
+                                       resolution=resolution, value=value, command=command)
+    return created
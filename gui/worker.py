@@ -0,0 +1,129 @@
+"""
+Geometry Worker
+===============
+Module for generating canopy geometry on a background thread.
+
+Tkinter is not thread-safe: only the thread running the event loop may touch widgets. The worker
+therefore never calls the canvas. It generates the canopy one generation at a time in a daemon
+thread and puts the results on a queue, in batches of at most BATCH_ROWS new rows. The event loop
+takes the batches off the queue with `poll` from an `after()` timer and draws them, so pans, zooms
+and slider changes keep being handled while a large tree is being computed.
+
+Every job has a number. The thread checks that its job is still the current one before putting each
+batch on the queue, and `poll` drops any batch of an earlier job that was put before the thread noticed.
+
+Every batch is a view of the first rows of the segment table, ending with the new rows; since the
+table is ordered generation by generation, it can be passed straight to `CanopyView.extend`.
+
+Classes:
+        GeometryWorker: Generates canopy generations on a background thread and queues them for the event loop.
+"""
+import queue
+import threading
+
+import numpy as np
+
+import profile_funcs
+from cache_funcs import CanopyCache, default_cache
+
+# Largest number of new rows handed to the event loop in one batch
+BATCH_ROWS = 4096
+
+# Marks the end of a job on the queue
+_DONE = object()
+
+
+class GeometryWorker:
+    """
+    Generates canopy generations on a background thread and queues them for the event loop.
+
+    Only one job runs at a time: submitting a new job cancels the previous one, whose
+    remaining batches are discarded. A cancelled thread stops before its next batch.
+
+    Attributes:
+        cache (CanopyCache): The cache from which the generations are taken.
+        batch_rows (int): The largest number of new rows in one batch.
+    """
+
+    def __init__(self, cache: CanopyCache = default_cache, batch_rows: int = BATCH_ROWS):
+        self.cache = cache
+        self.batch_rows = batch_rows
+        self._queue = queue.SimpleQueue()
+        # The number of the current job; cancelling it moves on to the next number
+        self._job = 0
+        self._done = True
+
+    @property
+    def done(self) -> bool:
+        """Whether the current job has finished and all its batches have been polled."""
+        return self._done
+
+    def submit(self, geometry: dict, first_iters: int, n_iters: int) -> None:
+        """
+        Starts generating a canopy on a background thread, cancelling the current job.
+
+        Args:
+            geometry (dict): The geometry parameters of `fractal_funcs.canopy_segments`.
+            first_iters (int): The number of iterations the caller already has; generation
+                starts with the following one.
+            n_iters (int): The number of iterations to generate up to.
+        """
+        self.cancel()
+        self._done = False
+        threading.Thread(target=self._run, args=(self._job, dict(geometry), first_iters, n_iters),
+                         daemon=True).start()
+
+    def cancel(self) -> None:
+        """Cancels the current job. Batches it has already queued are discarded."""
+        self._job += 1
+        self._done = True
+        while not self._queue.empty():
+            self._queue.get_nowait()
+
+    def poll(self) -> np.ndarray | None:
+        """
+        Returns the next batch of the current job without waiting, or None if there is none yet.
+        An exception raised while generating is raised again here, on the calling thread.
+        """
+        if self._done:
+            return None
+        while True:
+            try:
+                job, batch = self._queue.get_nowait()
+            except queue.Empty:
+                return None
+            # Batches of cancelled jobs may have been put just before they were cancelled
+            if job == self._job:
+                break
+        if batch is _DONE:
+            self._done = True
+            return None
+        if isinstance(batch, Exception):
+            self._done = True
+            raise batch
+        return batch
+
+    def _put(self, job: int, batch) -> bool:
+        """Puts a batch of a job on the queue, unless the job was cancelled. Returns whether it was put."""
+        if job != self._job:
+            return False
+        self._queue.put((job, batch))
+        return True
+
+    def _run(self, job: int, geometry: dict, first_iters: int, n_iters: int) -> None:
+        """Generates the generations of one job, putting them on the queue in batches."""
+        try:
+            rows = len(self.cache.segments(n_iters=first_iters, **geometry))
+            for iters in range(first_iters + 1, n_iters + 1):
+                if job != self._job:
+                    return
+                with profile_funcs.phase("worker_generation"):
+                    table = self.cache.segments(n_iters=iters, **geometry)
+                for end in range(rows + self.batch_rows, len(table) + self.batch_rows, self.batch_rows):
+                    if not self._put(job, table[:min(end, len(table))]):
+                        return
+                rows = len(table)
+        except Exception as error:  # handed over to the event loop thread
+            self._put(job, error)
+            return
+        self._put(job, _DONE)
@@ -6,10 +6,20 @@ Module provides zoom functionality for a tkinter canvas.
 This module includes functions to start panning, perform panning, and zoom in/out on a tkinter canvas.
 It also includes a function to bind these events to the canvas.
 
+Zooming does not rescale every canvas item on every wheel tick. Instead, each canvas keeps an
+explicit view transform (a scale and a translation) that zooming updates, and the redraw is
+coalesced into one per frame. At that point the view listeners re-project the items they manage
+(tagged with `VIEW_TAG`) from their cached model geometry, and all other items are scaled once
+by the zoom accumulated during the frame. The view state of a canvas is dropped, and its
+pending redraw cancelled, when the canvas is destroyed.
+
 Functions:
         start_pan(event): Marks the starting point for panning.
         do_pan(event): Drags the canvas to the new position.
         zoom(event): Zooms in or out on the canvas.
+        get_view_transform(canvas): Returns the scale and translation of the view.
+        visible_region(canvas): Returns the visible part of the canvas before any zooming.
+        add_view_listener(canvas, callback): Registers a callback run on the redraw after a pan or zoom.
         bind_canvas_zoom_events(canvas): Binds the pan and zoom events to the canvas.
 
 Example:
@@ -28,6 +38,105 @@ Example:
     window.mainloop()
 """
 import tkinter as tk
+from typing import Callable
+
+import profile_funcs
+
+# Tag of the items that view listeners re-project themselves
+VIEW_TAG = "view"
+# Time between two redraws of a canvas whose view changed, in milliseconds
+FRAME_MS = 16
+
+# Accumulated (scale, offset_x, offset_y) of the view of each canvas
+_view_transforms: dict[tk.Canvas, tuple[float, float, float]] = {}
+# Zoom not yet applied to the unmanaged items, and the pending redraw callback
+_pending_zooms: dict[tk.Canvas, tuple[float, float, float]] = {}
+_pending_redraws: dict[tk.Canvas, str] = {}
+_view_listeners: dict[tk.Canvas, list[Callable[[tk.Canvas], None]]] = {}
+
+
+def get_view_transform(canvas: tk.Canvas) -> tuple[float, float, float]:
+    """
+    Returns the view transform of the canvas as (scale, offset_x, offset_y).
+
+    A point at (x, y) in model coordinates (those of the canvas before any zooming)
+    is shown at (x * scale + offset_x, y * scale + offset_y) in canvas coordinates.
+    """
+    return _view_transforms.get(canvas, (1.0, 0.0, 0.0))
+
+
+def visible_region(canvas: tk.Canvas) -> tuple[float, float, float, float]:
+    """
+    Returns the part of the canvas currently in view as (x_min, y_min, x_max, y_max),
+    in model coordinates (see `get_view_transform`).
+    """
+    # Before the canvas is mapped its window size is not known yet
+    width = canvas.winfo_width()
+    height = canvas.winfo_height()
+    if width <= 1 or height <= 1:
+        width, height = int(canvas.cget("width")), int(canvas.cget("height"))
+
+    scale, offset_x, offset_y = get_view_transform(canvas)
+    return ((canvas.canvasx(0) - offset_x) / scale,
+            (canvas.canvasy(0) - offset_y) / scale,
+            (canvas.canvasx(width) - offset_x) / scale,
+            (canvas.canvasy(height) - offset_y) / scale)
+
+
+def add_view_listener(canvas: tk.Canvas, callback: Callable[[tk.Canvas], None]):
+    """
+    Registers a callback that is called with the canvas once per frame in which it was panned or zoomed.
+    The callback is responsible for re-projecting the items it drew with the `VIEW_TAG` tag.
+    """
+    if canvas not in _view_listeners:
+        _forget_on_destroy(canvas)
+    _view_listeners.setdefault(canvas, []).append(callback)
+
+
+def _forget_canvas(canvas: tk.Canvas):
+    """Drops the view state of a canvas and cancels its pending redraw."""
+    callback_id = _pending_redraws.pop(canvas, None)
+    if callback_id is not None:
+        canvas.after_cancel(callback_id)
+    _view_transforms.pop(canvas, None)
+    _pending_zooms.pop(canvas, None)
+    _view_listeners.pop(canvas, None)
+
+
+def _forget_on_destroy(canvas: tk.Canvas):
+    """Makes the destruction of the canvas drop its view state, so that the module does not keep it alive."""
+    # The canvas is captured rather than taken from the event: once destroyed, its name no longer resolves
+    canvas.bind("<Destroy>", lambda event: _forget_canvas(canvas), add="+")
+
+
+def _compose(first: tuple[float, float, float], then: tuple[float, float, float]) -> tuple[float, float, float]:
+    """Returns the (scale, offset_x, offset_y) transform applying `first` and then `then`."""
+    scale, offset_x, offset_y = first
+    then_scale, then_x, then_y = then
+    return scale * then_scale, offset_x * then_scale + then_x, offset_y * then_scale + then_y
+
+
+@profile_funcs.timed("zoom_frame")
+def _redraw(canvas: tk.Canvas):
+    """Applies the view changes of the last frame to the canvas items."""
+    _pending_redraws.pop(canvas, None)
+    scale, offset_x, offset_y = _pending_zooms.pop(canvas, (1.0, 0.0, 0.0))
+    unmanaged = f"all&&!{VIEW_TAG}"
+    if profile_funcs.is_enabled() and (scale != 1 or offset_x or offset_y):
+        profile_funcs.count("items_scaled", len(canvas.find_withtag(unmanaged)))
+    if scale != 1:
+        # The fixed point of x * scale + offset is the origin of an equivalent canvas.scale
+        canvas.scale(unmanaged, offset_x / (1 - scale), offset_y / (1 - scale), scale, scale)
+    elif offset_x or offset_y:
+        canvas.move(unmanaged, offset_x, offset_y)
+    for callback in _view_listeners.get(canvas, []):
+        callback(canvas)
+
+
+def _schedule_redraw(canvas: tk.Canvas):
+    """Schedules a redraw of the canvas for the next frame, unless one is already scheduled."""
+    if canvas not in _pending_redraws:
+        _pending_redraws[canvas] = canvas.after(FRAME_MS, _redraw, canvas)
 
 
 def start_pan(event: tk.Event):
@@ -40,33 +149,35 @@ def do_pan(event: tk.Event):
     """Drags the canvas to the new position."""
     canvas: tk.Canvas = event.widget
     canvas.scan_dragto(event.x, event.y, gain=1)
+    _schedule_redraw(canvas)
 
 
 def zoom(event: tk.Event):
     """
-    Zooms in or out on the canvas, adjusting for the pan, by scaling the canvas content
-    based on the mouse wheel movement.
-    The zoom operation aligns the origin coordinates of the scaled piece of the canvas at the mouse position
-    (event.x, event.y) with the mouse position when zoom occurred.
-    ensuring that the newly displayed piece's origin coordinates (the place at which the mouse was when the scrolling
-    started) align with the mouse position when the zoom event handler was called.
-
-    The `canvas.scale` method is called with the following parameters:
-    - "all": This indicates that all items on the canvas should be scaled.
-    - `canvas.canvasx(event.x)`: The x-coordinate of the mouse event, converted to canvas coordinates.
-    - `canvas.canvasy(event.y)`: The y-coordinate of the mouse event, converted to canvas coordinates.
-    - `scale`: The scaling factor, which is 1.1 for zooming in and 0.9 for zooming out.
-
-    From the Tkinter documentation on scale function:
-    '''Scale item TAGORID with XORIGIN, YORIGIN, XSCALE, YSCALE.'''
-
-    In summary, the `canvas.scale` method called here scales the items on the canvas with respect to the specified
-    origin - mouse position in canvas coordinates and scaling factor scale specified for both XSCALE and YSCALE
-    parameters.
+    Zooms in or out on the canvas, adjusting for the pan, based on the mouse wheel movement.
+    The zoom keeps the point of the canvas under the mouse position (event.x, event.y) in place,
+    so the content grows or shrinks around the mouse.
+
+    The zoom scales the view transform of the canvas (see `get_view_transform`) by a factor of
+    1.1 for zooming in and 0.9 for zooming out, around the mouse position converted to canvas
+    coordinates with `canvas.canvasx` and `canvas.canvasy`:
+
+        x' = (x - origin_x) * factor + origin_x
+
+    The canvas items are not touched here. A redraw is scheduled instead, and all the wheel
+    events received until it runs are folded into it, so a burst of events costs one redraw.
+    The redraw re-projects the managed items from their model coordinates, which does not
+    accumulate rounding errors the way repeated `canvas.scale` calls on item coordinates do.
     """
     canvas: tk.Canvas = event.widget
-    scale = 1.1 if event.delta > 0 else 0.9
-    canvas.scale("all", canvas.canvasx(event.x), canvas.canvasy(event.y), scale, scale)
+    factor = 1.1 if event.delta > 0 else 0.9
+    origin_x, origin_y = canvas.canvasx(event.x), canvas.canvasy(event.y)
+    step = (factor, origin_x * (1 - factor), origin_y * (1 - factor))
+
+    _view_transforms[canvas] = _compose(get_view_transform(canvas), step)
+    _pending_zooms[canvas] = _compose(_pending_zooms.get(canvas, (1.0, 0.0, 0.0)), step)
+    profile_funcs.count("zoom_events")
+    _schedule_redraw(canvas)
 
 
 def bind_canvas_zoom_events(canvas: tk.Canvas):
@@ -76,3 +187,4 @@ def bind_canvas_zoom_events(canvas: tk.Canvas):
     canvas.bind("<MouseWheel>", zoom)
     canvas.bind("<ButtonPress-1>", start_pan)
     canvas.bind("<B1-Motion>", do_pan)
+    _forget_on_destroy(canvas)
@@ -4,6 +4,12 @@ helper_funcs.py
 This module contains helper functions for use with drawing fractals on a Tkinter canvas.
 
 Functions:
+    sine_wave_polylines()
+        Generates sine wave polylines between many pairs of points at once.
+    wave_sample_counts()
+        Chooses the number of points for each sine wave segment.
+    adaptive_sine_wave_polylines()
+        Generates sine wave polylines whose number of points follows their on-screen length.
     draw_sine_wave_segment()
         Draws a sine wave segment on a Tkinter canvas between two points.
     hex_to_rgb()
@@ -16,10 +22,154 @@ Functions:
         Generates a gradient list of colors between two hex color values.
 """
 
-import tkinter as tk
 import numpy as np
 
-def draw_sine_wave_segment(canvas: tk.Canvas,
+from canvas_funcs import DrawingBackend
+from color_funcs import gradient_palette
+import profile_funcs
+
+# Defaults for the adaptive sampling of sine wave segments
+WAVE_PIXELS_PER_SAMPLE = 3.0
+WAVE_MIN_POINTS = 5
+WAVE_MAX_POINTS = 100
+
+def sine_wave_polylines(x: np.ndarray,
+                        y: np.ndarray,
+                        end_x: np.ndarray,
+                        end_y: np.ndarray,
+                        line_len: np.ndarray,
+                        wave_amp: float,
+                        n_points: int = 100) -> np.ndarray:
+    """
+    Generates sine wave polylines between many pairs of points at once.
+
+    One period of the sine wave is laid along each segment, then rotated
+    and translated onto it. All segments are transformed together with
+    array operations, so there is no Python loop over segments or points.
+    The wave is one canonical shape for all segments of the same length,
+    placed by multiplying it with the unit direction of the segment as a
+    complex number, so no trigonometry is needed per segment.
+
+    Args:
+        x (np.ndarray): The x-coordinates of the starting points.
+        y (np.ndarray): The y-coordinates of the starting points.
+        end_x (np.ndarray): The x-coordinates of the ending points.
+        end_y (np.ndarray): The y-coordinates of the ending points.
+        line_len (np.ndarray): The lengths of the line segments.
+        wave_amp (float): The amplitude of the sine wave.
+        n_points (int, optional): The number of points per polyline. Defaults to 100.
+
+    Returns:
+        np.ndarray: An array of shape (N, n_points, 2) with the polyline points.
+    """
+    x, y, end_x, end_y, line_len = (np.atleast_1d(np.asarray(a, dtype=float))
+                                    for a in (x, y, end_x, end_y, line_len))
+
+    # The unit direction of every segment, as a complex number (1 for segments of zero length)
+    direction = (end_x - x) + 1j * (end_y - y)
+    norm = np.abs(direction)
+    unit = np.divide(direction, norm, out=np.ones_like(direction), where=norm > 0)
+
+    # Generate sine wave points; the phase runs over one period for every segment
+    phase = np.linspace(0, 2 * np.pi, n_points)
+    wave = line_len[:, np.newaxis] * (phase / (2 * np.pi)) + 1j * (wave_amp * np.sin(phase))
+
+    # Rotate and translate points; a complex array is laid out as (x, y) pairs
+    points = (x + 1j * y)[:, np.newaxis] + unit[:, np.newaxis] * wave
+    return points.view(float).reshape(x.size, n_points, 2)
+
+
+def wave_sample_counts(line_len: np.ndarray,
+                       wave_amp: float,
+                       scale: float = 1.0,
+                       pixels_per_sample: float = WAVE_PIXELS_PER_SAMPLE,
+                       min_points: int = WAVE_MIN_POINTS,
+                       max_points: int = WAVE_MAX_POINTS) -> np.ndarray:
+    """
+    Chooses the number of points for each sine wave segment.
+
+    The count follows the on-screen length of the wave: the segment
+    length plus the distance travelled by one period of the wave,
+    multiplied by the current zoom scale. Counts are rounded up to the
+    form 4m + 1 so the peaks and troughs of the wave are always sampled.
+
+    Args:
+        line_len (np.ndarray): The lengths of the line segments in model units.
+        wave_amp (float): The amplitude of the sine wave.
+        scale (float, optional): The zoom scale from model units to pixels. Defaults to 1.
+        pixels_per_sample (float, optional): The on-screen distance between samples.
+            Defaults to WAVE_PIXELS_PER_SAMPLE.
+        min_points (int, optional): The lower bound of the count. Defaults to WAVE_MIN_POINTS.
+        max_points (int, optional): The upper bound of the count. Defaults to WAVE_MAX_POINTS.
+
+    Returns:
+        np.ndarray: The number of points for each segment.
+    """
+    on_screen_len = (np.abs(np.asarray(line_len, dtype=float)) + 4 * abs(wave_amp)) * scale
+    quarters = np.ceil(on_screen_len / (4 * pixels_per_sample))
+    counts = 4 * quarters.astype(int) + 1
+    # The bounds are moved to the form 4m + 1 as well
+    return np.clip(counts, min_points + (-(min_points - 1)) % 4, max_points - (max_points - 1) % 4)
+
+
+def adaptive_sine_wave_polylines(x: np.ndarray,
+                                 y: np.ndarray,
+                                 end_x: np.ndarray,
+                                 end_y: np.ndarray,
+                                 line_len: np.ndarray,
+                                 wave_amp: float,
+                                 scale: float = 1.0,
+                                 pixels_per_sample: float = WAVE_PIXELS_PER_SAMPLE,
+                                 min_points: int = WAVE_MIN_POINTS,
+                                 max_points: int = WAVE_MAX_POINTS) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Generates sine wave polylines whose number of points follows their on-screen length.
+
+    Segments sharing a sample count are generated together with
+    `sine_wave_polylines`, so the work is one batch per distinct count.
+    The polylines are returned packed: the points of the i-th polyline
+    are `points[offsets[i]:offsets[i + 1]]`.
+
+    Args:
+        x (np.ndarray): The x-coordinates of the starting points.
+        y (np.ndarray): The y-coordinates of the starting points.
+        end_x (np.ndarray): The x-coordinates of the ending points.
+        end_y (np.ndarray): The y-coordinates of the ending points.
+        line_len (np.ndarray): The lengths of the line segments.
+        wave_amp (float): The amplitude of the sine wave.
+        scale (float, optional): The zoom scale from model units to pixels. Defaults to 1.
+        pixels_per_sample (float, optional): The on-screen distance between samples.
+            Defaults to WAVE_PIXELS_PER_SAMPLE.
+        min_points (int, optional): The lower bound of points per polyline. Defaults to WAVE_MIN_POINTS.
+        max_points (int, optional): The upper bound of points per polyline. Defaults to WAVE_MAX_POINTS.
+
+    Returns:
+        tuple: The packed (total_points, 2) points array and the (N + 1,) offsets array.
+    """
+    x, y, end_x, end_y, line_len = (np.atleast_1d(np.asarray(a, dtype=float))
+                                    for a in (x, y, end_x, end_y, line_len))
+    counts = wave_sample_counts(line_len, wave_amp, scale,
+                                pixels_per_sample, min_points, max_points)
+    offsets = np.zeros(counts.size + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    points = np.empty((offsets[-1], 2))
+    for n_points in np.unique(counts):
+        selected = np.flatnonzero(counts == n_points)
+        polylines = sine_wave_polylines(x[selected], y[selected],
+                                        end_x[selected], end_y[selected],
+                                        line_len[selected], wave_amp, n_points)
+        if selected[-1] - selected[0] + 1 == len(selected):
+            # The group is a run of consecutive segments, e.g. a generation of a canopy
+            points[offsets[selected[0]]:offsets[selected[-1] + 1]] = polylines.reshape(-1, 2)
+        else:
+            # Scatter each polyline of the group into its slot of the packed array
+            rows = offsets[selected][:, np.newaxis] + np.arange(n_points)
+            points[rows] = polylines
+    return points, offsets
+
+
+@profile_funcs.timed()
+def draw_sine_wave_segment(canvas: DrawingBackend,
                            x: float,
                            y: float,
                            end_x: float,
@@ -27,12 +177,18 @@ def draw_sine_wave_segment(canvas: tk.Canvas,
                            line_len: float,
                            wave_amp: float,
                            fill: str,
-                           width: float = 1):
+                           width: float = 1,
+                           scale: float = 1.0,
+                           pixels_per_sample: float = WAVE_PIXELS_PER_SAMPLE):
     """
     Draws a sine wave segment on a Tkinter canvas between two points.
 
+    The wave is drawn as a single multi-point line item, with the number
+    of points chosen from its on-screen length by `wave_sample_counts`.
+
     Args:
-        canvas (tk.Canvas): The Tkinter canvas on which to draw the sine wave segment.
+        canvas (DrawingBackend): The Tkinter canvas, or any other drawing backend
+            (see `canvas_funcs`), on which to draw the sine wave segment.
         x (float): The x-coordinate of the starting point.
         y (float): The y-coordinate of the starting point.
         end_x (float): The x-coordinate of the ending point.
@@ -41,43 +197,17 @@ def draw_sine_wave_segment(canvas: tk.Canvas,
         wave_amp (float): The amplitude of the sine wave.
         fill (str): The color of the sine wave in hex format.
         width (float, optional): The width of the sine wave line. Defaults to 1.
+        scale (float, optional): The zoom scale from model units to pixels. Defaults to 1.
+        pixels_per_sample (float, optional): The on-screen distance between samples.
+            Defaults to WAVE_PIXELS_PER_SAMPLE.
 
     Returns:
         None
     """
-    # Calculate the angle of rotation
-    angle = np.arctan2(end_y - y, end_x - x)
-
-    period_scale = 2 * np.pi / line_len
-
-    # Generate sine wave points
-    t = np.linspace(0, line_len, 100)
-    sine_wave_x = t
-    sine_wave_y = wave_amp * np.sin(period_scale * t)
-
-    # Rotate and translate points
-    cos_angle = np.cos(angle)
-    sin_angle = np.sin(angle)
-
-    transformed_points = []
-    for i in range(len(t)):
-        new_x = cos_angle * sine_wave_x[i] - sin_angle * sine_wave_y[i] + x
-        new_y = sin_angle * sine_wave_x[i] + cos_angle * sine_wave_y[i] + y
-        transformed_points.append((new_x, new_y))
-    # Draw the sine wave segment
-    for i in range(len(transformed_points) - 1):
-        unit_vector_x = transformed_points[i+1][0] - transformed_points[i][0]
-        unit_vector_y = transformed_points[i+1][1] - transformed_points[i][1]
-        unit_vector_length = np.sqrt(unit_vector_x**2 + unit_vector_y**2)
-        unit_vector_x /= unit_vector_length
-        unit_vector_y /= unit_vector_length
-
-        canvas.create_line(transformed_points[i][0],
-                           transformed_points[i][1],
-                           transformed_points[i+1][0] + (unit_vector_x * 2.5),
-                           transformed_points[i+1][1] + (unit_vector_y * 2.5),
-                           width=width,
-                           fill=fill)
+    points, _ = adaptive_sine_wave_polylines(x, y, end_x, end_y, line_len, wave_amp,
+                                             scale, pixels_per_sample)
+    canvas.create_line(points.ravel().tolist(), width=width, fill=fill)
+    profile_funcs.count("items_created")
 
 # Convert hex color to RGB tuple
 def hex_to_rgb(hex_color):
@@ -134,13 +264,5 @@ def generate_gradient(color1, color2, steps):
     Returns:
         list: A list of hex color strings representing the gradient.
     """
-    rgb_color1 = hex_to_rgb(color1)
-    rgb_color2 = hex_to_rgb(color2)
-    gradient = []
-    for step in range(steps):
-        factor = step / (steps - 1)
-        interpolated_color = interpolate_color(rgb_color1,
-                                               rgb_color2,
-                                               factor)
-        gradient.append(rgb_to_hex(interpolated_color))
-    return gradient
+    # The palettes are computed once per set of arguments, see color_funcs.gradient_palette
+    return gradient_palette(color1, color2, steps).tolist()
@@ -0,0 +1,412 @@
+"""
+lsystem_funcs.py
+
+This module contains an L-system engine, a second family of fractals next to
+the canopies of `fractal_funcs`: an axiom and production rules expanded into
+a string of symbols, which a turtle then follows to draw the fractal.
+
+Strings are arrays of small integer tokens rather than Python strings, and
+both steps work on whole arrays. Every level of the expansion is one gather
+from the concatenated rule bodies. The turtle does not walk the string one
+symbol at a time either: its heading, its step length and width scales and
+its position are prefix sums of the turns, scalings and steps along the
+string, and a closing bracket carries the correction that brings the turtle
+back to where the matching opening bracket was.
+
+The turtle produces the segment table of `fractal_funcs` (see SEGMENT_FIELDS),
+with the bracket nesting level of every segment as its depth, so L-systems are
+drawn, rasterized and exported like canopies. The canopy of `canopy_segments`
+is one such L-system (see `canopy_lsystem`), and PRESETS holds classic curves
+and plants.
+
+Symbols:
+    F, G    Draw a step forward.
+    f       Move a step forward without drawing.
+    +, -    Turn by the angle of the L-system, clockwise and counterclockwise on a
+            canvas, whose y axis points down; other turn symbols can be given.
+    |       Turn around.
+    [, ]    Save and restore the turtle state (position, heading and scales).
+    "       Multiply the step length by the length ratio.
+    !       Multiply the width by the width ratio.
+    Any other symbol only takes part in the expansion.
+
+Classes:
+    LSystem
+        An L-system compiled to token arrays.
+
+Functions:
+    canopy_lsystem()
+        Returns the L-system of the fractal canopy of `fractal_funcs.canopy_segments`.
+    turtle_segments()
+        Interprets a token array with the turtle, returning a segment table.
+    lsystem_segments()
+        Generates the segment table of an L-system after a number of iterations.
+    lsystem_fractal()
+        Draws an L-system on the provided Tkinter canvas.
+"""
+
+import numpy as np
+
+import profile_funcs
+from canvas_funcs import DrawingBackend
+from fractal_funcs import (draw_canopy_segments, SEGMENT_FIELDS,
+                           X0, Y0, X1, Y1, ANGLE, LENGTH, WIDTH, DEPTH, KEY)
+
+# What the turtle does for every symbol
+IGNORE, DRAW, MOVE, TURN, PUSH, POP, SCALE_LENGTH, SCALE_WIDTH = range(8)
+# Largest number of tokens an expansion may produce
+MAX_TOKENS = 2 ** 30
+
+
+class LSystem:
+    """
+    An L-system compiled to token arrays.
+
+    Every symbol is a token, its index in `symbols`. The rule bodies are concatenated
+    in one array, and symbols without a rule are rewritten to themselves.
+
+    Attributes:
+        symbols (str): The symbols, in token order.
+        axiom (np.ndarray): The tokens of the axiom.
+        rule_starts (np.ndarray): Where the body of the rule of every token starts in `rule_bodies`,
+            followed by the length of `rule_bodies`.
+        rule_bodies (np.ndarray): The tokens of the rule bodies, one after another.
+        roles (np.ndarray): What the turtle does for every token: IGNORE, DRAW, MOVE, TURN,
+            PUSH, POP, SCALE_LENGTH or SCALE_WIDTH.
+        turn_angles (np.ndarray): The angle in degrees by which every TURN token turns the turtle.
+        length_ratio (float): The factor of the step length of the SCALE_LENGTH tokens.
+        width_ratio (float): The factor of the width of the SCALE_WIDTH tokens.
+    """
+
+    __slots__ = ("symbols", "axiom", "rule_starts", "rule_bodies", "roles", "turn_angles",
+                 "length_ratio", "width_ratio")
+
+    def __init__(
+        self,
+        axiom: str,
+        rules: dict[str, str],
+        angle: float = 90,
+        turns: dict[str, float] | None = None,
+        draw: str = "FG",
+        move: str = "f",
+        length_ratio: float = 0.5,
+        width_ratio: float = 0.75,
+    ):
+        """
+        Compiles an L-system.
+
+        Args:
+            axiom (str): The string of symbols to start from.
+            rules (dict): The production rules, as {symbol: replacement}.
+            angle (float, optional): The angle of the "+" and "-" turns in degrees. Defaults to 90.
+            turns (dict, optional): More turn symbols, as {symbol: angle in degrees}. Defaults to none.
+            draw (str, optional): The symbols that draw a step. Defaults to "FG".
+            move (str, optional): The symbols that move a step without drawing. Defaults to "f".
+            length_ratio (float, optional): The factor of the step length of '"'. Defaults to 0.5.
+            width_ratio (float, optional): The factor of the width of "!". Defaults to 0.75.
+        """
+        turns = {"+": angle, "-": -angle, "|": 180, **(turns or {})}
+        roles = {**{symbol: TURN for symbol in turns}, "[": PUSH, "]": POP,
+                 '"': SCALE_LENGTH, "!": SCALE_WIDTH,
+                 **{symbol: DRAW for symbol in draw}, **{symbol: MOVE for symbol in move}}
+        symbols = "".join(dict.fromkeys(axiom + "".join(rules) + "".join(rules.values()) + "".join(roles)))
+        dtype = np.uint8 if len(symbols) <= 256 else np.uint16
+        tokens = {symbol: token for token, symbol in enumerate(symbols)}
+
+        def compile_string(string: str) -> np.ndarray:
+            return np.array([tokens[symbol] for symbol in string], dtype=dtype)
+
+        bodies = [compile_string(rules.get(symbol, symbol)) for symbol in symbols]
+        self.symbols = symbols
+        self.axiom = compile_string(axiom)
+        self.rule_starts = np.concatenate(([0], np.cumsum([len(body) for body in bodies])))
+        self.rule_bodies = np.concatenate(bodies) if bodies else np.empty(0, dtype=dtype)
+        self.roles = np.array([roles.get(symbol, IGNORE) for symbol in symbols], dtype=np.uint8)
+        self.turn_angles = np.array([turns.get(symbol, 0.0) if roles.get(symbol) == TURN else 0.0
+                                     for symbol in symbols])
+        self.length_ratio = length_ratio
+        self.width_ratio = width_ratio
+
+    def expand(self, n_iters: int) -> np.ndarray:
+        """
+        Applies the rules `n_iters` times to the axiom.
+
+        Every iteration is one gather: the output token at position j comes from the body of
+        the rule of the input token it belongs to, at offset j minus where that body starts.
+
+        Args:
+            n_iters (int): The number of iterations.
+
+        Returns:
+            np.ndarray: The tokens of the expanded string.
+
+        Raises:
+            ValueError: If the string would have more than MAX_TOKENS tokens.
+        """
+        tokens = self.axiom
+        rule_lengths = np.diff(self.rule_starts)
+        for _ in range(n_iters):
+            lengths = rule_lengths[tokens]
+            ends = np.cumsum(lengths)
+            total = int(ends[-1]) if len(ends) else 0
+            if total > MAX_TOKENS:
+                raise ValueError(f"The expansion has {total} tokens, more than MAX_TOKENS ({MAX_TOKENS})")
+            sources = np.repeat(self.rule_starts[tokens] - (ends - lengths), lengths)
+            sources += np.arange(total)
+            tokens = self.rule_bodies[sources]
+        return tokens
+
+    def to_string(self, tokens: np.ndarray) -> str:
+        """Returns the string of symbols of a token array."""
+        return "".join(np.array(list(self.symbols))[tokens].tolist())
+
+
+def canopy_lsystem(
+    off_angle: float = 0,
+    angle_delta: float = 10,
+    n_splits: int = 2,
+    length_ratio: float = 0.75,
+    width_ratio: float = 0.75,
+) -> LSystem:
+    """
+    Returns the L-system of the fractal canopy of `fractal_funcs.canopy_segments`.
+
+    The axiom is the trunk followed by a bud, and every bud grows into `n_splits` branches,
+    each turned by its split angle, shortened and thinned, and ending in a bud of its own.
+    With start_angle, init_length and width of the canopy, `lsystem_segments` after
+    n_iters - 2 iterations gives the segment table of `canopy_segments` after n_iters, up to rounding.
+
+    Args:
+        off_angle, angle_delta, n_splits, length_ratio, width_ratio: As for `canopy_segments`.
+
+    Returns:
+        LSystem: The L-system.
+    """
+    split_angles = off_angle + np.linspace(-angle_delta / 2, angle_delta / 2, n_splits)
+    # One turn symbol per split, outside the range of the other symbols
+    turns = {chr(0x100 + split): float(angle) for split, angle in enumerate(split_angles)}
+    bud = "".join(f'[{symbol}"!FX]' for symbol in turns)
+    return LSystem("FX", {"X": bud}, turns=turns, length_ratio=length_ratio, width_ratio=width_ratio)
+
+
+def _match_brackets(roles: np.ndarray, levels: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the positions of the matching opening and closing brackets of a token string.
+
+    Sorted by nesting level and then position, the brackets of every level alternate
+    between opening and closing, each closing bracket right after its match.
+    """
+    opens = np.flatnonzero(roles == PUSH)
+    closes = np.flatnonzero(roles == POP)
+    if len(opens) != len(closes):
+        raise ValueError(f"Unbalanced brackets: {len(opens)} opening and {len(closes)} closing")
+    if not len(opens):
+        return opens, closes
+    brackets = np.concatenate((opens, closes))
+    # Both brackets of a pair have the nesting level of the tokens around the pair
+    order = np.lexsort((brackets, levels[brackets]))
+    paired = brackets[order].reshape(-1, 2)
+    if (roles[paired[:, 0]] != PUSH).any() or (roles[paired[:, 1]] != POP).any():
+        raise ValueError("Unbalanced brackets: a closing bracket comes before its opening bracket")
+    return paired[:, 0], paired[:, 1]
+
+
+def _pair_ranges(
+    levels: np.ndarray,
+    opens: np.ndarray,
+    closes: np.ndarray,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Returns the positions of the tokens sorted by nesting level and then position, and for every
+    bracket pair the range of the tokens directly inside it (those at the level inside the pair)
+    in that order, where they are consecutive.
+    """
+    n = len(levels)
+    # A stable sort of small integers is a radix sort
+    order = np.argsort(levels.astype(np.int16) if levels.max() < 2 ** 15 else levels, kind="stable")
+    keys = levels[order] * n + order
+    inner = levels[opens] + 1
+    return order, np.searchsorted(keys, inner * n + opens), np.searchsorted(keys, inner * n + closes)
+
+
+def _bracketed_cumsum(
+    increments: np.ndarray,
+    pair_ranges: tuple[np.ndarray, np.ndarray, np.ndarray],
+    closes: np.ndarray,
+) -> np.ndarray:
+    """
+    Returns the turtle state after every token, from the change each token makes to it.
+    The increments are overwritten.
+
+    The state after a closing bracket is the state after its opening bracket. The closing bracket
+    therefore undoes the net change made inside the pair, which is the sum of the increments of the
+    tokens directly inside it, as the pairs nested in it undo their own changes. These tokens are
+    consecutive in the order of `pair_ranges`, so every such sum is a difference of two prefix sums.
+    """
+    if len(closes):
+        order, first, last = pair_ranges
+        sorted_sums = np.concatenate(([0], np.cumsum(increments[order])))
+        increments[closes] -= sorted_sums[last] - sorted_sums[first]
+    return np.cumsum(increments, out=increments)
+
+
+@profile_funcs.timed()
+def turtle_segments(
+    system: LSystem,
+    tokens: np.ndarray,
+    x: float = 0.0,
+    y: float = 0.0,
+    start_angle: float = 0.0,
+    length: float = 10.0,
+    width: float = 1.0,
+) -> np.ndarray:
+    """
+    Interprets a token array with the turtle of an L-system, returning a segment table.
+
+    The heading, the scales and the position of the turtle are computed for all tokens at once
+    as prefix sums of the turns, scalings and steps (see `_bracketed_cumsum`), tokens that do
+    not change the turtle being left out first.
+
+    Args:
+        system (LSystem): The L-system the tokens belong to.
+        tokens (np.ndarray): The tokens, e.g. from `LSystem.expand`.
+        x (float, optional): The x-coordinate of the starting point. Defaults to 0.
+        y (float, optional): The y-coordinate of the starting point. Defaults to 0.
+        start_angle (float, optional): The starting heading in degrees; -90 points up on a canvas.
+            Defaults to 0.
+        length (float, optional): The starting step length. Defaults to 10.
+        width (float, optional): The starting width. Defaults to 1.
+
+    Returns:
+        np.ndarray: A float array of shape (n_segments, len(SEGMENT_FIELDS)), one row per drawn
+            step, ordered by depth (the bracket nesting level) and then along the string.
+
+    Raises:
+        ValueError: If the brackets of the string are unbalanced.
+    """
+    tokens = tokens[system.roles[tokens] != IGNORE]
+    roles = system.roles[tokens]
+
+    # The nesting level of every token; brackets count as outside the pair they delimit
+    levels = np.cumsum((roles == PUSH).astype(np.int64) - (roles == POP))
+    levels[roles == PUSH] -= 1
+    if len(levels) and levels.min() < 0:
+        raise ValueError("Unbalanced brackets: a closing bracket comes before its opening bracket")
+    opens, closes = _match_brackets(roles, levels)
+    pair_ranges = _pair_ranges(levels, opens, closes) if len(opens) else None
+
+    def cumulate(per_symbol: np.ndarray) -> np.ndarray:
+        """Returns the state after every token, from the change every symbol makes to it."""
+        if not per_symbol.any():
+            return np.zeros(len(tokens))
+        return _bracketed_cumsum(per_symbol[tokens], pair_ranges, closes)
+
+    # Scales are summed as logarithms; ratios of 0 are taken as the smallest positive float
+    tiny = np.finfo(float).tiny
+    headings = start_angle + cumulate(system.turn_angles)
+    scales = cumulate(np.where(system.roles == SCALE_LENGTH, np.log(max(system.length_ratio, tiny)), 0.0))
+    width_scales = cumulate(np.where(system.roles == SCALE_WIDTH, np.log(max(system.width_ratio, tiny)), 0.0))
+
+    steps = np.flatnonzero((roles == DRAW) | (roles == MOVE))
+    step_lengths = length * np.exp(scales[steps])
+    # Reduce the headings first, so that curves that keep turning one way stay accurate
+    radians = np.radians(np.mod(headings[steps], 360.0))
+    moves = np.zeros(len(tokens), dtype=complex)
+    moves[steps] = (np.cos(radians) + 1j * np.sin(radians)) * step_lengths
+    positions = complex(x, y) + _bracketed_cumsum(moves, pair_ranges, closes)
+
+    drawn = roles[steps] == DRAW
+    rows = steps[drawn]
+    segments = np.empty((len(rows), len(SEGMENT_FIELDS)))
+    ends = positions[rows]
+    starts = ends - (np.cos(radians[drawn]) + 1j * np.sin(radians[drawn])) * step_lengths[drawn]
+    segments[:, X0] = starts.real
+    segments[:, Y0] = starts.imag
+    segments[:, X1] = ends.real
+    segments[:, Y1] = ends.imag
+    segments[:, ANGLE] = headings[rows]
+    segments[:, LENGTH] = step_lengths[drawn]
+    segments[:, WIDTH] = width * np.exp(width_scales[rows])
+    segments[:, DEPTH] = levels[rows]
+    segments[:, KEY] = 0
+    profile_funcs.count("branches_generated", len(segments))
+    if pair_ranges is None:
+        return segments
+    # Generation by generation, like the tables of canopy_segments
+    return segments[np.argsort(segments[:, DEPTH], kind="stable")]
+
+
+def lsystem_segments(
+    system: LSystem,
+    n_iters: int,
+    x: float = 0.0,
+    y: float = 0.0,
+    start_angle: float = 0.0,
+    length: float = 10.0,
+    width: float = 1.0,
+) -> np.ndarray:
+    """
+    Generates the segment table of an L-system after a number of iterations.
+
+    Args:
+        system (LSystem): The L-system, e.g. from PRESETS or `canopy_lsystem`.
+        n_iters (int): The number of iterations of the rules.
+        x, y, start_angle, length, width: The starting state of the turtle, see `turtle_segments`.
+
+    Returns:
+        np.ndarray: The segment table, see `turtle_segments`.
+    """
+    with profile_funcs.phase("lsystem_expand"):
+        tokens = system.expand(n_iters)
+    return turtle_segments(system, tokens, x, y, start_angle, length, width)
+
+
+def lsystem_fractal(
+    canvas: DrawingBackend,
+    x: float,
+    y: float,
+    system: LSystem | str,
+    n_iters: int,
+    length: float = 10.0,
+    start_angle: float = 0.0,
+    width: float = 1.0,
+    color: str | list = "#000000",
+) -> list:
+    """
+    Draws an L-system on the provided Tkinter canvas, one line item per drawn step.
+
+    Args:
+        canvas (DrawingBackend): The Tkinter canvas, or any other drawing backend, on which to draw.
+        x (float): The x-coordinate of the starting point.
+        y (float): The y-coordinate of the starting point.
+        system (LSystem or str): The L-system, or the name of one of PRESETS.
+        n_iters (int): The number of iterations of the rules.
+        length (float, optional): The starting step length. Defaults to 10.
+        start_angle (float, optional): The starting heading in degrees. Defaults to 0 (to the right).
+        width (float, optional): The starting width. Defaults to 1.
+        color (str or list, optional): The color of the steps in hex format, or a list of hex values
+            by depth as in `fractal_funcs.depth_colors`. Defaults to "#000000" (black).
+
+    Returns:
+        list: The ids of the created canvas items.
+    """
+    if isinstance(system, str):
+        system = PRESETS[system]
+    segments = lsystem_segments(system, n_iters, x, y, start_angle, length, width)
+    # Color by depth from the root, whatever the number of iterations
+    n_levels = int(segments[:, DEPTH].max(initial=0)) + 1
+    return draw_canopy_segments(canvas, segments, n_levels, color)
+
+
+# Classic L-systems, with the usual angles
+PRESETS = {
+    "koch": LSystem("F", {"F": "F+F--F+F"}, angle=60),
+    "snowflake": LSystem("F--F--F", {"F": "F+F--F+F"}, angle=60),
+    "dragon": LSystem("FX", {"X": "X+YF+", "Y": "-FX-Y"}, angle=90),
+    "hilbert": LSystem("A", {"A": "+BF-AFA-FB+", "B": "-AF+BFB+FA-"}, angle=90),
+    "sierpinski": LSystem("F-G-G", {"F": "F-G+F+G-F", "G": "GG"}, angle=120),
+    "arrowhead": LSystem("F", {"F": "G-F-G", "G": "F+G+F"}, angle=60),
+    "gosper": LSystem("F", {"F": "F-G--G+F++FF+G-", "G": "+F-GG--G-F++F+G"}, angle=60),
+    "plant": LSystem("X", {"X": 'F+[[X]-X]-F[-FX]+X', "F": "FF"}, angle=25),
+    "canopy": canopy_lsystem(angle_delta=60),
+}
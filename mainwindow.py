@@ -2,15 +2,42 @@
 Main module for the application.
 
 This module initializes the main application window, sets up the canvas,
-adds sliders for various parameters, and binds events for canvas zooming.
+adds sliders for various parameters, binds events for canvas zooming,
+draws the fractal canopy described by the sliders and highlights the
+branch under the mouse.
+
+The scene shown when the window is closed is saved to a geometry store
+(see store_funcs), and shown again at the next launch straight from the
+store, without being generated; --no-store turns this off.
+
+With --profile the time of every frame and the number of canvas items are
+shown on the canvas, and with --trace a Chrome trace of the hot paths is
+saved when the window is closed (see profile_funcs).
 """
 
+import argparse
 import tkinter as tk
 
+import profile_funcs
+from store_funcs import GeometryStore, DEFAULT_STORE_DIR
 from gui import (initialise_gui,
                  populate_sliders,
-                 bind_canvas_zoom_events)
-from sandbox import draw_squares
+                 bind_canvas_zoom_events,
+                 bind_slider_redraw,
+                 bind_branch_hover,
+                 restore_sliders,
+                 bind_scene_store,
+                 show_profile_overlay)
+
+parser = argparse.ArgumentParser(description="Draw fractal canopies controlled by sliders.")
+parser.add_argument("--profile", action="store_true", help="show the frame time and item count on the canvas")
+parser.add_argument("--trace", metavar="FILE", help="save a Chrome trace JSON file when the window is closed")
+parser.add_argument("--store", default=DEFAULT_STORE_DIR,
+                    help=f"directory of the geometry store (default: {DEFAULT_STORE_DIR})")
+parser.add_argument("--no-store", dest="store", action="store_const", const=None,
+                    help="neither read nor save the scene")
+args = parser.parse_args()
+store = GeometryStore(args.store) if args.store else None
 
 # Main application window
 window_width = 1300
@@ -35,10 +62,24 @@ sliders_frame = tk.Frame(window)
 sliders_frame.grid(row=1, column=0, columnspan=3, pady=10)
 
 # Create sliders
-populate_sliders(sliders_frame, 4)
+sliders = populate_sliders(sliders_frame, 4)
+if store is not None:
+    # Start from the scene shown when the window was last closed
+    restore_sliders(sliders, store)
 
-draw_squares(canvas)
 bind_canvas_zoom_events(canvas)
+# Draw the canopy and redraw it whenever a slider moves
+redraw = bind_slider_redraw(canvas, sliders, store=store)
+if store is not None:
+    bind_scene_store(window, sliders, redraw)
+# Highlight the branch under the mouse
+bind_branch_hover(canvas, redraw.view)
+if args.profile:
+    show_profile_overlay(canvas)
+if args.trace:
+    profile_funcs.enable()
 
 # Run the Tkinter event loop
 window.mainloop()
+if args.trace:
+    profile_funcs.save_trace(args.trace)
@@ -0,0 +1,162 @@
+"""
+parallel_funcs.py
+
+This module contains functions for generating large fractal canopies
+on several processes at once.
+
+The subtrees below the branches of a given depth are independent of
+each other, so the canopy is generated serially down to that depth and
+the subtrees are then grown by a pool of worker processes. Because the
+number of branches of every generation is known in advance, the whole
+segment table is allocated once in shared memory and every worker writes
+its rows directly into their final place. Nothing is sent back through
+pipes, and the result is identical to `fractal_funcs.canopy_segments`.
+Randomized canopies come out identical too, since the random variation of
+every branch follows from its path key rather than from the order in which
+the branches are generated.
+
+Starting the pool and attaching the workers to the shared table costs tens
+of milliseconds, about what generating a few hundred thousand branches serially
+takes, so smaller canopies are generated serially (see MIN_PARALLEL_ROWS).
+
+On platforms that start worker processes by spawning a new interpreter
+(Windows, macOS), callers must be guarded by `if __name__ == "__main__":`.
+
+Functions:
+    parallel_canopy_segments()
+        Generates the segment table of a fractal canopy using several processes.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+
+from fractal_funcs import canopy_segments, grow_canopy, SEGMENT_FIELDS
+
+# Canopies with fewer branches than this are generated faster without a process pool
+MIN_PARALLEL_ROWS = 2 ** 20
+
+
+def _grow_into_shared_table(
+    shm_name: str,
+    n_rows: int,
+    seeds: np.ndarray,
+    level_rows: list[tuple[int, int]],
+    growth_params: dict,
+) -> None:
+    """
+    Grows the subtrees of a chunk of seeds and writes each generation into the shared table.
+
+    `level_rows` holds, for every generation below the seeds, the row of the shared table
+    where this chunk's branches of that generation start and how many there are.
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        table = np.ndarray((n_rows, len(SEGMENT_FIELDS)), dtype=np.float64, buffer=shm.buf)
+        branches, _ = grow_canopy(seeds, **growth_params)
+        row = 0
+        for start, count in level_rows:
+            table[start:start + count] = branches[row:row + count]
+            row += count
+        del table
+    finally:
+        shm.close()
+
+
+def parallel_canopy_segments(
+    x: float,
+    y: float,
+    off_angle: float = 0,
+    angle_delta: float = 10,
+    start_angle: float = -90,
+    n_splits: int = 2,
+    n_iters: int = 3,
+    length_ratio: float = 0.75,
+    init_length: float = 200,
+    width: float = 1,
+    width_ratio: float = 0.75,
+    angle_jitter: float = 0.0,
+    length_jitter: float = 0.0,
+    width_jitter: float = 0.0,
+    branch_drop: float = 0.0,
+    seed: int | np.random.Generator | None = None,
+    split_depth: int = 2,
+    max_workers: int | None = None,
+    min_rows: int = MIN_PARALLEL_ROWS,
+) -> np.ndarray:
+    """
+    Generates the segment table of a fractal canopy using several processes.
+
+    The tree is generated serially down to `split_depth`; the subtrees of the
+    branches at that depth are divided into contiguous chunks and grown by worker
+    processes straight into a shared segment table. The rows come out in the same
+    order as from `fractal_funcs.canopy_segments`, whatever the number of workers.
+
+    The canopy is generated serially instead, with the same result, when:
+        - it has a `branch_drop`, since the number of branches of every generation
+          is then not known in advance;
+        - it has fewer than `min_rows` branches, since starting the pool would take
+          longer than generating them;
+        - fewer than 2 workers are available, `split_depth` is not above the leaves,
+          or `n_iters` is fractional (see `fractal_funcs.canopy_segments`).
+    On a machine with one CPU, the pool is thus only used when asked for explicitly
+    with `max_workers` (e.g. `export_canopy.py --workers`), and it is slower then.
+
+    Args:
+        x, y, off_angle, angle_delta, start_angle, n_splits, n_iters, length_ratio,
+        init_length, width, width_ratio, angle_jitter, length_jitter, width_jitter,
+        branch_drop, seed: See `fractal_funcs.canopy_segments`.
+        split_depth (int, optional): The depth of the branches whose subtrees are
+            handed out to the workers. Defaults to 2.
+        max_workers (int, optional): The number of worker processes.
+            Defaults to the number of CPUs.
+        min_rows (int, optional): The number of branches below which the canopy
+            is generated serially. Defaults to MIN_PARALLEL_ROWS.
+
+    Returns:
+        np.ndarray: A float array of shape (n_branches, len(SEGMENT_FIELDS)).
+    """
+    geometry = dict(off_angle=off_angle, angle_delta=angle_delta, n_splits=n_splits,
+                    length_ratio=length_ratio, width_ratio=width_ratio, angle_jitter=angle_jitter,
+                    length_jitter=length_jitter, width_jitter=width_jitter, branch_drop=branch_drop)
+    max_workers = max_workers or os.cpu_count() or 1
+    n_levels = n_iters - 1
+    level_sizes = [n_splits ** depth for depth in range(max(int(n_levels), 0))]
+    if (max_workers < 2 or split_depth < 0 or split_depth >= n_levels - 1 or n_splits < 1
+            or branch_drop or n_iters != int(n_iters) or sum(level_sizes) < min_rows):
+        return canopy_segments(x, y, start_angle=start_angle, n_iters=n_iters,
+                               init_length=init_length, width=width, seed=seed, **geometry)
+
+    top = canopy_segments(x, y, start_angle=start_angle, n_iters=split_depth + 2,
+                          init_length=init_length, width=width, seed=seed, **geometry)
+    level_starts = np.cumsum([0] + level_sizes)
+    n_rows = int(level_starts[-1])
+    seeds = top[level_starts[split_depth]:]
+
+    shm = shared_memory.SharedMemory(create=True, size=n_rows * len(SEGMENT_FIELDS) * 8)
+    try:
+        table = np.ndarray((n_rows, len(SEGMENT_FIELDS)), dtype=np.float64, buffer=shm.buf)
+        table[:len(top)] = top
+
+        # A few chunks per worker keep the workers busy until the end
+        bounds = np.linspace(0, len(seeds), min(len(seeds), 4 * max_workers) + 1).astype(int)
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = []
+            for first, last in zip(bounds[:-1], bounds[1:]):
+                # The descendants of seeds first..last are contiguous in every generation
+                level_rows = [(int(level_starts[depth]) + first * n_splits ** (depth - split_depth),
+                               (last - first) * n_splits ** (depth - split_depth))
+                              for depth in range(split_depth + 1, n_levels)]
+                futures.append(executor.submit(_grow_into_shared_table, shm.name, n_rows,
+                                               seeds[first:last], level_rows,
+                                               dict(n_iters=n_iters, **geometry)))
+            for future in futures:
+                future.result()
+
+        segments = table.copy()
+        del table
+    finally:
+        shm.close()
+        shm.unlink()
+    return segments
@@ -0,0 +1,199 @@
+"""
+profile_funcs.py
+
+This module contains the built-in instrumentation of the hot paths: timers of
+the phases of generating, drawing and zooming canopies, and counters of the
+branches generated, canvas items created, moved and scaled, and cache hits.
+
+Instrumentation is off by default and then costs one flag check per phase or
+counter, none of which sit inside per-branch loops. It is switched on with
+`enable`, or for a whole run with the FRACTAL_PROFILE environment variable:
+any value but "" or "0" switches it on, and a value ending in ".json" also
+saves a trace to that file when the program exits, e.g.
+
+    FRACTAL_PROFILE=trace.json python mainwindow.py
+
+Traces are in the Chrome trace event format and open in chrome://tracing or
+https://ui.perfetto.dev, with one row per thread, so the generations computed
+by the background worker show up next to the frames of the event loop.
+
+Functions:
+    enable()
+        Switches the instrumentation on or off.
+    is_enabled()
+        Returns whether the instrumentation is on.
+    phase()
+        Returns a context manager timing one phase.
+    timed()
+        Decorates a function so that every call is timed as a phase.
+    count()
+        Adds to a counter.
+    stats()
+        Returns the totals of the phases and counters recorded so far.
+    reset()
+        Clears the phases, counters and trace recorded so far.
+    trace_events()
+        Returns the recorded trace as Chrome trace events.
+    save_trace()
+        Saves the recorded trace as a Chrome trace JSON file.
+"""
+
+import atexit
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+from collections import Counter, deque
+from typing import Callable
+
+# Environment variable that switches the instrumentation on, and names the trace file
+PROFILE_ENV = "FRACTAL_PROFILE"
+# Largest number of trace events kept; older ones are dropped first
+MAX_TRACE_EVENTS = 200_000
+
+_enabled = False
+_lock = threading.Lock()
+# Name -> [count, total ns, max ns, last ns, end of the last one in ns]
+_phases = {}
+_counters = Counter()
+# (kind, name, start ns, duration ns or counter value, thread id) tuples
+_events = deque(maxlen=MAX_TRACE_EVENTS)
+_origin_ns = time.perf_counter_ns()
+_NO_PHASE = contextlib.nullcontext()
+
+
+class _Phase:
+    """Times one phase and records it when it ends."""
+
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        end = time.perf_counter_ns()
+        duration = end - self.start
+        with _lock:
+            totals = _phases.get(self.name)
+            if totals is None:
+                totals = _phases[self.name] = [0, 0, 0, 0, 0]
+            totals[0] += 1
+            totals[1] += duration
+            totals[2] = max(totals[2], duration)
+            totals[3] = duration
+            totals[4] = end
+            _events.append(("X", self.name, self.start, duration, threading.get_ident()))
+        return False
+
+
+def enable(enabled: bool = True) -> None:
+    """Switches the instrumentation on or off. What was recorded so far is kept."""
+    global _enabled
+    _enabled = enabled
+
+
+def is_enabled() -> bool:
+    """Returns whether the instrumentation is on."""
+    return _enabled
+
+
+def phase(name: str):
+    """
+    Returns a context manager timing one phase, e.g. `with phase("draw_items"): ...`.
+    When the instrumentation is off, it is a shared no-op context manager.
+    """
+    return _Phase(name) if _enabled else _NO_PHASE
+
+
+def timed(name: str | None = None) -> Callable[[Callable], Callable]:
+    """
+    Decorates a function so that every call is timed as a phase, named after the function by default.
+    When the instrumentation is off, the call goes straight through.
+    """
+    def decorate(func: Callable) -> Callable:
+        phase_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Phase(phase_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def count(name: str, amount: int = 1) -> None:
+    """Adds `amount` to a counter, if the instrumentation is on."""
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] += amount
+        _events.append(("C", name, time.perf_counter_ns(), _counters[name], threading.get_ident()))
+
+
+def stats() -> dict:
+    """
+    Returns the totals of the phases and counters recorded so far.
+
+    Returns:
+        dict: {"phases": {name: {"count", "total_ms", "mean_ms", "max_ms", "last_ms", "last_end_ms"}},
+            "counters": {name: total}}, with times in milliseconds.
+    """
+    with _lock:
+        phases = {name: {"count": calls,
+                         "total_ms": total / 1e6,
+                         "mean_ms": total / calls / 1e6,
+                         "max_ms": longest / 1e6,
+                         "last_ms": last / 1e6,
+                         "last_end_ms": (end - _origin_ns) / 1e6}
+                  for name, (calls, total, longest, last, end) in _phases.items()}
+        return {"phases": phases, "counters": dict(_counters)}
+
+
+def reset() -> None:
+    """Clears the phases, counters and trace recorded so far."""
+    with _lock:
+        _phases.clear()
+        _counters.clear()
+        _events.clear()
+
+
+def trace_events() -> list[dict]:
+    """
+    Returns the recorded trace as Chrome trace events: a complete ("X") event per phase
+    and a counter ("C") event per change of a counter, with times in microseconds.
+    """
+    pid = os.getpid()
+    with _lock:
+        events = list(_events)
+    return [{"name": name, "ph": "X", "ts": (start - _origin_ns) / 1000, "dur": value / 1000,
+             "pid": pid, "tid": thread}
+            if kind == "X" else
+            {"name": name, "ph": "C", "ts": (start - _origin_ns) / 1000, "args": {name: value},
+             "pid": pid, "tid": thread}
+            for kind, name, start, value, thread in events]
+
+
+def save_trace(path: str) -> None:
+    """Saves the recorded trace as a Chrome trace JSON file, with the totals in its metadata."""
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump({"traceEvents": trace_events(), "displayTimeUnit": "ms", "otherData": stats()}, file)
+
+
+def _enable_from_environment() -> None:
+    setting = os.environ.get(PROFILE_ENV, "")
+    if setting not in ("", "0"):
+        enable()
+        if setting.endswith(".json"):
+            atexit.register(save_trace, setting)
+
+
+_enable_from_environment()
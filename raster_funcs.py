@@ -0,0 +1,164 @@
+"""
+raster_funcs.py
+
+This module contains functions for drawing lines into an in-memory RGBA
+image with NumPy, so that large numbers of branches can be rendered
+without creating a canvas item for each of them and without a display.
+
+Functions:
+    rasterize_lines()
+        Draws many thick line segments into an RGBA image at once.
+    encode_png()
+        Encodes an RGBA image as PNG data.
+    photo_image()
+        Creates a Tkinter PhotoImage from an RGBA image.
+"""
+
+import base64
+import struct
+import tkinter as tk
+import zlib
+import numpy as np
+
+
+def _disc_offsets(radius: float) -> np.ndarray:
+    """Returns the (dy, dx) offsets of the pixels covered by a disc of the given radius."""
+    reach = int(np.ceil(radius))
+    dy, dx = np.mgrid[-reach:reach + 1, -reach:reach + 1]
+    inside = dx * dx + dy * dy <= radius * radius
+    return np.stack((dy[inside], dx[inside]), axis=-1)
+
+
+def _clip_segments(x0: np.ndarray, y0: np.ndarray, x1: np.ndarray, y1: np.ndarray,
+                   x_min: np.ndarray, y_min: np.ndarray, x_max: np.ndarray, y_max: np.ndarray) -> tuple:
+    """
+    Clips segments to rectangles, one per segment (Liang-Barsky).
+
+    Returns:
+        tuple: The clipped x0, y0, x1, y1, and whether each segment crosses its rectangle at all.
+    """
+    dx, dy = x1 - x0, y1 - y0
+    start, end = np.zeros_like(x0), np.ones_like(x0)
+    visible = np.ones(x0.shape, dtype=bool)
+    # The segment is inside where p * t <= q along each of the four edges
+    for p, q in ((-dx, x0 - x_min), (dx, x_max - x0), (-dy, y0 - y_min), (dy, y_max - y0)):
+        parallel = p == 0
+        visible &= ~parallel | (q >= 0)
+        t = np.divide(q, p, out=np.zeros_like(q), where=~parallel)
+        start = np.where(p < 0, np.maximum(start, t), start)
+        end = np.where(p > 0, np.minimum(end, t), end)
+    visible &= start <= end
+    # Segments that are not cut keep their end points exactly
+    return (np.where(start > 0, x0 + dx * start, x0), np.where(start > 0, y0 + dy * start, y0),
+            np.where(end < 1, x0 + dx * end, x1), np.where(end < 1, y0 + dy * end, y1), visible)
+
+
+def rasterize_lines(x0: np.ndarray,
+                    y0: np.ndarray,
+                    x1: np.ndarray,
+                    y1: np.ndarray,
+                    widths: np.ndarray,
+                    colors: np.ndarray,
+                    width: int,
+                    height: int,
+                    background: tuple = (0, 0, 0, 0)) -> np.ndarray:
+    """
+    Draws many thick line segments into an RGBA image at once.
+
+    Every segment is first clipped to the image, grown by its half width, so that
+    branches reaching far outside the image at a deep zoom are only sampled where
+    they can be seen. It is then sampled at intervals of at most half its width
+    (and at least every half pixel), and a disc of its width is stamped
+    at every sample, which gives round caps and joins. All samples of all
+    segments are computed together. Where segments overlap, the one that
+    comes later in the input is on top, as on a Tkinter canvas.
+
+    Args:
+        x0 (np.ndarray): The x-coordinates of the starting points, in pixels.
+        y0 (np.ndarray): The y-coordinates of the starting points, in pixels.
+        x1 (np.ndarray): The x-coordinates of the ending points, in pixels.
+        y1 (np.ndarray): The y-coordinates of the ending points, in pixels.
+        widths (np.ndarray): The widths of the segments, in pixels.
+        colors (np.ndarray): The RGBA colors of the segments, an (N, 4) uint8 array.
+        width (int): The width of the image.
+        height (int): The height of the image.
+        background (tuple, optional): The RGBA color of the background.
+            Defaults to (0, 0, 0, 0), fully transparent.
+
+    Returns:
+        np.ndarray: The image as a (height, width, 4) uint8 array.
+    """
+    x0, y0, x1, y1, widths = (np.atleast_1d(np.asarray(a, dtype=float))
+                              for a in (x0, y0, x1, y1, widths))
+    # Index 0 of the key buffer is the background, index i + 1 the i-th segment
+    palette = np.empty((x0.size + 1, 4), dtype=np.uint8)
+    palette[0] = background
+    palette[1:] = colors
+    keys = np.zeros(height * width, dtype=np.int64)
+
+    # Round the radii to half pixels so that segments can share disc stamps
+    radii = np.maximum(np.round(widths), 1) / 2
+    steps = np.maximum(radii, 1) / 2
+    reach = radii + 1
+    x0, y0, x1, y1, visible = _clip_segments(x0, y0, x1, y1, -reach, -reach,
+                                             width - 1 + reach, height - 1 + reach)
+    counts = np.where(visible, np.ceil(np.hypot(x1 - x0, y1 - y0) / steps).astype(np.int64) + 1, 0)
+
+    for radius in np.unique(radii):
+        selected = np.flatnonzero(radii == radius)
+        sample_counts = counts[selected]
+        segment = np.repeat(selected, sample_counts)
+        first = np.repeat(np.cumsum(sample_counts) - sample_counts, sample_counts)
+        t = (np.arange(sample_counts.sum()) - first) / np.maximum(counts[segment] - 1, 1)
+        sample_x = np.rint(x0[segment] + (x1[segment] - x0[segment]) * t).astype(np.int64)
+        sample_y = np.rint(y0[segment] + (y1[segment] - y0[segment]) * t).astype(np.int64)
+
+        offsets = _disc_offsets(radius)
+        pixel_y = (sample_y[:, np.newaxis] + offsets[:, 0]).ravel()
+        pixel_x = (sample_x[:, np.newaxis] + offsets[:, 1]).ravel()
+        segment = np.repeat(segment, len(offsets))
+        inside = (pixel_x >= 0) & (pixel_x < width) & (pixel_y >= 0) & (pixel_y < height)
+        np.maximum.at(keys, pixel_y[inside] * width + pixel_x[inside], segment[inside] + 1)
+
+    return palette[keys].reshape(height, width, 4)
+
+
+def encode_png(image: np.ndarray) -> bytes:
+    """
+    Encodes an RGBA image as PNG data.
+
+    Args:
+        image (np.ndarray): The image as a (height, width, 4) uint8 array.
+
+    Returns:
+        bytes: The PNG file contents.
+    """
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return (struct.pack(">I", len(data)) + kind + data
+                + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff))
+
+    height, width = image.shape[:2]
+    # Every scanline starts with filter type 0 (none)
+    scanlines = np.zeros((height, width * 4 + 1), dtype=np.uint8)
+    scanlines[:, 1:] = np.ascontiguousarray(image, dtype=np.uint8).reshape(height, -1)
+    header = struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", header)
+            + chunk(b"IDAT", zlib.compress(scanlines.tobytes(), 6))
+            + chunk(b"IEND", b""))
+
+
+def photo_image(image: np.ndarray, master: tk.Misc | None = None) -> tk.PhotoImage:
+    """
+    Creates a Tkinter PhotoImage from an RGBA image.
+
+    Args:
+        image (np.ndarray): The image as a (height, width, 4) uint8 array.
+        master (tk.Misc, optional): The widget whose Tk interpreter owns the image.
+            Defaults to the default root window.
+
+    Returns:
+        tk.PhotoImage: The image, ready to be placed on a canvas with `create_image`.
+    """
+    return tk.PhotoImage(master=master, format="png",
+                         data=base64.b64encode(encode_png(image)).decode("ascii"))
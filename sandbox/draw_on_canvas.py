@@ -16,14 +16,14 @@ Usage example:
     draw_squares(canvas, 8, 50)
     window.mainloop()
 """
-import tkinter as tk
+from canvas_funcs import DrawingBackend
 
 
-def draw_squares(canvas: tk.Canvas, num_squares: int = 8, square_size: float = 50, color: str = "blue") -> None:
+def draw_squares(canvas: DrawingBackend, num_squares: int = 8, square_size: float = 50, color: str = "blue") -> None:
     """
     Draw squares on the canvas.
     Args:
-        canvas: tkinter.Canvas object
+        canvas: tkinter.Canvas object, or any other drawing backend (see canvas_funcs)
         num_squares: Number of squares to draw
         square_size: Size of each square
         color: Color of the squares
@@ -0,0 +1,221 @@
+"""
+score_funcs.py
+
+This module contains functions for scoring how similar fractal canopies are,
+e.g. how close the player's canopy is to the target in the matching game.
+
+Canopies can be compared on their parameters, or on their geometry through
+a descriptor: a fixed-length vector of normalized histograms describing where
+the branches are (coverage grids at several resolutions), which way they point
+(orientation histograms at several resolutions) and how long they are (a
+histogram of lengths on a log scale). Every histogram is weighted by branch
+length, so the descriptor follows what the drawing looks like rather than the
+number of branches. Two descriptors are compared by histogram intersection.
+
+All functions work on batches: the descriptors of many canopies are computed
+together with a handful of array operations, and many candidates are scored
+against one target at once.
+
+Functions:
+    parameter_similarity()
+        Scores candidate canopy parameters against target parameters.
+    canopy_descriptors()
+        Computes the geometric descriptors of a batch of segment tables.
+    descriptor_similarity()
+        Scores candidate descriptors against a target descriptor.
+    canopy_similarity()
+        Scores candidate segment tables against a target segment table.
+"""
+
+import numpy as np
+
+from fractal_funcs import X0, Y0, X1, Y1, ANGLE, LENGTH, DEPTH
+
+# The range of every parameter of the matching game, as on the sliders
+PARAMETER_RANGES = {
+    "off_angle": (-45, 45),
+    "angle_delta": (0, 180),
+    "n_splits": (2, 8),
+    "length_ratio": (0, 1),
+    "width_ratio": (0.5, 0.75),
+}
+# Resolutions of the coverage grids, in cells per side; each divides the last one
+GRID_SIZES = (4, 8, 16)
+# Resolutions of the orientation histograms, in bins per full turn; each divides the last one
+ORIENTATION_BINS = (12, 36)
+# The length histogram spans this many halvings below the longest branch, two bins per halving
+LENGTH_OCTAVES = 8
+# Number of points sampled along every branch for the coverage grids
+SAMPLES_PER_BRANCH = 2
+
+_BLOCK_SIZES = ([size * size for size in GRID_SIZES] + list(ORIENTATION_BINS) + [2 * LENGTH_OCTAVES])
+_BLOCK_STARTS = np.cumsum([0] + _BLOCK_SIZES)
+DESCRIPTOR_SIZE = int(_BLOCK_STARTS[-1])
+
+
+def parameter_similarity(
+    candidates: dict | list[dict],
+    target: dict,
+    ranges: dict = PARAMETER_RANGES,
+) -> float | np.ndarray:
+    """
+    Scores candidate canopy parameters against target parameters.
+
+    Every parameter of `ranges` present in the target contributes one minus its
+    difference relative to its range; the score is the mean of the contributions.
+
+    Args:
+        candidates (dict or list): The parameters of one candidate or of many.
+        target (dict): The parameters of the target.
+        ranges (dict, optional): The (low, high) range of every compared parameter.
+            Defaults to PARAMETER_RANGES.
+
+    Returns:
+        float or np.ndarray: The score between 0 and 1 (1 for identical parameters)
+            of the candidate, or an array of the scores of the candidates.
+    """
+    single = isinstance(candidates, dict)
+    candidates = [candidates] if single else candidates
+    names = [name for name in ranges if name in target]
+    if not names:
+        raise ValueError("The target has none of the compared parameters")
+    values = np.array([[candidate.get(name, target[name]) for name in names] for candidate in candidates],
+                      dtype=float).reshape(len(candidates), len(names))
+    spans = np.array([ranges[name][1] - ranges[name][0] for name in names], dtype=float)
+    target_values = np.array([target[name] for name in names], dtype=float)
+    scores = 1 - np.clip(np.abs(values - target_values) / spans, 0, 1).mean(axis=1)
+    return float(scores[0]) if single else scores
+
+
+def canopy_descriptors(
+    tables: list[np.ndarray],
+    frame: tuple[float, float, float] | None = None,
+) -> np.ndarray:
+    """
+    Computes the geometric descriptors of a batch of segment tables.
+
+    The coverage grids are laid over a square frame centred on the start of the trunk.
+    By default every canopy gets its own frame, just large enough to hold it, so that
+    the descriptor does not depend on where the canopy stands or how large it is.
+
+    Args:
+        tables (list): Segment tables, as from `fractal_funcs.canopy_segments`.
+        frame (tuple, optional): The (x, y, half_size) of one square frame used for all
+            tables instead, so that position and size count too.
+
+    Returns:
+        np.ndarray: A (len(tables), DESCRIPTOR_SIZE) array of descriptors.
+    """
+    sizes = np.array([len(table) for table in tables])
+    if not sizes.sum():
+        return np.zeros((len(tables), DESCRIPTOR_SIZE))
+    segments = np.concatenate([table for table in tables if len(table)])
+    owner = np.repeat(np.arange(len(tables)), sizes)
+    starts = np.cumsum(sizes) - sizes
+    weights = segments[:, LENGTH]
+
+    if frame is None:
+        # The trunk is the shallowest branch of every table, and the frame reaches its farthest end point
+        nonempty = starts[sizes > 0]
+        order = segments[:, DEPTH] * (len(segments) + 1) + np.arange(len(segments))
+        roots = np.minimum.reduceat(order, nonempty).astype(np.int64) % (len(segments) + 1)
+        origin_x = np.zeros(len(tables))
+        origin_y = np.zeros(len(tables))
+        origin_x[sizes > 0] = segments[roots, X0]
+        origin_y[sizes > 0] = segments[roots, Y0]
+        reach = np.maximum(np.abs(segments[:, X1] - origin_x[owner]), np.abs(segments[:, Y1] - origin_y[owner]))
+        half_size = np.full(len(tables), 1e-9)
+        half_size[sizes > 0] = np.maximum(np.maximum.reduceat(reach, nonempty), 1e-9)
+    else:
+        origin_x = np.full(len(tables), float(frame[0]))
+        origin_y = np.full(len(tables), float(frame[1]))
+        half_size = np.full(len(tables), float(frame[2]))
+
+    descriptors = np.empty((len(tables), DESCRIPTOR_SIZE))
+    blocks = iter(zip(_BLOCK_STARTS[:-1], _BLOCK_STARTS[1:]))
+
+    # Coverage: points sampled along every branch, binned on the finest grid only;
+    # the coarser grids are sums of its cells
+    finest = GRID_SIZES[-1]
+    cell_scale = (finest / 2) / half_size[owner]
+    t = (np.arange(SAMPLES_PER_BRANCH) + 0.5) / SAMPLES_PER_BRANCH
+    sample_x = ((segments[:, X0] - origin_x[owner]) * cell_scale + finest / 2)[:, np.newaxis] \
+        + ((segments[:, X1] - segments[:, X0]) * cell_scale)[:, np.newaxis] * t
+    sample_y = ((segments[:, Y0] - origin_y[owner]) * cell_scale + finest / 2)[:, np.newaxis] \
+        + ((segments[:, Y1] - segments[:, Y0]) * cell_scale)[:, np.newaxis] * t
+    cells = (np.clip(sample_y, 0, finest - 1).astype(np.int64) * finest
+             + np.clip(sample_x, 0, finest - 1).astype(np.int64)
+             + (owner * finest * finest)[:, np.newaxis])
+    grid = np.bincount(cells.ravel(), weights=np.repeat(weights, SAMPLES_PER_BRANCH),
+                       minlength=len(tables) * finest * finest).reshape(len(tables), finest, finest)
+    for size in GRID_SIZES:
+        start, stop = next(blocks)
+        step = finest // size
+        descriptors[:, start:stop] = grid.reshape(len(tables), size, step, size, step).sum(axis=(2, 4)) \
+            .reshape(len(tables), -1)
+
+    # Orientation, binned at the finest resolution only as well
+    finest = ORIENTATION_BINS[-1]
+    turns = (segments[:, ANGLE] / 360) % 1
+    orientation = np.bincount(np.minimum((turns * finest).astype(np.int64), finest - 1) + owner * finest,
+                              weights=weights, minlength=len(tables) * finest).reshape(len(tables), finest)
+    for n_bins in ORIENTATION_BINS:
+        start, stop = next(blocks)
+        descriptors[:, start:stop] = orientation.reshape(len(tables), n_bins, finest // n_bins).sum(axis=2)
+
+    # Length, in half octaves below the longest branch of every canopy
+    nonempty = starts[sizes > 0]
+    longest = np.zeros(len(tables))
+    longest[sizes > 0] = np.maximum.reduceat(weights, nonempty)
+    octaves = -np.log2(np.maximum(weights, 1e-12) / np.maximum(longest[owner], 1e-12))
+    length_bins = np.clip((octaves * 2).astype(np.int64), 0, 2 * LENGTH_OCTAVES - 1)
+    start, stop = next(blocks)
+    descriptors[:, start:stop] = np.bincount(length_bins + owner * (stop - start), weights=weights,
+                                             minlength=len(tables) * (stop - start)).reshape(len(tables), -1)
+
+    # Every block is a histogram that sums to 1
+    for start, stop in zip(_BLOCK_STARTS[:-1], _BLOCK_STARTS[1:]):
+        totals = descriptors[:, start:stop].sum(axis=1, keepdims=True)
+        descriptors[:, start:stop] /= np.where(totals > 0, totals, 1)
+    return descriptors
+
+
+def descriptor_similarity(descriptors: np.ndarray, target: np.ndarray) -> np.ndarray:
+    """
+    Scores candidate descriptors against a target descriptor.
+
+    Args:
+        descriptors (np.ndarray): A (n_candidates, DESCRIPTOR_SIZE) array, or one descriptor.
+        target (np.ndarray): The descriptor of the target.
+
+    Returns:
+        np.ndarray: The mean histogram intersection of every candidate with the target,
+            between 0 and 1 (1 for identical descriptors).
+    """
+    return np.minimum(descriptors, target).sum(axis=-1) / len(_BLOCK_SIZES)
+
+
+def canopy_similarity(
+    candidates: np.ndarray | list[np.ndarray],
+    target: np.ndarray,
+    frame: tuple[float, float, float] | None = None,
+) -> float | np.ndarray:
+    """
+    Scores candidate segment tables against a target segment table.
+    When many candidates are scored against the same target, computing its
+    descriptor once with `canopy_descriptors` and using `descriptor_similarity` is faster.
+
+    Args:
+        candidates (np.ndarray or list): One segment table or a list of them.
+        target (np.ndarray): The segment table of the target.
+        frame (tuple, optional): See `canopy_descriptors`.
+
+    Returns:
+        float or np.ndarray: The score between 0 and 1 of the candidate,
+            or an array of the scores of the candidates.
+    """
+    single = isinstance(candidates, np.ndarray)
+    tables = [candidates] if single else list(candidates)
+    descriptors = canopy_descriptors(tables + [target], frame)
+    scores = descriptor_similarity(descriptors[:-1], descriptors[-1])
+    return float(scores[0]) if single else scores
@@ -0,0 +1,241 @@
+"""
+spatial_funcs.py
+
+This module contains a spatial index of the branches of a fractal canopy, to
+find the branch under the mouse or the branches in a rectangle without going
+through every branch or canvas item.
+
+The index is a uniform grid in model coordinates (those of the segment table).
+Every branch is entered in each cell that its bounding box, grown by a margin,
+covers. The cells are stored compressed: one array of branch indices sorted by
+cell and one array of where every cell starts in it, both built with a handful
+of array operations for the whole table. A query only looks at the branches
+entered in the cells around it, so its cost follows the number of branches
+nearby rather than the size of the canopy. Since the index is over branches
+rather than drawn points, sine wave branches cost the same as straight ones;
+their amplitude is part of the margin.
+
+Classes:
+    SegmentGrid
+        A uniform grid index of the branches of a segment table.
+
+Functions:
+    point_segment_distances()
+        Returns the distance from a point to each of a set of line segments.
+"""
+
+import numpy as np
+
+from fractal_funcs import X0, Y0, X1, Y1
+
+# Largest number of cells along either side of a grid
+MAX_GRID_CELLS = 2048
+# Average number of branches per cell targeted by the default cell size
+BRANCHES_PER_CELL = 2
+
+
+def point_segment_distances(x: float, y: float, lines: np.ndarray) -> np.ndarray:
+    """
+    Returns the distance from a point to each of a set of line segments.
+
+    Args:
+        x (float): The x-coordinate of the point.
+        y (float): The y-coordinate of the point.
+        lines (np.ndarray): An (n, 4) array of x0, y0, x1, y1 rows.
+
+    Returns:
+        np.ndarray: The n distances.
+    """
+    x0, y0, x1, y1 = lines.T
+    dx, dy = x1 - x0, y1 - y0
+    squared_length = dx * dx + dy * dy
+    # The position along each segment of the point closest to (x, y), from 0 at its start to 1 at its end
+    t = np.clip(np.divide((x - x0) * dx + (y - y0) * dy, squared_length,
+                          out=np.zeros_like(squared_length), where=squared_length > 0), 0, 1)
+    return np.hypot(x0 + t * dx - x, y0 + t * dy - y)
+
+
+class SegmentGrid:
+    """
+    A uniform grid index of the branches of a segment table.
+
+    Attributes:
+        lines (np.ndarray): The (n, 4) x0, y0, x1, y1 rows of the branches, in model coordinates.
+        margins (np.ndarray): How far the drawing of every branch reaches beyond its axis.
+        origin (tuple): The model coordinates of the corner of cell (0, 0).
+        cell_size (float): The side of a cell, in model units.
+        shape (tuple): The number of (rows, columns) of cells.
+        cell_starts (np.ndarray): Where every cell starts in `cell_items`, followed by its length;
+            the branches of cell c are cell_items[cell_starts[c]:cell_starts[c + 1]].
+        cell_items (np.ndarray): The int32 indices of the branches in every cell, cell after cell.
+    """
+
+    __slots__ = ("lines", "margins", "origin", "cell_size", "shape", "cell_starts", "cell_items")
+
+    def __init__(self, lines: np.ndarray, margins: np.ndarray, origin: tuple[float, float], cell_size: float,
+                 shape: tuple[int, int], cell_starts: np.ndarray, cell_items: np.ndarray):
+        self.lines = lines
+        self.margins = margins
+        self.origin = origin
+        self.cell_size = cell_size
+        self.shape = shape
+        self.cell_starts = cell_starts
+        self.cell_items = cell_items
+
+    @classmethod
+    def from_segments(
+        cls,
+        segments: np.ndarray,
+        margin: float | np.ndarray = 0.0,
+        cell_size: float | None = None,
+    ) -> "SegmentGrid":
+        """
+        Builds the index of the branches of a segment table.
+
+        Args:
+            segments (np.ndarray): A segment table, e.g. from `fractal_funcs.canopy_segments`.
+            margin (float or np.ndarray, optional): How far the drawing of the branches reaches
+                beyond their axis, e.g. the sine wave amplitude, for all branches or per branch.
+                Defaults to 0.
+            cell_size (float, optional): The side of a cell. Defaults to None, which chooses it
+                from the extent of the canopy so that there are about BRANCHES_PER_CELL branches
+                per cell, but no smaller than most branches, with at most MAX_GRID_CELLS cells
+                along a side.
+
+        Returns:
+            SegmentGrid: The index.
+        """
+        lines = np.ascontiguousarray(segments[:, [X0, Y0, X1, Y1]], dtype=float)
+        margins = np.broadcast_to(np.abs(np.asarray(margin, dtype=float)), len(lines)).copy()
+        x_min = np.minimum(lines[:, 0], lines[:, 2]) - margins
+        y_min = np.minimum(lines[:, 1], lines[:, 3]) - margins
+        x_max = np.maximum(lines[:, 0], lines[:, 2]) + margins
+        y_max = np.maximum(lines[:, 1], lines[:, 3]) + margins
+        if not len(lines):
+            return cls(lines, margins, (0.0, 0.0), 1.0, (1, 1), np.zeros(2, dtype=np.int64),
+                       np.zeros(0, dtype=np.int32))
+
+        origin = (float(x_min.min()), float(y_min.min()))
+        width = max(float(x_max.max()) - origin[0], 1e-9)
+        height = max(float(y_max.max()) - origin[1], 1e-9)
+        if cell_size is None:
+            # Cells smaller than the branches would enter every branch in many cells
+            cell_size = max(np.sqrt(width * height * BRANCHES_PER_CELL / len(lines)),
+                            float(np.median(np.maximum(x_max - x_min, y_max - y_min))))
+        cell_size = max(cell_size, width / MAX_GRID_CELLS, height / MAX_GRID_CELLS)
+        n_cols = min(int(width // cell_size) + 1, MAX_GRID_CELLS)
+        n_rows = min(int(height // cell_size) + 1, MAX_GRID_CELLS)
+
+        # The range of cells covered by the bounding box of every branch
+        col_min = np.clip(((x_min - origin[0]) // cell_size).astype(np.int64), 0, n_cols - 1)
+        col_max = np.clip(((x_max - origin[0]) // cell_size).astype(np.int64), 0, n_cols - 1)
+        row_min = np.clip(((y_min - origin[1]) // cell_size).astype(np.int64), 0, n_rows - 1)
+        row_max = np.clip(((y_max - origin[1]) // cell_size).astype(np.int64), 0, n_rows - 1)
+        cols = col_max - col_min + 1
+        counts = cols * (row_max - row_min + 1)
+
+        # One entry per branch and covered cell, enumerated row by row within every bounding box
+        items = np.repeat(np.arange(len(lines), dtype=np.int32), counts)
+        within = np.arange(len(items)) - np.repeat(np.cumsum(counts) - counts, counts)
+        cells = ((row_min[items] + within // cols[items]) * n_cols
+                 + col_min[items] + within % cols[items])
+        order = np.argsort(cells, kind="stable")
+        cell_starts = np.zeros(n_rows * n_cols + 1, dtype=np.int64)
+        np.cumsum(np.bincount(cells, minlength=n_rows * n_cols), out=cell_starts[1:])
+        return cls(lines, margins, origin, float(cell_size), (n_rows, n_cols), cell_starts, items[order])
+
+    def __len__(self) -> int:
+        return len(self.lines)
+
+    @property
+    def nbytes(self) -> int:
+        """The memory used by the arrays, in bytes."""
+        return self.lines.nbytes + self.margins.nbytes + self.cell_starts.nbytes + self.cell_items.nbytes
+
+    def candidates(self, x_min: float, y_min: float, x_max: float, y_max: float) -> np.ndarray:
+        """Returns the indices of the branches entered in the cells a rectangle overlaps, possibly repeated."""
+        n_rows, n_cols = self.shape
+        col_min = int(np.clip((x_min - self.origin[0]) // self.cell_size, 0, n_cols - 1))
+        col_max = int(np.clip((x_max - self.origin[0]) // self.cell_size, 0, n_cols - 1))
+        row_min = int(np.clip((y_min - self.origin[1]) // self.cell_size, 0, n_rows - 1))
+        row_max = int(np.clip((y_max - self.origin[1]) // self.cell_size, 0, n_rows - 1))
+        # The cells of one row of the rectangle are consecutive
+        starts = self.cell_starts[np.arange(row_min, row_max + 1) * n_cols + col_min]
+        stops = self.cell_starts[np.arange(row_min, row_max + 1) * n_cols + col_max + 1]
+        if len(starts) == 1:
+            return self.cell_items[starts[0]:stops[0]]
+        return np.concatenate([self.cell_items[start:stop] for start, stop in zip(starts.tolist(), stops.tolist())])
+
+    def nearest(
+        self,
+        x: float,
+        y: float,
+        max_distance: float | None = None,
+        mask: np.ndarray | None = None,
+    ) -> tuple[int, float]:
+        """
+        Finds the branch closest to a point.
+
+        The distance to a branch is the distance to its axis, less its margin, and 0 for
+        points on the branch; of branches at the same distance, the one with the closest axis wins.
+
+        Args:
+            x (float): The x-coordinate of the point, in model coordinates.
+            y (float): The y-coordinate of the point.
+            max_distance (float, optional): The largest distance searched. Defaults to None,
+                which searches the whole canopy.
+            mask (np.ndarray, optional): A boolean array telling which branches may be found,
+                e.g. those that are drawn. Defaults to None, which allows all of them.
+
+        Returns:
+            tuple: The index of the closest branch and its distance, or (-1, inf) if there is
+                no branch within max_distance.
+        """
+        if max_distance is None:
+            # Double the search distance until a branch is within it or it covers the whole grid
+            n_rows, n_cols = self.shape
+            farthest = np.hypot(max(abs(x - self.origin[0]), abs(x - self.origin[0] - n_cols * self.cell_size)),
+                                max(abs(y - self.origin[1]), abs(y - self.origin[1] - n_rows * self.cell_size)))
+            # Nothing is closer than the edge of the grid
+            outside = np.hypot(max(self.origin[0] - x, x - self.origin[0] - n_cols * self.cell_size, 0),
+                               max(self.origin[1] - y, y - self.origin[1] - n_rows * self.cell_size, 0))
+            reach = outside + self.cell_size
+            while True:
+                index, distance = self.nearest(x, y, reach, mask)
+                if index >= 0 or reach >= farthest:
+                    return index, distance
+                reach *= 2
+        reach = max_distance + float(self.margins.max(initial=0))
+        found = self.candidates(x - reach, y - reach, x + reach, y + reach)
+        # Past a point, going through every branch is cheaper than removing the repeated ones
+        found = np.arange(len(self)) if len(found) > len(self) else np.unique(found)
+        if mask is not None:
+            found = found[mask[found]]
+        if not len(found):
+            return -1, np.inf
+        axis = point_segment_distances(x, y, self.lines[found])
+        distances = np.maximum(axis - self.margins[found], 0)
+        best = np.lexsort((axis, distances))[0]
+        if distances[best] > max_distance:
+            return -1, np.inf
+        return int(found[best]), float(distances[best])
+
+    def query_rect(self, x_min: float, y_min: float, x_max: float, y_max: float) -> np.ndarray:
+        """
+        Returns the sorted indices of the branches whose drawing, including its margin,
+        may overlap a rectangle in model coordinates.
+        """
+        found = np.unique(self.candidates(x_min, y_min, x_max, y_max))
+        lines, margins = self.lines[found], self.margins[found]
+        x0, y0, x1, y1 = lines.T
+        # Bounding boxes of the branches, against the rectangle grown by their margin
+        overlaps = ((np.minimum(x0, x1) <= x_max + margins) & (np.maximum(x0, x1) >= x_min - margins)
+                    & (np.minimum(y0, y1) <= y_max + margins) & (np.maximum(y0, y1) >= y_min - margins))
+        # A branch misses the grown rectangle if all its corners lie on the same side of the axis
+        dx, dy = x1 - x0, y1 - y0
+        length = np.maximum(np.hypot(dx, dy), 1e-12)
+        sides = np.stack([((corner_x - x0) * dy - (corner_y - y0) * dx) / length
+                          for corner_x in (x_min, x_max) for corner_y in (y_min, y_max)])
+        reach = margins * (np.abs(dx) + np.abs(dy)) / length
+        crosses = (sides.min(axis=0) <= reach) & (sides.max(axis=0) >= -reach)
+        return found[overlaps & crosses]
@@ -0,0 +1,385 @@
+"""
+store_funcs.py
+
+This module contains a persistent store of generated canopy geometry, so that
+a canopy computed once, e.g. the scene shown when the window was closed or
+the targets of a level pack, can be opened again without being regenerated.
+
+Canopies are stored in pack files: a short binary header, the raw bytes of
+the arrays of every canopy (its segment table, and optionally a rasterized
+preview and a score descriptor), and a JSON index at the end giving the
+parameters of every canopy and the dtype, shape and offset of its arrays.
+Opening a pack reads the header and the index only. The arrays are views of
+one read-only `numpy.memmap` of the file, so opening a canopy of a million
+branches, or a pack of hundreds of canopies, costs page faults as the arrays
+are used rather than parsing, and the operating system shares the pages
+between processes. Since the index comes last, packs are written as a stream,
+one canopy at a time.
+
+Every canopy is addressed by a hash of its normalized parameters and of the
+format version, so that the same parameters always find the same entry and a
+change of format never reads stale data.
+
+    offset 0   magic b"CANOPYGS"
+    offset 8   format version, uint32 little endian
+    offset 12  reserved, uint32
+    offset 16  offset of the index, uint64 little endian
+    offset 24  length of the index in bytes, uint64 little endian
+    offset 32  the arrays, each starting at a multiple of ALIGNMENT
+    ...        the index, UTF-8 JSON:
+               {"entries": [{"key", "params", "info", "arrays": {name: {"dtype", "shape", "offset"}}}]}
+
+A single array can therefore also be opened on its own, with
+`numpy.memmap(path, dtype, "r", offset, shape)` and the values of the index.
+
+Classes:
+    StoredCanopy
+        The arrays and parameters of one canopy of a pack.
+    GeometryPack
+        A pack file opened for reading, with its arrays memory-mapped.
+    GeometryStore
+        A content-addressed directory of canopies, one pack file per parameter set.
+
+Functions:
+    params_key()
+        Returns the content address of a set of canopy parameters.
+    write_pack()
+        Writes canopies to a pack file, one at a time.
+"""
+
+import hashlib
+import json
+import os
+import struct
+import uuid
+from collections import OrderedDict
+from typing import Iterable, Iterator
+
+import numpy as np
+
+STORE_VERSION = 1
+MAGIC = b"CANOPYGS"
+# Magic, version, reserved, index offset, index length
+_HEADER = struct.Struct("<8sIIQQ")
+# Every array starts at a multiple of this many bytes
+ALIGNMENT = 64
+# File name extension of pack files
+PACK_EXTENSION = ".pack"
+# Default directory of the store of the main window
+DEFAULT_STORE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+                                 "recursive-graphics")
+# Default size of a store, beyond which the least recently used packs are deleted
+DEFAULT_STORE_BYTES = 512 * 2 ** 20
+# Number of canopies a GeometryStore keeps open, so that looking them up again does not reopen their packs
+OPEN_CANOPIES = 16
+# Name of the file holding the key of the last scene of a store
+_LAST_FILE = "LAST"
+
+
+def _normalized(value):
+    """Returns a JSON-compatible copy of a parameter value in which equal values are written the same way."""
+    if value is None or isinstance(value, (bool, np.bool_)):
+        return value if value is None else bool(value)
+    if isinstance(value, str):
+        return str(value)
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, (float, np.floating)):
+        # Values reached through different slider paths should match, and 3.0 should match 3
+        number = round(float(value), 9) + 0.0
+        return int(number) if number.is_integer() else number
+    if isinstance(value, dict):
+        return {str(name): _normalized(item) for name, item in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [_normalized(item) for item in value]
+    raise TypeError(f"Cannot store a parameter of type {type(value).__name__}")
+
+
+def params_key(params: dict) -> str:
+    """
+    Returns the content address of a set of canopy parameters.
+
+    Args:
+        params (dict): The parameters, with JSON-compatible values (numbers, strings,
+            lists and dicts of them, including NumPy scalars and arrays).
+
+    Returns:
+        str: 32 hexadecimal digits of the SHA-256 hash of the normalized parameters and
+            of the format version.
+    """
+    text = json.dumps({"version": STORE_VERSION, "params": _normalized(params)},
+                      sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+
+class StoredCanopy:
+    """
+    The arrays and parameters of one canopy of a pack.
+
+    Attributes:
+        key (str): The content address of the parameters, from `params_key`.
+        params (dict): The parameters from which the arrays were generated.
+        arrays (dict): The arrays by name: "segments", the segment table, and optionally
+            "preview", an RGBA image, and "descriptor", from `score_funcs.canopy_descriptors`.
+            The arrays of a canopy read from a pack are read-only views of the mapped file.
+        info (dict): Data kept with the canopy that is not part of its address,
+            e.g. the slider values of a scene.
+    """
+
+    __slots__ = ("key", "params", "arrays", "info")
+
+    def __init__(self, params: dict, arrays: dict[str, np.ndarray], info: dict | None = None,
+                 key: str | None = None):
+        self.params = params
+        self.arrays = arrays
+        self.info = info or {}
+        self.key = key if key is not None else params_key(params)
+
+    @property
+    def segments(self) -> np.ndarray:
+        """The segment table."""
+        return self.arrays["segments"]
+
+    @property
+    def preview(self) -> np.ndarray | None:
+        """The rasterized preview, or None."""
+        return self.arrays.get("preview")
+
+    @property
+    def nbytes(self) -> int:
+        """The size of the arrays, in bytes."""
+        return sum(array.nbytes for array in self.arrays.values())
+
+
+def write_pack(path: str, canopies: Iterable[StoredCanopy]) -> int:
+    """
+    Writes canopies to a pack file, one at a time.
+
+    The file is written next to its destination and moved into place once complete,
+    so a pack that is being read is never seen half written.
+
+    Args:
+        path (str): The path of the pack file.
+        canopies (Iterable): The canopies, e.g. from a generator; each is written
+            before the next one is taken.
+
+    Returns:
+        int: The number of canopies written.
+    """
+    directory, name = os.path.split(os.path.abspath(path))
+    temporary = os.path.join(directory, f".{name}.{uuid.uuid4().hex}")
+    entries = []
+    try:
+        with open(temporary, "xb") as file:
+            file.write(bytes(_HEADER.size))
+            for canopy in canopies:
+                arrays = {}
+                for name, array in canopy.arrays.items():
+                    array = np.ascontiguousarray(array)
+                    if array.dtype.hasobject:
+                        raise TypeError(f"Cannot store the object array {name!r}")
+                    file.write(bytes(-file.tell() % ALIGNMENT))
+                    arrays[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": file.tell()}
+                    file.write(array.data)
+                entries.append({"key": canopy.key, "params": _normalized(canopy.params),
+                                "info": _normalized(canopy.info), "arrays": arrays})
+            index = json.dumps({"entries": entries}, separators=(",", ":")).encode("utf-8")
+            index_offset = file.tell()
+            file.write(index)
+            file.seek(0)
+            file.write(_HEADER.pack(MAGIC, STORE_VERSION, 0, index_offset, len(index)))
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.unlink(temporary)
+        raise
+    return len(entries)
+
+
+class GeometryPack:
+    """
+    A pack file opened for reading, with its arrays memory-mapped.
+
+    Canopies are looked up by key, or taken in the order in which they were written,
+    e.g. the levels of a level pack. The arrays stay valid as long as they are referenced,
+    even after the pack object itself is gone.
+
+    Attributes:
+        path (str): The path of the pack file.
+        entries (list): The index entries of the canopies, in order.
+    """
+
+    __slots__ = ("path", "entries", "_positions", "_buffer")
+
+    def __init__(self, path: str):
+        with open(path, "rb") as file:
+            header = file.read(_HEADER.size)
+            if len(header) < _HEADER.size or header[:len(MAGIC)] != MAGIC:
+                raise ValueError(f"{path} is not a geometry pack")
+            _, version, _, index_offset, index_length = _HEADER.unpack(header)
+            if version != STORE_VERSION:
+                raise ValueError(f"{path} is a version {version} geometry pack, expected version {STORE_VERSION}")
+            file.seek(index_offset)
+            index = file.read(index_length)
+        if len(index) != index_length:
+            raise ValueError(f"{path} is truncated")
+        self.path = path
+        self.entries = json.loads(index)["entries"]
+        self._positions = {}
+        for position, entry in enumerate(self.entries):
+            self._positions.setdefault(entry["key"], position)
+        self._buffer = np.memmap(path, dtype=np.uint8, mode="r")
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._positions
+
+    def __iter__(self) -> Iterator[StoredCanopy]:
+        return (self[position] for position in range(len(self.entries)))
+
+    def __getitem__(self, position: int) -> StoredCanopy:
+        """Returns the canopy at a position of the pack, mapping its arrays."""
+        entry = self.entries[position]
+        arrays = {}
+        for name, layout in entry["arrays"].items():
+            dtype = np.dtype(layout["dtype"])
+            shape = tuple(layout["shape"])
+            nbytes = dtype.itemsize * int(np.prod(shape, dtype=np.int64))
+            # A plain array over the mapping, so that results of operations on it are plain arrays too
+            arrays[name] = np.asarray(self._buffer[layout["offset"]:layout["offset"] + nbytes]).view(dtype).reshape(shape)
+        return StoredCanopy(entry["params"], arrays, entry["info"], entry["key"])
+
+    def keys(self) -> list[str]:
+        """The keys of the canopies, in order."""
+        return [entry["key"] for entry in self.entries]
+
+    def get(self, key: str) -> StoredCanopy | None:
+        """Returns the first canopy with a key, or None."""
+        position = self._positions.get(key)
+        return None if position is None else self[position]
+
+
+class GeometryStore:
+    """
+    A content-addressed directory of canopies, one pack file per parameter set.
+
+    The pack of a canopy is named after its key, so looking a canopy up is opening one
+    file, and writing the same canopy twice writes it once. Reading a pack marks it as
+    recently used; `prune` deletes the least recently used packs beyond `max_bytes`.
+    The store also remembers the key of one canopy, the last scene, e.g. the canopy
+    shown when the main window was closed. The OPEN_CANOPIES most recently loaded
+    canopies are kept open, so that looking one of them up again, e.g. on every redraw
+    of the main window, neither reads its index nor maps its file again.
+
+    Attributes:
+        directory (str): The directory of the pack files, created when first written to.
+        max_bytes (int): The size of the packs beyond which `prune` deletes the least recently used ones.
+    """
+
+    def __init__(self, directory: str = DEFAULT_STORE_DIR, max_bytes: int = DEFAULT_STORE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._opened: OrderedDict[str, StoredCanopy] = OrderedDict()
+
+    def path(self, key: str) -> str:
+        """Returns the path of the pack of a key."""
+        return os.path.join(self.directory, key + PACK_EXTENSION)
+
+    def load(self, key: str) -> StoredCanopy | None:
+        """
+        Returns the canopy stored under a key, or None if there is none. A pack that cannot
+        be read, e.g. one of an older format version, counts as missing.
+        """
+        canopy = self._opened.get(key)
+        if canopy is not None:
+            self._opened.move_to_end(key)
+            return canopy
+        path = self.path(key)
+        try:
+            canopy = GeometryPack(path).get(key)
+            os.utime(path)
+        except (OSError, ValueError, KeyError):
+            return None
+        if canopy is not None:
+            self._opened[key] = canopy
+            if len(self._opened) > OPEN_CANOPIES:
+                self._opened.popitem(last=False)
+        return canopy
+
+    def get(self, params: dict) -> StoredCanopy | None:
+        """Returns the canopy stored for a set of parameters, or None if there is none."""
+        return self.load(params_key(params))
+
+    def put(self, params: dict, arrays: dict[str, np.ndarray], info: dict | None = None) -> StoredCanopy:
+        """
+        Stores the arrays of a canopy under the key of its parameters, unless they are
+        already stored, and returns the stored canopy, whose arrays are mapped from the store.
+
+        Args:
+            params (dict): The parameters from which the arrays were generated.
+            arrays (dict): The arrays by name, including "segments".
+            info (dict, optional): Data kept with the canopy that is not part of its address.
+                Defaults to None.
+
+        Returns:
+            StoredCanopy: The stored canopy.
+        """
+        canopy = StoredCanopy(params, arrays, info)
+        stored = self.load(canopy.key)
+        if stored is not None and stored.info == _normalized(canopy.info):
+            return stored
+        os.makedirs(self.directory, exist_ok=True)
+        write_pack(self.path(canopy.key), [canopy])
+        self._opened.pop(canopy.key, None)
+        return self.load(canopy.key)
+
+    def remember(self, key: str) -> None:
+        """Marks the canopy stored under a key as the last scene."""
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, _LAST_FILE), "w", encoding="ascii") as file:
+            file.write(key)
+
+    def last(self) -> StoredCanopy | None:
+        """Returns the last scene, or None if there is none or it is no longer stored."""
+        try:
+            with open(os.path.join(self.directory, _LAST_FILE), encoding="ascii") as file:
+                key = file.read().strip()
+        except OSError:
+            return None
+        return self.load(key) if key else None
+
+    def prune(self) -> int:
+        """
+        Deletes the least recently used packs until the store takes at most `max_bytes`.
+        The last scene is kept. Returns the number of packs deleted.
+        """
+        try:
+            names = [name for name in os.listdir(self.directory) if name.endswith(PACK_EXTENSION)
+                     and not name.startswith(".")]
+        except OSError:
+            return 0
+        last = self.last()
+        packs = []
+        for name in names:
+            try:
+                status = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            packs.append((status.st_mtime, status.st_size, name))
+        total = sum(size for _, size, _ in packs)
+        deleted = 0
+        for _, size, name in sorted(packs):
+            if total <= self.max_bytes:
+                break
+            if last is not None and name == last.key + PACK_EXTENSION:
+                continue
+            try:
+                os.unlink(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            self._opened.pop(name[:-len(PACK_EXTENSION)], None)
+            total -= size
+            deleted += 1
+        return deleted
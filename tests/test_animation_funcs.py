@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from animation_funcs import morph_frames, interpolate_params, fill_canopy_segments, canopy_variation
+from fractal_funcs import canopy_segments, SEGMENT_FIELDS, KEY
+from helper_funcs import interpolate_color, hex_to_rgb, rgb_to_hex
+
+VARIATION = dict(angle_jitter=15, length_jitter=0.2, width_jitter=0.3)
+
+
+def last_frame(start: dict, end: dict) -> np.ndarray:
+    frames = [frame.segments.copy() for frame in morph_frames(start, end, 3)]
+    return frames[-1]
+
+
+@pytest.mark.parametrize("params", [
+    dict(n_iters=9, angle_delta=40),
+    dict(n_iters=8, angle_delta=50, n_splits=3, seed=7, **VARIATION),
+    dict(n_iters=10, angle_delta=30, seed=5, branch_drop=0.3, **VARIATION),
+])
+def test_frames_match_canopy_segments(params):
+    segments = last_frame({**params, "n_iters": 2}, params)
+    expected = canopy_segments(x=0, y=0, **params)
+    assert segments.shape == expected.shape
+    assert np.allclose(segments, expected)
+    assert np.array_equal(segments[:, KEY], expected[:, KEY])
+
+
+def test_randomized_frames_reuse_the_table():
+    start, end = dict(n_iters=6, seed=1, **VARIATION), dict(n_iters=6, seed=1, angle_jitter=40, branch_drop=0.2)
+    tables = {frame.segments.__array_interface__["data"][0] for frame in morph_frames(start, end, 8)}
+    assert len(tables) == 1
+
+
+def test_randomized_fill_needs_variation():
+    out, scratch = np.empty((15, len(SEGMENT_FIELDS))), np.empty((2, 8))
+    with pytest.raises(ValueError):
+        fill_canopy_segments(out, scratch, 0, 0, n_iters=5, angle_jitter=10)
+    with pytest.raises(ValueError):
+        fill_canopy_segments(out, scratch, 0, 0, n_iters=5, branch_drop=0.5, variation=canopy_variation(2, 5))
+
+
+def test_gradient_matches_scalar_interpolation():
+    start, end = dict(gradient=["#ce4738", "#386126"]), dict(gradient=["#0a0b0c", "#ffeedd"])
+    for t in np.linspace(0, 1, 37):
+        expected = [rgb_to_hex(interpolate_color(hex_to_rgb(first), hex_to_rgb(last), t))
+                    for first, last in zip(start["gradient"], end["gradient"])]
+        assert interpolate_params(start, end, t)["gradient"] == expected
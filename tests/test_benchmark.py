@@ -0,0 +1,47 @@
+import json
+
+import benchmark
+
+QUICK = ["--quick", "--repeats", "1", "--canvas", "fake", "--max-branches", "5000"]
+RESULT_FIELDS = {"case": str, "params": dict, "branches": int, "seconds": float, "mean_seconds": float,
+                 "repeats": int, "peak_rss_kb": (int, type(None))}
+
+
+def test_quick_report_schema(tmp_path):
+    output = tmp_path / "quick.json"
+    assert benchmark.main(QUICK + ["--record", "-o", str(output)]) == 0
+    report = json.loads(output.read_text())
+    assert set(report) == {"meta", "results"}
+    assert {"python", "numpy", "platform", "canvas", "repeats", "time"} <= set(report["meta"])
+    assert report["meta"]["canvas"] == "fake" and report["meta"]["repeats"] == 1
+    results = report["results"]
+    assert {result["case"] for result in results} == {name for name, *_ in benchmark.benchmark_cases(True, 5000)}
+    assert len({benchmark.case_key(result) for result in results}) == len(results)
+    for result in results:
+        for field, kind in RESULT_FIELDS.items():
+            assert isinstance(result[field], kind), (result["case"], field)
+        assert 0 < result["seconds"] <= result["mean_seconds"] + 1e-12
+        assert isinstance(result["peak_alloc_bytes"], int)
+        if result["branches"]:
+            assert result["branches_per_sec"] > 0
+        if "items" in result:
+            assert isinstance(result["draw_calls"], int) and isinstance(result["digest"], str)
+
+
+def test_baseline_comparison(tmp_path):
+    baseline = tmp_path / "baseline.json"
+    options = QUICK + ["--filter", "generate_gradient", "--no-memory"]
+    assert benchmark.main(options + ["-o", str(baseline)]) == 0
+    output = tmp_path / "compared.json"
+    assert benchmark.main(options + ["--baseline", str(baseline), "--tolerance", "1000", "-o", str(output)]) == 0
+    report = json.loads(output.read_text())
+    assert report["regressions"] == []
+    assert all(result["baseline_ratio"] > 0 for result in report["results"])
+
+    # A baseline that was much faster is reported as a regression
+    slow = json.loads(baseline.read_text())
+    for result in slow["results"]:
+        result["seconds"] /= 1e6
+    baseline.write_text(json.dumps(slow))
+    assert benchmark.main(options + ["--baseline", str(baseline), "-o", str(output)]) == 1
+    assert len(json.loads(output.read_text())["regressions"]) == len(slow["results"])
@@ -0,0 +1,68 @@
+import threading
+
+import numpy as np
+
+import cache_funcs
+from cache_funcs import CanopyCache
+from fractal_funcs import canopy_segments
+
+PARAMS = dict(x=0.0, y=0.0, angle_delta=30, n_splits=2, length_ratio=0.7)
+
+
+def lock_is_free(cache: CanopyCache) -> bool:
+    """Tells whether another thread can take the lock of a cache right now."""
+    result = []
+
+    def probe():
+        acquired = cache._lock.acquire(blocking=False)
+        if acquired:
+            cache._lock.release()
+        result.append(acquired)
+
+    thread = threading.Thread(target=probe)
+    thread.start()
+    thread.join()
+    return result[0]
+
+
+def test_generates_outside_the_lock(monkeypatch):
+    cache = CanopyCache()
+    free = []
+
+    def generate(function):
+        def wrapper(*args, **kwargs):
+            free.append(lock_is_free(cache))
+            return function(*args, **kwargs)
+        return wrapper
+
+    monkeypatch.setattr(cache_funcs, "canopy_segments", generate(cache_funcs.canopy_segments))
+    monkeypatch.setattr(cache_funcs, "grow_canopy", generate(cache_funcs.grow_canopy))
+    cache.segments(n_iters=4, **PARAMS)
+    cache.segments(n_iters=7, **PARAMS)
+    assert free == [True, True]
+    assert cache.stats["misses"] == 1 and cache.stats["extensions"] == 1
+
+
+def test_keeps_the_deeper_table(monkeypatch):
+    cache = CanopyCache()
+    deep = canopy_segments(n_iters=8, **PARAMS)
+
+    def generate(*args, **kwargs):
+        # Another thread stores a deeper tree while this one is generating
+        cache.insert(deep, n_iters=8, **PARAMS)
+        return canopy_segments(*args, **kwargs)
+
+    monkeypatch.setattr(cache_funcs, "canopy_segments", generate)
+    table = cache.segments(n_iters=5, **PARAMS)
+    assert np.array_equal(table, canopy_segments(n_iters=5, **PARAMS))
+    assert cache._entries[cache.key(**PARAMS)][0] == 8
+    assert np.array_equal(cache.segments(n_iters=8, **PARAMS), deep)
+
+
+def test_extension_matches_generation():
+    cache = CanopyCache()
+    for n_iters in (3, 6, 9):
+        table = cache.segments(n_iters=n_iters, **PARAMS)
+    assert np.array_equal(table, canopy_segments(n_iters=9, **PARAMS))
+    assert np.array_equal(cache.segments(n_iters=5, **PARAMS), canopy_segments(n_iters=5, **PARAMS))
+    assert not table.flags.writeable
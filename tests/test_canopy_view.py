@@ -0,0 +1,106 @@
+from collections import Counter
+
+import numpy as np
+
+from canvas_funcs import RecordingCanvas
+from fractal_funcs import canopy_segments, grow_canopy, segments_in_viewport, DEPTH
+from gui import canopy_view
+from gui.canopy_view import CanopyView, draw_lod_canopy
+
+PARAMS = dict(off_angle=5, angle_delta=40, n_iters=14, length_ratio=0.75, init_length=150, width=4)
+
+
+def culled_view():
+    canvas = RecordingCanvas(800, 600)
+    view = draw_lod_canopy(canvas, 400, 1200, min_pixels=2.0, **PARAMS)
+    while not view.update():
+        pass
+    return view
+
+
+def test_update_with_nothing_to_grow_keeps_the_table():
+    view = culled_view()
+    assert len(view.frontier)
+    version, segments = view.version, view.segments
+    for _ in range(3):
+        assert view.update()
+    assert view.version == version
+    assert view.segments is segments
+
+
+def test_unmoved_view_is_not_regrown_or_rechecked(monkeypatch):
+    view = culled_view()
+    calls = []
+    monkeypatch.setattr(canopy_view, "grow_canopy",
+                        lambda *args, **kwargs: calls.append("grow") or grow_canopy(*args, **kwargs))
+    monkeypatch.setattr(canopy_view, "segments_in_viewport",
+                        lambda *args, **kwargs: calls.append("cull") or segments_in_viewport(*args, **kwargs))
+    for _ in range(3):
+        assert view.update()
+    assert calls == []
+    # Panning moves the view: the frontier is grown for it once, and then left alone again
+    canvas = view.canvas
+    canvas.scan_mark(0, 0)
+    canvas.scan_dragto(-60, 250, gain=1)
+    while not view.update():
+        pass
+    assert calls.count("grow") == 1
+    calls.clear()
+    assert view.update()
+    assert calls == []
+
+
+def drawn_view(segments, n_iters, color="#000000"):
+    view = CanopyView(RecordingCanvas(800, 600), min_pixels=0)
+    view.set_canopy(segments, n_iters, color)
+    assert view.update()
+    return view
+
+
+def calls_during(view, change):
+    canvas = view.canvas
+    before = Counter(canvas.calls)
+    change()
+    assert view.update()
+    return Counter(canvas.calls) - before
+
+
+def test_replaced_canopy_reuses_the_items():
+    old = canopy_segments(400, 590, angle_delta=30, n_iters=8, init_length=120)
+    new = canopy_segments(400, 590, angle_delta=50, n_iters=8, init_length=120)
+    view = drawn_view(old, 8)
+    items = view.canvas.find_all()
+    calls = calls_during(view, lambda: view.set_canopy(new, 8))
+    # Only the branches that moved get new coordinates; the trunk stays as it is
+    assert calls["coords"] == int((new != old).any(axis=1).sum()) == len(new) - 1
+    assert calls["create_line"] == calls["delete"] == calls["itemconfigure"] == 0
+    assert view.canvas.find_all() == items
+
+
+def test_color_change_only_reconfigures_the_fills():
+    segments = canopy_segments(400, 590, n_iters=8, init_length=120)
+    colors = ["#000000"] * 6 + ["#00aa00"]
+    view = drawn_view(segments, 8, colors)
+    calls = calls_during(view, lambda: view.set_canopy(segments, 8, ["#000000"] * 6 + ["#aa0000"]))
+    assert calls["itemconfigure"] == int((segments[:, DEPTH] == 6).sum())
+    assert calls["coords"] == calls["create_line"] == calls["delete"] == 0
+
+
+def test_items_beyond_a_shorter_canopy_are_kept_until_trimmed():
+    deep = canopy_segments(400, 590, n_iters=9, init_length=120)
+    shallow = deep[:len(canopy_segments(400, 590, n_iters=7, init_length=120))]
+    view = drawn_view(deep, 9)
+    calls = calls_during(view, lambda: view.set_canopy(shallow, 9))
+    assert calls["create_line"] == calls["delete"] == 0
+    assert len(view.canvas.find_all()) == len(deep)
+
+    # Extending the table again reuses the pooled items
+    calls = calls_during(view, lambda: view.extend(deep))
+    assert calls["create_line"] == calls["delete"] == calls["coords"] == 0
+    assert len(view.canvas.find_all()) == len(deep)
+
+    view.set_canopy(shallow, 9)
+    assert view.update()
+    view.trim()
+    assert len(view.canvas.find_all()) == len(shallow)
+    assert np.array_equal(np.sort(view.item_ids), np.sort(view.canvas.find_all()))
@@ -0,0 +1,75 @@
+import inspect
+import tkinter as tk
+
+import numpy as np
+import pytest
+
+from canvas_funcs import DrawingBackend, RecordingCanvas
+from fractal_funcs import fractal_canopy
+
+PROTOCOL_METHODS = [name for name, value in vars(DrawingBackend).items()
+                    if inspect.isfunction(value) and not name.startswith("_")]
+
+
+def test_recording_canvas_is_a_drawing_backend():
+    assert isinstance(RecordingCanvas(), DrawingBackend)
+    assert not isinstance(object(), DrawingBackend)
+
+
+@pytest.mark.parametrize("name", PROTOCOL_METHODS)
+def test_methods_accept_the_protocol_arguments(name):
+    expected = inspect.signature(getattr(DrawingBackend, name)).parameters
+    actual = inspect.signature(getattr(RecordingCanvas, name)).parameters
+    assert [(p.name, p.kind) for p in actual.values()][:len(expected)] == [(p.name, p.kind) for p in expected.values()]
+    # Tkinter canvases implement the protocol as well
+    assert callable(getattr(tk.Canvas, name))
+
+
+def test_items_follow_tkinter_semantics():
+    canvas = RecordingCanvas()
+    first = canvas.create_line(0, 0, 10, 10, tags=("view", "branch"), fill="#ff0000", width=3)
+    second = canvas.create_line([(5, 5), (6, 8), (9, 9)], tags="other")
+    image = canvas.create_image(1, 2, tags="view")
+    assert (first, second, image) == (1, 2, 3)
+    assert canvas.type(image) == "image" and canvas.type(99) is None
+    assert canvas.find_withtag("view&&!branch") == (image,)
+
+    canvas.scale("all&&!other", 10, 0, 2, 3)
+    assert canvas.coords(first) == [-10, 0, 10, 30]
+    canvas.move("other", 1, -1)
+    assert canvas.coords(second) == [6, 4, 7, 7, 10, 8]
+    canvas.itemconfigure("branch", fill="#00ff00", tags="leaf")
+    assert canvas.itemcget(first, "fill") == "#00ff00" and canvas.itemcget(first, "tags") == "leaf"
+
+    canvas.delete("view")
+    assert canvas.find_all() == (first, second)
+    canvas.delete(first)
+    assert canvas.find_all() == (second,)
+    # Ids are not reused
+    assert canvas.create_rectangle(0, 0, 1, 1) == 4
+
+
+def test_coordinates_survive_buffer_compaction():
+    canvas = RecordingCanvas(capacity=4)
+    items = [canvas.create_line(i, i, i + 1, i + 1) for i in range(20)]
+    for round_ in range(30):
+        for item in items[::2]:
+            canvas.coords(item, *np.arange(2 * (2 + round_ % 3)) + item)
+    for item in items[1::2]:
+        assert canvas.coords(item) == [item - 1, item - 1, item, item]
+    assert canvas.coords(items[0]) == (np.arange(2 * (2 + 29 % 3)) + items[0]).tolist()
+
+
+def test_digest_identifies_the_drawing():
+    def drawing(**options):
+        canvas = RecordingCanvas()
+        fractal_canopy(canvas, 400, 500, n_iters=7, angle_delta=30, **options)
+        return canvas
+
+    assert drawing().digest() == drawing().digest()
+    assert drawing().digest() != drawing(off_angle=1).digest()
+    unrecorded = RecordingCanvas(record=False)
+    fractal_canopy(unrecorded, 400, 500, n_iters=7)
+    assert unrecorded.item_count() == 63 and unrecorded.call_count("create_line") == 63
+    with pytest.raises(RuntimeError):
+        unrecorded.export()
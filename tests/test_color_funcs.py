@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from color_funcs import gradient_palette, interpolate_colors, hex_to_rgb_array
+from helper_funcs import generate_gradient
+
+
+def scalar_gradient(color1: str, color2: str, steps: int) -> list:
+    """The gradient as `helper_funcs.generate_gradient` computed it one color at a time."""
+    rgb1 = tuple(int(color1.lstrip("#")[i:i + 2], 16) for i in (0, 2, 4))
+    rgb2 = tuple(int(color2.lstrip("#")[i:i + 2], 16) for i in (0, 2, 4))
+    gradient = []
+    for step in range(steps):
+        factor = step / (steps - 1)
+        gradient.append("#{:02x}{:02x}{:02x}".format(*(int(rgb1[i] + (rgb2[i] - rgb1[i]) * factor)
+                                                       for i in range(3))))
+    return gradient
+
+
+def test_rgb_palette_matches_scalar_gradient():
+    rng = np.random.default_rng(0)
+    for _ in range(2000):
+        start, end = ("#" + "".join(f"{value:02x}" for value in rng.integers(0, 256, 3)) for _ in range(2))
+        steps = int(rng.integers(2, 80))
+        expected = scalar_gradient(start, end, steps)
+        assert gradient_palette(start, end, steps).tolist() == expected
+        assert generate_gradient(start, end, steps) == expected
+
+
+def test_rgb_palette_known_case():
+    # np.linspace puts this step one bit lower, which truncated the red channel to 0x69
+    assert gradient_palette("#ce4738", "#386126", 34)[22] == "#6a582c"
+
+
+def test_single_step_gradient_raises_like_scalar():
+    with pytest.raises(ZeroDivisionError):
+        scalar_gradient("#000000", "#ffffff", 1)
+    with pytest.raises(ZeroDivisionError):
+        gradient_palette("#000000", "#ffffff", 1)
+    assert gradient_palette("#000000", "#ffffff", 0).tolist() == scalar_gradient("#000000", "#ffffff", 0) == []
+
+
+def test_palette_is_cached_and_read_only():
+    palette = gradient_palette("#8b4513", "#228b22", 9, "oklab")
+    assert gradient_palette("#8b4513", "#228b22", 9, "oklab") is palette
+    assert not palette.flags.writeable
+
+
+@pytest.mark.parametrize("space", ["rgb", "linear", "hsv", "oklab"])
+def test_palette_ends_are_the_given_colors(space):
+    palette = gradient_palette("#8b4513", "#228b22", 7, space)
+    assert palette[0] == "#8b4513" and palette[-1] == "#228b22"
+    rgb = interpolate_colors(hex_to_rgb_array("#8b4513"), hex_to_rgb_array("#228b22"), [0.0, 1.0], space)
+    np.testing.assert_allclose(rgb, [[0x8b, 0x45, 0x13], [0x22, 0x8b, 0x22]], atol=1e-6)
+
+
+def test_color_names_are_resolved():
+    assert hex_to_rgb_array("red").tolist() == [255, 0, 0]
+    assert hex_to_rgb_array(["Forest Green", "#102030", "gray"]).tolist() == [[34, 139, 34], [16, 32, 48],
+                                                                               [128, 128, 128]]
+    assert gradient_palette("black", "white", 3).tolist() == ["#000000", "#7f7f7f", "#ffffff"]
+    with pytest.raises(ValueError, match="NAMED_COLORS"):
+        hex_to_rgb_array(["red", "no such color"])
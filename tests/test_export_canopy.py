@@ -0,0 +1,17 @@
+import pytest
+
+from export_canopy import parse_args
+
+
+def test_color_options_accept_names():
+    args, defaults = parse_args(["--color", "red", "#00ff00", "--gradient", "navy", "gold", "--background", "white"])
+    assert defaults["color"] == ["#ff0000", "#00ff00"]
+    assert defaults["gradient"] == ["#000080", "#ffd700"]
+    assert args.background == "#ffffff"
+    assert parse_args(["--background", ""])[0].background == ""
+
+
+def test_unknown_colors_are_rejected(capsys):
+    with pytest.raises(SystemExit):
+        parse_args(["--color", "reddish"])
+    assert "invalid color 'reddish'" in capsys.readouterr().err
@@ -0,0 +1,124 @@
+import math
+
+import numpy as np
+import pytest
+
+from canvas_funcs import RecordingCanvas
+import fractal_funcs
+from fractal_funcs import (canopy_segments, instanced_canopy_segments, fractal_canopy, grow_canopy,
+                           segments_in_viewport, SEGMENT_FIELDS, X0, Y0, X1, Y1, WIDTH, DEPTH)
+
+
+def reference_canopy(x, y, off_angle=0, angle_delta=10, start_angle=-90, n_splits=2, n_iters=3,
+                     length_ratio=0.75, init_length=200, width=1, width_ratio=0.75):
+    """The segment table of a canopy, from a branch-by-branch recursion."""
+    levels = [[] for _ in range(max(n_iters - 1, 0))]
+
+    def branch(x, y, angle, length, width, depth):
+        end_x = x + math.cos(math.radians(angle)) * length
+        end_y = y + math.sin(math.radians(angle)) * length
+        levels[depth].append((x, y, end_x, end_y, angle, length, width, depth, 0))
+        if depth + 1 < len(levels):
+            for offset in np.linspace(-angle_delta / 2, angle_delta / 2, n_splits):
+                branch(end_x, end_y, angle + off_angle + offset, length * length_ratio,
+                       width * width_ratio, depth + 1)
+
+    if levels:
+        branch(x, y, start_angle, init_length, width, 0)
+    return np.array([row for level in levels for row in level]).reshape(-1, len(SEGMENT_FIELDS))
+
+
+CASES = [
+    dict(n_iters=1),
+    dict(n_iters=2),
+    dict(n_iters=7),
+    dict(n_iters=6, n_splits=3, angle_delta=40, off_angle=12, length_ratio=0.6),
+    dict(n_iters=5, n_splits=1, off_angle=-20, start_angle=30, width=5, width_ratio=0.5),
+    dict(n_iters=8, angle_delta=0, length_ratio=0.9, init_length=50),
+    dict(n_iters=4, n_splits=4, angle_delta=270, length_ratio=1.2),
+]
+
+
+@pytest.mark.parametrize("params", CASES)
+def test_canopy_segments_match_recursion(params):
+    segments = canopy_segments(120.5, 340.25, **params)
+    expected = reference_canopy(120.5, 340.25, **params)
+    assert segments.shape == expected.shape
+    assert np.allclose(segments, expected, rtol=1e-12, atol=1e-9)
+
+
+def test_rows_are_grouped_by_parent():
+    segments = canopy_segments(0, 0, n_iters=6, n_splits=3, angle_delta=50)
+    depths = segments[:, DEPTH]
+    assert (np.diff(depths) >= 0).all()
+    starts = np.flatnonzero(np.diff(depths, prepend=-1))
+    for parent_start, child_start in zip(starts[:-1], starts[1:]):
+        parents = segments[parent_start:child_start]
+        children = segments[child_start:child_start + 3 * len(parents)]
+        assert np.allclose(children[:, [X0, Y0]], np.repeat(parents[:, [X1, Y1]], 3, axis=0))
+
+
+@pytest.mark.parametrize("params", CASES[1:4])
+def test_fractal_canopy_draws_the_recursion(params):
+    n_iters = params["n_iters"]
+    colors = [f"#{depth:02x}0000" for depth in range(n_iters)]
+    canvas = RecordingCanvas()
+    fractal_canopy(canvas, 400, 500, color=colors, **params)
+    expected = reference_canopy(400, 500, **params)
+    items = canvas.find_all()
+    assert len(items) == len(expected)
+    for item, row in zip(items, expected):
+        assert np.allclose(canvas.coords(item), row[[X0, Y0, X1, Y1]])
+        assert canvas.itemcget(item, "fill") == colors[-(n_iters - int(row[DEPTH]) - 1)]
+        assert float(canvas.itemcget(item, "width")) == pytest.approx(row[WIDTH])
+
+
+def sorted_rows(segments: np.ndarray) -> np.ndarray:
+    return segments[np.lexsort(segments.T[::-1])]
+
+
+@pytest.mark.parametrize("viewport", [(350, 0, 450, 200), (-1000, -1000, -900, -900), (0, 0, 800, 600)])
+@pytest.mark.parametrize("min_pixels", [0, 8])
+def test_culled_canopy_regrows_to_the_whole_canopy(viewport, min_pixels):
+    params = dict(off_angle=5, angle_delta=35, n_iters=10, length_ratio=0.72, init_length=150, width=6)
+    whole = canopy_segments(400, 550, **params)
+    culled, frontier = canopy_segments(400, 550, **params, min_pixels=min_pixels, viewport=viewport,
+                                       return_frontier=True)
+    assert len(culled) <= len(whole)
+    grown, rest = grow_canopy(frontier, **{name: value for name, value in params.items()
+                                           if name not in ("init_length", "width")})
+    assert len(rest) == 0
+    assert np.allclose(sorted_rows(np.concatenate((culled, grown))), sorted_rows(whole))
+    if min_pixels == 0:
+        # Every branch in view is generated at once
+        generated = {tuple(row) for row in np.round(culled, 6).tolist()}
+        in_view = whole[segments_in_viewport(whole, viewport, whole[:, WIDTH] / 2)]
+        assert all(tuple(row) in generated for row in np.round(in_view, 6).tolist())
+
+
+@pytest.mark.parametrize("params", CASES)
+@pytest.mark.parametrize("instance_depth", [None, 1, 3])
+def test_instanced_canopy_matches_plain(params, instance_depth):
+    plain = canopy_segments(120.5, 340.25, **params)
+    instanced = instanced_canopy_segments(120.5, 340.25, **params, instance_depth=instance_depth)
+    assert instanced.shape == plain.shape
+    assert np.allclose(instanced, plain, rtol=1e-9, atol=1e-6)
+    assert np.array_equal(instanced[:, DEPTH], plain[:, DEPTH])
+
+
+def test_instancing_only_applies_to_plain_canopies():
+    params = dict(n_iters=7, angle_delta=30, n_splits=3)
+    assert np.allclose(canopy_segments(0, 0, **params, instancing=True), canopy_segments(0, 0, **params))
+    randomized = dict(params, angle_jitter=20, seed=4)
+    assert np.array_equal(canopy_segments(0, 0, **randomized, instancing=True), canopy_segments(0, 0, **randomized))
+
+
+def test_raster_drawing_replaces_the_previous_image(monkeypatch):
+    images = []
+    monkeypatch.setattr(fractal_funcs, "photo_image", lambda image, master=None: images.append(image) or image)
+    canvas = RecordingCanvas(200, 150)
+    for n_iters in (4, 5, 6):
+        fractal_canopy(canvas, 100, 140, n_iters=n_iters, init_length=50, backend="raster")
+    assert len(canvas.find_all()) == 1
+    assert canvas.raster_image is images[-1]
+    assert canvas.find_all() == (canvas.raster_item,)
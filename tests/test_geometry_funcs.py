@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from fractal_funcs import canopy_segments, child_keys, X0, Y0, X1, Y1, KEY
+from geometry_funcs import CanopyGeometry
+
+
+def assert_tree(geometry: CanopyGeometry, segments: np.ndarray, n_splits: int, dropped: bool = False):
+    """Every branch starts where its parent ends, and the children slices partition the branches."""
+    children = geometry.parent >= 0
+    parents = geometry.parent[children]
+    np.testing.assert_array_equal(geometry.data[X0, children], geometry.data[X1, parents])
+    np.testing.assert_array_equal(geometry.data[Y0, children], geometry.data[Y1, parents])
+    sizes = [geometry.children(index).stop - geometry.children(index).start for index in range(len(geometry))]
+    assert sum(sizes) == children.sum()
+    assert set(sizes) <= (set(range(n_splits + 1)) if dropped else {0, n_splits})
+    for index in range(len(geometry)):
+        assert (geometry.parent[geometry.children(index)] == index).all()
+    assert len(geometry) == len(segments)
+
+
+def test_parents_of_coincident_branches():
+    # With no angle between them, the children of a branch all end at the same point
+    segments = canopy_segments(0, 0, n_splits=2, n_iters=4, angle_delta=0)
+    geometry = CanopyGeometry.from_segments(segments)
+    np.testing.assert_array_equal(geometry.parent, [-1, 0, 0, 1, 1, 2, 2])
+    assert [geometry.children(index) for index in range(3)] == [slice(1, 3), slice(3, 5), slice(5, 7)]
+    assert_tree(geometry, segments, 2)
+
+
+@pytest.mark.parametrize("n_splits", [2, 3])
+def test_parents_of_full_canopy(n_splits):
+    segments = canopy_segments(400, 580, n_splits=n_splits, n_iters=7, angle_delta=60, off_angle=5)
+    geometry = CanopyGeometry.from_segments(segments)
+    # Rows of a full canopy come generation by generation, children in the order of their parents
+    np.testing.assert_array_equal(geometry.data, segments[:, :7].T.astype(np.float32))
+    assert_tree(geometry, segments, n_splits)
+
+
+@pytest.mark.parametrize("angle_delta", [0, 60])
+def test_parents_of_culled_canopy(angle_delta):
+    segments, frontier = canopy_segments(400, 580, n_splits=3, n_iters=8, angle_delta=angle_delta,
+                                         viewport=(300, 0, 420, 600), return_frontier=True)
+    assert len(frontier)
+    assert_tree(CanopyGeometry.from_segments(segments, 3), segments, 3)
+
+
+def test_parents_of_randomized_canopy_by_key():
+    segments = canopy_segments(400, 580, n_splits=3, n_iters=7, angle_delta=0,
+                               branch_drop=0.3, length_jitter=0.2, seed=4)
+    shuffled = segments[np.random.default_rng(1).permutation(len(segments))]
+    geometry = CanopyGeometry.from_segments(shuffled, 3)
+    assert_tree(geometry, segments, 3, dropped=True)
+    np.testing.assert_array_equal(CanopyGeometry.from_segments(shuffled).parent, geometry.parent)
+    # Dropped branches leave gaps, so only the path keys tell the parents apart
+    rows = {tuple(row): key for row, key in zip(shuffled[:, X0:Y1 + 1].astype(np.float32).tolist(), shuffled[:, KEY])}
+    keys = np.array([rows[tuple(row)] for row in geometry.data[X0:Y1 + 1].T.tolist()])
+    assert len(rows) == len(segments)
+    for index in np.flatnonzero(geometry.parent >= 0):
+        assert keys[index] in child_keys(keys[[geometry.parent[index]]], 3)
+
+
+def test_rows_that_are_not_children_are_rejected():
+    segments = canopy_segments(0, 0, n_splits=2, n_iters=4, angle_delta=30)
+    with pytest.raises(ValueError):
+        CanopyGeometry.from_segments(segments[[0, 1, 2, 3, 4, 5]], 2)
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from canvas_funcs import RecordingCanvas
+from helper_funcs import (adaptive_sine_wave_polylines, draw_sine_wave_segment, sine_wave_polylines,
+                          wave_sample_counts, WAVE_MAX_POINTS, WAVE_MIN_POINTS, WAVE_PIXELS_PER_SAMPLE)
+
+
+def test_sample_counts_follow_on_screen_length():
+    lengths = np.array([0.0, 1.0, 10.0, 30.0, 100.0, 1000.0])
+    counts = wave_sample_counts(lengths, wave_amp=2.0)
+    assert ((counts - 1) % 4 == 0).all()
+    assert (np.diff(counts) >= 0).all()
+    assert counts[0] == WAVE_MIN_POINTS and WAVE_MAX_POINTS - 4 < counts[-1] <= WAVE_MAX_POINTS
+    # Between the bounds, samples are at most WAVE_PIXELS_PER_SAMPLE apart on screen
+    on_screen = lengths + 8.0
+    inside = (counts > counts[0]) & (counts < counts[-1])
+    assert inside.any()
+    assert (on_screen[inside] / (counts[inside] - 1) <= WAVE_PIXELS_PER_SAMPLE).all()
+    assert (on_screen[inside] / (counts[inside] - 5) > WAVE_PIXELS_PER_SAMPLE).all()
+
+
+@pytest.mark.parametrize("length", [5.0, 20.0, 60.0])
+def test_sample_counts_grow_with_zoom(length):
+    counts = [int(wave_sample_counts(length, 2.0, scale)[()]) for scale in (0.1, 1.0, 2.0, 8.0)]
+    assert counts == sorted(counts)
+    assert counts[0] == WAVE_MIN_POINTS
+    assert all((count - 1) % 4 == 0 for count in counts)
+    # Zooming in by a factor has the same effect as a branch longer by that factor
+    assert wave_sample_counts(length, 2.0, 2.0) == wave_sample_counts(2 * length, 4.0)
+
+
+def test_adaptive_polylines_match_fixed_sampling():
+    rng = np.random.default_rng(3)
+    x, y, end_x, end_y = rng.uniform(0, 200, (4, 50))
+    lengths = np.hypot(end_x - x, end_y - y)
+    points, offsets = adaptive_sine_wave_polylines(x, y, end_x, end_y, lengths, 3.0, scale=1.5)
+    counts = wave_sample_counts(lengths, 3.0, 1.5)
+    assert np.array_equal(np.diff(offsets), counts)
+    for i in range(50):
+        expected = sine_wave_polylines(x[i], y[i], end_x[i], end_y[i], lengths[i], 3.0, counts[i])[0]
+        assert np.allclose(points[offsets[i]:offsets[i + 1]], expected)
+
+
+def test_drawn_wave_gets_more_points_when_zoomed_in():
+    canvas = RecordingCanvas()
+    for scale in (1.0, 4.0):
+        draw_sine_wave_segment(canvas, 0, 0, 40, 0, 40, 2.0, "#000000", scale=scale)
+    near, far = (len(canvas.coords(item)) // 2 for item in canvas.find_all())
+    assert near == wave_sample_counts(40.0, 2.0, 1.0) and far == wave_sample_counts(40.0, 2.0, 4.0)
+    assert far > near
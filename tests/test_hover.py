@@ -0,0 +1,64 @@
+import numpy as np
+
+from canvas_funcs import RecordingCanvas
+from fractal_funcs import canopy_segments
+from gui.canopy_view import CanopyView, draw_lod_canopy
+from gui.hover import BranchPicker
+
+PARAMS = dict(x=400, y=550, angle_delta=30, length_ratio=0.7, init_length=120)
+
+
+def drawn_view(n_iters: int) -> CanopyView:
+    view = CanopyView(RecordingCanvas(800, 600))
+    view.set_canopy(canopy_segments(n_iters=n_iters, **PARAMS), n_iters)
+    view.update()
+    return view
+
+
+def test_picks_the_branch_under_the_point():
+    view = drawn_view(6)
+    picker = BranchPicker(view)
+    trunk_x, trunk_y = 400, 500
+    index, distance = picker.pick(trunk_x, trunk_y)
+    assert index == 0 and distance == 0
+    assert picker.pick(10, 10) == (-1, np.inf)
+
+
+def test_grid_follows_the_view_version():
+    view = drawn_view(4)
+    picker = BranchPicker(view)
+    first = picker._current_grid()
+    assert picker._current_grid() is first
+    # A new table of the same length and in the same place is still a new canopy
+    view.set_canopy(canopy_segments(n_iters=4, **{**PARAMS, "angle_delta": 90}), 4)
+    assert picker._current_grid() is not first
+
+
+def test_grid_waits_for_the_build_to_finish():
+    whole = canopy_segments(n_iters=9, **PARAMS)
+    view = drawn_view(3)
+    picker = BranchPicker(view)
+    view.building = True
+    view.set_canopy(whole[:3], 9)
+    started = picker._current_grid()
+    assert len(started) == 3
+    for rows in (7, 15, 31, len(whole)):
+        view.extend(whole[:rows])
+        view.update()
+        assert picker._current_grid() is started
+    view.building = False
+    assert len(picker._current_grid()) == len(whole)
+
+
+def test_grid_is_kept_across_updates_of_an_unmoved_view():
+    view = draw_lod_canopy(RecordingCanvas(800, 600), 400, 1200, min_pixels=2.0, n_iters=14,
+                           angle_delta=40, init_length=150, width=4)
+    while not view.update():
+        pass
+    assert len(view.frontier)
+    picker = BranchPicker(view)
+    grid = picker._current_grid()
+    for _ in range(3):
+        view.update()
+        picker.pick(400, 1100)
+        assert picker.grid is grid
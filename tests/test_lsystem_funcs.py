@@ -0,0 +1,99 @@
+import math
+
+import numpy as np
+import pytest
+
+from fractal_funcs import canopy_segments, SEGMENT_FIELDS, ANGLE, DEPTH
+from lsystem_funcs import (LSystem, PRESETS, canopy_lsystem, lsystem_segments, turtle_segments,
+                           DRAW, MOVE, TURN, PUSH, POP, SCALE_LENGTH, SCALE_WIDTH)
+
+
+def reference_expand(axiom: str, rules: dict[str, str], n_iters: int) -> str:
+    string = axiom
+    for _ in range(n_iters):
+        string = "".join(rules.get(symbol, symbol) for symbol in string)
+    return string
+
+
+def reference_turtle(system: LSystem, string: str, x=0.0, y=0.0, start_angle=0.0, length=10.0, width=1.0):
+    """The segment table of a string, from a turtle that follows it one symbol at a time."""
+    tokens = {symbol: token for token, symbol in enumerate(system.symbols)}
+    heading, stack, rows = start_angle, [], []
+    for position, symbol in enumerate(string):
+        token = tokens[symbol]
+        role = system.roles[token]
+        if role in (DRAW, MOVE):
+            end_x = x + math.cos(math.radians(heading)) * length
+            end_y = y + math.sin(math.radians(heading)) * length
+            if role == DRAW:
+                rows.append((len(stack), position, (x, y, end_x, end_y, heading, length, width, len(stack), 0)))
+            x, y = end_x, end_y
+        elif role == TURN:
+            heading += system.turn_angles[token]
+        elif role == PUSH:
+            stack.append((x, y, heading, length, width))
+        elif role == POP:
+            x, y, heading, length, width = stack.pop()
+        elif role == SCALE_LENGTH:
+            length *= system.length_ratio
+        elif role == SCALE_WIDTH:
+            width *= system.width_ratio
+    rows.sort(key=lambda row: row[:2])
+    return np.array([row[2] for row in rows]).reshape(-1, len(SEGMENT_FIELDS))
+
+
+def assert_same_segments(segments, expected):
+    assert segments.shape == expected.shape
+    # Headings may differ by whole turns
+    turns = (segments[:, ANGLE] - expected[:, ANGLE]) / 360
+    assert np.allclose(turns, np.round(turns))
+    columns = [column for column in range(len(SEGMENT_FIELDS)) if column != ANGLE]
+    assert np.allclose(segments[:, columns], expected[:, columns], atol=1e-6)
+
+
+SYSTEMS = {
+    "koch": ("F", {"F": "F+F--F+F"}, dict(angle=60)),
+    "dragon": ("FX", {"X": "X+YF+", "Y": "-FX-Y"}, dict(angle=90)),
+    "plant": ("X", {"X": 'F+[[X]-X]-F[-FX]+X', "F": "FF"}, dict(angle=25)),
+    "scaled": ("F", {"F": 'F[+"!F]f[-"F]F'}, dict(angle=30, length_ratio=0.6, width_ratio=0.5)),
+}
+
+
+@pytest.mark.parametrize("name", SYSTEMS)
+@pytest.mark.parametrize("n_iters", [0, 1, 4])
+def test_expand_and_turtle_match_references(name, n_iters):
+    axiom, rules, options = SYSTEMS[name]
+    system = LSystem(axiom, rules, **options)
+    tokens = system.expand(n_iters)
+    string = reference_expand(axiom, rules, n_iters)
+    assert system.to_string(tokens) == string
+    assert_same_segments(turtle_segments(system, tokens, 5, 7, -90, 4, 3),
+                         reference_turtle(system, string, 5, 7, -90, 4, 3))
+
+
+@pytest.mark.parametrize("preset, n_iters, n_segments",
+                         [("koch", 5, 4 ** 5), ("dragon", 10, 2 ** 10), ("hilbert", 5, 4 ** 5 - 1)])
+def test_preset_sizes(preset, n_iters, n_segments):
+    assert len(lsystem_segments(PRESETS[preset], n_iters)) == n_segments
+
+
+@pytest.mark.parametrize("params", [
+    dict(n_iters=2),
+    dict(n_iters=8, angle_delta=60),
+    dict(n_iters=6, n_splits=3, angle_delta=40, off_angle=12, length_ratio=0.6, width_ratio=0.5),
+    dict(n_iters=5, n_splits=1, off_angle=-20, start_angle=30),
+])
+def test_canopy_lsystem_matches_canopy_segments(params):
+    growth = {name: value for name, value in params.items()
+              if name in ("off_angle", "angle_delta", "n_splits", "length_ratio", "width_ratio")}
+    segments = lsystem_segments(canopy_lsystem(**growth), params["n_iters"] - 2, 300, 500,
+                                params.get("start_angle", -90), 120, 6)
+    expected = canopy_segments(300, 500, init_length=120, width=6, **params)
+    assert_same_segments(segments, expected)
+    assert np.array_equal(segments[:, DEPTH], expected[:, DEPTH])
+
+
+def test_unbalanced_brackets():
+    system = LSystem("F]F[", {})
+    with pytest.raises(ValueError):
+        turtle_segments(system, system.expand(0))
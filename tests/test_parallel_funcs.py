@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+from fractal_funcs import canopy_segments
+import parallel_funcs
+from parallel_funcs import parallel_canopy_segments
+
+PARAMS = dict(off_angle=7, angle_delta=40, n_splits=3, n_iters=9, length_ratio=0.7, width=5)
+
+
+@pytest.mark.parametrize("params", [PARAMS, dict(PARAMS, angle_jitter=15, length_jitter=0.2, seed=11)])
+@pytest.mark.parametrize("split_depth", [0, 3])
+def test_pool_output_matches_serial(params, split_depth):
+    segments = parallel_canopy_segments(100, 400, **params, split_depth=split_depth, max_workers=2, min_rows=0)
+    assert np.array_equal(segments, canopy_segments(100, 400, **params))
+
+
+@pytest.mark.parametrize("params, options", [
+    (dict(PARAMS, branch_drop=0.2, seed=3), dict(max_workers=2, min_rows=0)),
+    (PARAMS, dict(max_workers=2, min_rows=10 ** 6)),
+    (PARAMS, dict(max_workers=1, min_rows=0)),
+    (dict(PARAMS, n_iters=6.5), dict(max_workers=2, min_rows=0)),
+])
+def test_serial_fallback(monkeypatch, params, options):
+    def no_pool(*args, **kwargs):
+        raise AssertionError("the pool was started")
+
+    monkeypatch.setattr(parallel_funcs, "ProcessPoolExecutor", no_pool)
+    segments = parallel_canopy_segments(100, 400, **params, **options)
+    assert np.array_equal(segments, canopy_segments(100, 400, **params))
@@ -0,0 +1,85 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+import profile_funcs
+from canvas_funcs import RecordingCanvas
+from fractal_funcs import fractal_canopy
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(autouse=True)
+def instrumentation():
+    enabled = profile_funcs.is_enabled()
+    profile_funcs.enable(False)
+    profile_funcs.reset()
+    yield
+    profile_funcs.reset()
+    profile_funcs.enable(enabled)
+
+
+def test_disabled_instrumentation_records_nothing():
+    calls = []
+
+    @profile_funcs.timed()
+    def work(value):
+        calls.append(value)
+        return value * 2
+
+    assert profile_funcs.phase("a") is profile_funcs.phase("b")
+    with profile_funcs.phase("a"):
+        profile_funcs.count("things", 5)
+    assert work(21) == 42 and calls == [21]
+    fractal_canopy(RecordingCanvas(record=False), 400, 500, n_iters=8)
+    assert profile_funcs.stats() == {"phases": {}, "counters": {}}
+    assert profile_funcs.trace_events() == []
+
+
+def test_enabled_instrumentation_records_phases_and_counters():
+    profile_funcs.enable()
+    fractal_canopy(RecordingCanvas(record=False), 400, 500, n_iters=8)
+    stats = profile_funcs.stats()
+    assert stats["counters"]["branches_generated"] == stats["counters"]["items_created"] == 127
+    for name in ("grow_canopy", "segment_coordinates", "create_items"):
+        timing = stats["phases"][name]
+        assert timing["count"] >= 1 and 0 <= timing["max_ms"] <= timing["total_ms"]
+    profile_funcs.reset()
+    assert profile_funcs.stats() == {"phases": {}, "counters": {}}
+
+
+def test_trace_is_valid_chrome_trace_json(tmp_path):
+    profile_funcs.enable()
+    with profile_funcs.phase("outer"):
+        with profile_funcs.phase("inner"):
+            profile_funcs.count("ticks", 2)
+    thread = threading.Thread(target=lambda: profile_funcs.phase("worker").__enter__().__exit__())
+    thread.start()
+    thread.join()
+    path = tmp_path / "trace.json"
+    profile_funcs.save_trace(str(path))
+    trace = json.loads(path.read_text())
+    events = trace["traceEvents"]
+    assert trace["displayTimeUnit"] == "ms" and trace["otherData"] == profile_funcs.stats()
+    assert {event["ph"] for event in events} == {"X", "C"}
+    for event in events:
+        assert {"name", "ph", "ts", "pid", "tid"} <= set(event)
+        assert event["dur"] >= 0 if event["ph"] == "X" else event["args"] == {"ticks": 2}
+    spans = {event["name"]: event for event in events if event["ph"] == "X"}
+    outer, inner = spans["outer"], spans["inner"]
+    assert outer["ts"] <= inner["ts"] and inner["ts"] + inner["dur"] <= outer["ts"] + outer["dur"]
+    assert spans["worker"]["tid"] != outer["tid"]
+
+
+def test_environment_variable_saves_a_trace_at_exit(tmp_path):
+    path = tmp_path / "run.json"
+    script = "from canvas_funcs import RecordingCanvas; from fractal_funcs import fractal_canopy; " \
+             "fractal_canopy(RecordingCanvas(), 400, 500, n_iters=6)"
+    subprocess.run([sys.executable, "-c", script], cwd=ROOT, check=True,
+                   env={**os.environ, profile_funcs.PROFILE_ENV: str(path)})
+    trace = json.loads(path.read_text())
+    assert trace["otherData"]["counters"]["items_created"] == 31
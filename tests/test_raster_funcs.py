@@ -0,0 +1,39 @@
+import time
+
+import numpy as np
+
+from raster_funcs import rasterize_lines
+from spatial_funcs import point_segment_distances
+
+COLORS = np.array([[255, 0, 0, 255], [0, 255, 0, 255], [0, 0, 255, 255]], dtype=np.uint8)
+
+
+def test_long_segments_cover_the_image_where_they_cross_it():
+    # At a deep zoom a branch can be millions of pixels long, with a few of them in view
+    start = time.perf_counter()
+    image = rasterize_lines([-1e7, 50.0], [40.0, -1e7], [1e7, 50.0], [40.0, 1e7], [3.0, 3.0], COLORS[:2], 100, 80)
+    assert time.perf_counter() - start < 1.0
+    expected = np.zeros((80, 100, 4), dtype=np.uint8)
+    expected[39:42, :] = COLORS[0]
+    expected[:, 49:52] = COLORS[1]
+    assert np.array_equal(image, expected)
+
+
+def test_clipped_segments_keep_their_width_at_the_border():
+    lines = np.array([[-500.0, -300.0, 700.0, 420.0, 7.0], [-2.0, -2.0, 250.0, -2.0, 4.0]])
+    image = rasterize_lines(*lines.T, COLORS[:2], 200, 100)
+    y, x = np.mgrid[:100, :200]
+    covered = np.zeros((100, 200), dtype=bool)
+    for row in lines:
+        distances = np.array([point_segment_distances(px, py, row[np.newaxis, :4])[0]
+                              for px, py in zip(x.ravel(), y.ravel())]).reshape(100, 200)
+        covered |= distances <= row[4] / 2 - 1
+    assert (image[..., 3][covered] == 255).all()
+    # The line just above the image still paints its lower edge into the first row
+    assert (image[0, :, 3] == 255).all()
+
+
+def test_segments_outside_the_image_draw_nothing():
+    image = rasterize_lines([-1e7, -20.0], [-10.0, -20.0], [1e7, -10.0], [-10.0, -30.0], [3.0, 9.0],
+                            COLORS[:2], 100, 80)
+    assert not image.any()
@@ -0,0 +1,71 @@
+import numpy as np
+
+from cache_funcs import CanopyCache
+from canvas_funcs import RecordingCanvas
+from gui.canopy_view import CanopyView
+from gui.redraw import CanopyRedraw
+
+PARAMS = dict(x=400, y=590, off_angle=5, angle_delta=40, n_iters=10, length_ratio=0.75, init_length=120,
+              width=6, color="#204010")
+
+
+def make_redraw(params):
+    calls = []
+
+    def read_params():
+        calls.append(dict(params))
+        return dict(params)
+
+    canvas = RecordingCanvas(800, 600)
+    redraw = CanopyRedraw(CanopyView(canvas, min_pixels=0.5), read_params, cache=CanopyCache())
+    return redraw, canvas, calls
+
+
+def test_changes_are_debounced_into_one_rebuild():
+    params = dict(PARAMS)
+    redraw, canvas, calls = make_redraw(params)
+    for angle in range(10, 60, 10):
+        params["angle_delta"] = angle
+        redraw.schedule()
+    canvas.flush()
+    assert len(calls) == 1 and calls[0]["angle_delta"] == 50
+    assert np.array_equal(redraw.view.segments, redraw.cache.segments(**{**PARAMS, "angle_delta": 50}))
+    assert redraw.worker.done and not redraw.view.building
+
+
+def test_newer_rebuild_cancels_the_one_in_progress():
+    params = dict(PARAMS)
+    redraw, canvas, _ = make_redraw(params)
+    redraw.start()
+    assert redraw.view.building
+    params.update(angle_delta=70, off_angle=-10)
+    redraw.start()
+    canvas.flush()
+    expected = redraw.cache.segments(**params)
+    assert np.array_equal(redraw.view.segments, expected)
+    assert len(canvas.find_all()) == len(expected)
+    assert not redraw.view.building
+
+    redraw.start()
+    redraw.cancel()
+    canvas.flush()
+    assert not redraw.view.building and redraw.worker.done
+
+
+def test_color_change_reuses_the_geometry_and_items(monkeypatch):
+    params = dict(PARAMS)
+    redraw, canvas, _ = make_redraw(params)
+    redraw.start()
+    canvas.flush()
+    items, segments = canvas.find_all(), redraw.view.segments
+    created = canvas.call_count("create_line")
+    submitted = []
+    monkeypatch.setattr(redraw.worker, "submit", lambda *args: submitted.append(args))
+
+    params["color"] = "#a02020"
+    redraw.schedule()
+    canvas.flush()
+    assert submitted == []
+    assert redraw.view.segments is segments
+    assert canvas.find_all() == items and canvas.call_count("create_line") == created
+    assert {canvas.itemcget(item, "fill") for item in items} == {"#a02020"}
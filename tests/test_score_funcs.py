@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from fractal_funcs import canopy_segments
+from score_funcs import (canopy_descriptors, canopy_similarity, descriptor_similarity, parameter_similarity,
+                         DESCRIPTOR_SIZE)
+
+TARGET = dict(off_angle=10, angle_delta=60, n_splits=3, length_ratio=0.7, width_ratio=0.6)
+
+
+def table(**params):
+    return canopy_segments(300, 500, **{**TARGET, **params}, n_iters=8, init_length=100)
+
+
+def test_identical_canopy_scores_one():
+    target = table()
+    assert canopy_similarity(target.copy(), target) == pytest.approx(1.0)
+    assert parameter_similarity(dict(TARGET), TARGET) == pytest.approx(1.0)
+    # Where and how large the canopy is drawn does not matter by default
+    moved = canopy_segments(50, 90, **TARGET, n_iters=8, init_length=40)
+    assert canopy_similarity(moved, target) == pytest.approx(1.0)
+
+
+def test_perturbed_canopies_score_lower_the_further_they_are():
+    target = table()
+    scores = canopy_similarity([table(off_angle=10 + delta) for delta in (2, 10, 30)], target)
+    assert (scores < 1).all()
+    assert (np.diff(scores) < 0).all()
+    parameter_scores = parameter_similarity([dict(TARGET, off_angle=10 + delta) for delta in (2, 10, 30)], TARGET)
+    assert (parameter_scores < 1).all() and (np.diff(parameter_scores) < 0).all()
+
+
+def test_batch_scores_match_single_scores():
+    target = table()
+    candidates = [table(angle_delta=angle) for angle in (30, 60, 90)] + [table(n_splits=2)]
+    descriptors = canopy_descriptors(candidates + [target])
+    assert descriptors.shape == (5, DESCRIPTOR_SIZE)
+    batch = descriptor_similarity(descriptors[:-1], descriptors[-1])
+    assert np.allclose(batch, [canopy_similarity(candidate, target) for candidate in candidates])
+    assert ((batch >= 0) & (batch <= 1)).all()
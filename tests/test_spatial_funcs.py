@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from fractal_funcs import canopy_segments, X0, Y0, X1, Y1, LENGTH
+from spatial_funcs import SegmentGrid, point_segment_distances
+
+
+@pytest.fixture(scope="module")
+def segments() -> np.ndarray:
+    return canopy_segments(400, 550, off_angle=20, angle_delta=35, n_iters=11, length_ratio=0.72,
+                           init_length=130, width=4)
+
+
+def brute_nearest(segments, x, y, margin, max_distance, mask):
+    distances = np.maximum(point_segment_distances(x, y, segments[:, [X0, Y0, X1, Y1]]) - margin, 0)
+    distances[~mask] = np.inf
+    best = int(distances.argmin())
+    return (best, distances[best]) if distances[best] <= max_distance else (-1, np.inf)
+
+
+@pytest.mark.parametrize("margin", [0.0, 3.0])
+def test_nearest_matches_brute_force(segments, margin):
+    grid = SegmentGrid.from_segments(segments, margin=margin)
+    rng = np.random.default_rng(1)
+    mask = rng.random(len(segments)) > 0.3
+    for x, y in rng.uniform((100, 100), (700, 560), (300, 2)):
+        for branch_mask in (np.ones(len(segments), dtype=bool), mask):
+            for max_distance in (5.0, None):
+                index, distance = grid.nearest(x, y, max_distance,
+                                               None if branch_mask.all() else branch_mask)
+                expected, expected_distance = brute_nearest(segments, x, y, margin,
+                                                             np.inf if max_distance is None else max_distance,
+                                                             branch_mask)
+                assert distance == pytest.approx(expected_distance)
+                assert (index >= 0) == (expected >= 0)
+
+
+def test_nearest_far_outside_the_grid(segments):
+    grid = SegmentGrid.from_segments(segments)
+    index, distance = grid.nearest(-5000, 9000)
+    expected, expected_distance = brute_nearest(segments, -5000, 9000, 0, np.inf,
+                                                np.ones(len(segments), dtype=bool))
+    assert (index, distance) == (expected, pytest.approx(expected_distance))
+    assert grid.nearest(-5000, 9000, 10) == (-1, np.inf)
+
+
+def test_query_rect_finds_every_overlapping_branch(segments):
+    grid = SegmentGrid.from_segments(segments, margin=1.0)
+    rng = np.random.default_rng(2)
+    samples = np.linspace(0, 1, 50)[:, np.newaxis]
+    points_x = segments[:, X0] + samples * (segments[:, X1] - segments[:, X0])
+    points_y = segments[:, Y0] + samples * (segments[:, Y1] - segments[:, Y0])
+    for x_min, y_min in rng.uniform((100, 100), (700, 560), (50, 2)):
+        x_max, y_max = x_min + rng.uniform(0, 80), y_min + rng.uniform(0, 80)
+        found = grid.query_rect(x_min, y_min, x_max, y_max)
+        assert (np.diff(found) > 0).all()
+        # Branches with a point inside the rectangle must be found
+        inside = ((points_x >= x_min) & (points_x <= x_max) & (points_y >= y_min) & (points_y <= y_max)).any(axis=0)
+        assert set(np.flatnonzero(inside).tolist()) <= set(found.tolist())
+        # and branches found must come within their margin of it
+        for index in found.tolist():
+            dx = np.maximum(np.maximum(x_min - points_x[:, index], points_x[:, index] - x_max), 0)
+            dy = np.maximum(np.maximum(y_min - points_y[:, index], points_y[:, index] - y_max), 0)
+            assert np.hypot(dx, dy).min() <= 1.0 + segments[index, LENGTH] / 49 + 1e-9
@@ -0,0 +1,112 @@
+import os
+
+import numpy as np
+import pytest
+
+from fractal_funcs import canopy_segments, rasterize_canopy_segments
+import store_funcs
+from store_funcs import (GeometryPack, GeometryStore, StoredCanopy, params_key, write_pack,
+                         ALIGNMENT, PACK_EXTENSION)
+
+PARAMS = dict(x=400.0, y=550.0, angle_delta=30, length_ratio=0.7, n_iters=9)
+
+
+def canopy(n_iters: int, **params) -> StoredCanopy:
+    params = {**PARAMS, **params, "n_iters": n_iters}
+    segments = canopy_segments(**params)
+    arrays = {"segments": segments,
+              "preview": rasterize_canopy_segments(segments, n_iters, 64, 48),
+              "descriptor": np.arange(7, dtype=np.float32)}
+    return StoredCanopy(params, arrays, {"name": f"tree {n_iters}"})
+
+
+def test_pack_round_trip(tmp_path):
+    canopies = [canopy(n_iters) for n_iters in (2, 5, 9)] + [canopy(6, angle_delta=80)]
+    path = str(tmp_path / ("trees" + PACK_EXTENSION))
+    assert write_pack(path, iter(canopies)) == len(canopies)
+    pack = GeometryPack(path)
+    assert len(pack) == len(canopies)
+    assert pack.keys() == [written.key for written in canopies]
+    for written, read in zip(canopies, pack):
+        assert read.key in pack
+        assert read.info == written.info
+        assert read.params == pytest.approx(written.params)
+        assert set(read.arrays) == set(written.arrays)
+        for name, array in written.arrays.items():
+            assert read.arrays[name].dtype == array.dtype
+            assert np.array_equal(read.arrays[name], array)
+            assert not read.arrays[name].flags.writeable
+        assert pack.get(written.key).segments.shape == written.segments.shape
+    assert pack.get("0" * 32) is None
+
+
+def test_arrays_are_aligned_and_mappable(tmp_path):
+    path = str(tmp_path / "one.pack")
+    written = canopy(7)
+    write_pack(path, [written])
+    read = GeometryPack(path)[0]
+    mapped = read.segments
+    offset = mapped.ctypes.data - read.arrays["preview"].ctypes.data
+    assert offset % ALIGNMENT == 0
+    assert np.array_equal(mapped, written.segments)
+
+
+def test_object_arrays_are_refused(tmp_path):
+    path = str(tmp_path / "bad.pack")
+    with pytest.raises(TypeError):
+        write_pack(path, [StoredCanopy(PARAMS, {"segments": np.array(["a", None], dtype=object)})])
+    assert os.listdir(tmp_path) == []
+
+
+def test_params_key_is_normalized():
+    assert params_key({"a": 1, "b": [1.0, 2]}) == params_key({"b": (np.float64(1), np.int64(2)), "a": np.int32(1)})
+    assert params_key({"a": 1}) != params_key({"a": 2})
+
+
+def test_store_round_trip(tmp_path):
+    store = GeometryStore(str(tmp_path / "store"))
+    assert store.get(PARAMS) is None and store.last() is None
+    written = canopy(8)
+    stored = store.put(written.params, written.arrays, written.info)
+    assert stored.key == written.key
+    assert np.array_equal(store.get(written.params).segments, written.segments)
+    store.remember(stored.key)
+    assert store.last().key == stored.key
+    # Putting the same canopy again keeps the pack, rather than writing a new file over it
+    inode = os.stat(store.path(stored.key)).st_ino
+    store.put(written.params, written.arrays, written.info)
+    assert os.stat(store.path(stored.key)).st_ino == inode
+
+
+def test_unreadable_pack_counts_as_missing(tmp_path):
+    store = GeometryStore(str(tmp_path))
+    written = canopy(4)
+    with open(store.path(written.key), "wb") as file:
+        file.write(b"not a pack")
+    assert store.get(written.params) is None
+
+
+def test_prune_keeps_the_last_scene(tmp_path):
+    store = GeometryStore(str(tmp_path), max_bytes=0)
+    stored = [store.put(written.params, written.arrays) for written in (canopy(n) for n in (6, 7, 8))]
+    store.remember(stored[0].key)
+    assert store.prune() == 2
+    assert store.last().key == stored[0].key
+    assert sorted(os.listdir(tmp_path)) == sorted(["LAST", stored[0].key + PACK_EXTENSION])
+
+
+def test_loaded_canopies_stay_open(tmp_path, monkeypatch):
+    store = GeometryStore(str(tmp_path))
+    written = canopy(8)
+    store.put(written.params, written.arrays, {"slider": 1})
+    opened = []
+    pack = store_funcs.GeometryPack
+    monkeypatch.setattr(store_funcs, "GeometryPack", lambda path: opened.append(path) or pack(path))
+    first = store.get(written.params)
+    assert store.get(written.params) is first and opened == []
+    # A new version of the canopy, and a pruned one, are not served from the open ones
+    store.put(written.params, written.arrays, {"slider": 2})
+    assert store.get(written.params).info == {"slider": 2}
+    store.max_bytes = 0
+    assert store.prune() == 1
+    assert store.get(written.params) is None
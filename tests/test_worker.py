@@ -0,0 +1,81 @@
+import threading
+import time
+
+import numpy as np
+
+from cache_funcs import CanopyCache
+from gui.worker import GeometryWorker
+
+GEOMETRY = dict(x=0.0, y=0.0, angle_delta=30, n_splits=3, length_ratio=0.7)
+
+
+def drain(worker, timeout=10.0):
+    batches = []
+    deadline = time.monotonic() + timeout
+    while not worker.done and time.monotonic() < deadline:
+        batch = worker.poll()
+        if batch is None:
+            time.sleep(0.001)
+        else:
+            batches.append(batch)
+    assert worker.done
+    return batches
+
+
+class GatedCache(CanopyCache):
+    """A cache whose tables of a given angle wait until the gate is opened."""
+
+    def __init__(self, angle_delta):
+        super().__init__()
+        self.angle_delta = angle_delta
+        self.gate = threading.Event()
+        self.waiting = threading.Event()
+
+    def segments(self, n_iters=3, **params):
+        if n_iters > 2 and params.get("angle_delta") == self.angle_delta:
+            self.waiting.set()
+            self.gate.wait(10)
+        return super().segments(n_iters=n_iters, **params)
+
+
+def test_batches_arrive_in_order():
+    cache = CanopyCache()
+    worker = GeometryWorker(cache, batch_rows=500)
+    worker.submit(GEOMETRY, 2, 9)
+    batches = drain(worker)
+    table = cache.segments(n_iters=9, **GEOMETRY)
+    sizes = [len(batch) for batch in batches]
+    assert sizes == sorted(set(sizes)) and sizes[-1] == len(table)
+    assert max(np.diff([1] + sizes)) <= 500
+    for batch in batches:
+        assert np.array_equal(batch, table[:len(batch)])
+
+
+def test_cancelled_job_puts_nothing():
+    cache = GatedCache(angle_delta=GEOMETRY["angle_delta"])
+    worker = GeometryWorker(cache, batch_rows=100)
+    before = set(threading.enumerate())
+    worker.submit(GEOMETRY, 2, 8)
+    (stale,) = set(threading.enumerate()) - before
+    assert cache.waiting.wait(10)
+
+    other = dict(GEOMETRY, angle_delta=60)
+    worker.submit(other, 2, 6)
+    batches = drain(worker)
+    assert np.array_equal(batches[-1], cache.segments(n_iters=6, **other))
+    # The first job resumes, notices that it was cancelled and stops without putting anything
+    cache.gate.set()
+    stale.join(10)
+    assert not stale.is_alive()
+    assert worker._queue.empty()
+
+
+def test_poll_drops_stale_batches():
+    cache = CanopyCache()
+    worker = GeometryWorker(cache)
+    worker.submit(GEOMETRY, 2, 4)
+    # A batch of an earlier job, put just before it was cancelled
+    worker._queue.put((worker._job - 1, np.zeros((1, 9))))
+    batches = drain(worker)
+    assert all(np.array_equal(batch, cache.segments(n_iters=4, **GEOMETRY)[:len(batch)]) for batch in batches)
+    assert len(batches[-1]) == len(cache.segments(n_iters=4, **GEOMETRY))
@@ -0,0 +1,48 @@
+from types import SimpleNamespace
+
+from canvas_funcs import RecordingCanvas
+from gui import zoom
+from gui.zoom import add_view_listener, bind_canvas_zoom_events, get_view_transform
+
+
+def wheel(canvas, delta=120, x=400, y=300):
+    canvas.bindings["<MouseWheel>"][-1](SimpleNamespace(widget=canvas, x=x, y=y, delta=delta))
+
+
+def test_zoom_events_are_folded_into_one_redraw():
+    canvas = RecordingCanvas()
+    bind_canvas_zoom_events(canvas)
+    redraws = []
+    add_view_listener(canvas, redraws.append)
+    for _ in range(3):
+        wheel(canvas)
+    canvas.flush()
+    assert redraws == [canvas]
+    scale, offset_x, offset_y = get_view_transform(canvas)
+    assert abs(scale - 1.1 ** 3) < 1e-12
+    assert abs(400 * scale + offset_x - 400) < 1e-9 and abs(300 * scale + offset_y - 300) < 1e-9
+    canvas.destroy()
+
+
+def test_destroyed_canvas_state_is_dropped():
+    canvas = RecordingCanvas()
+    bind_canvas_zoom_events(canvas)
+    redraws = []
+    add_view_listener(canvas, redraws.append)
+    wheel(canvas)
+    assert canvas in zoom._pending_redraws
+    for callback in canvas.bindings["<Destroy>"]:
+        callback(SimpleNamespace(widget=canvas))
+    for state in (zoom._view_transforms, zoom._pending_zooms, zoom._pending_redraws, zoom._view_listeners):
+        assert canvas not in state
+    # The redraw scheduled before the canvas was destroyed does not run
+    canvas.flush()
+    assert redraws == []
+    assert get_view_transform(canvas) == (1.0, 0.0, 0.0)
+
+
+def test_listener_only_canvas_is_dropped():
+    canvas = RecordingCanvas()
+    add_view_listener(canvas, lambda canvas: None)
+    canvas.destroy()
+    assert canvas not in zoom._view_listeners